@@ -2,6 +2,7 @@ import { NextResponse } from 'next/server'
 import { spawn } from 'child_process'
 import path from 'path'
 import { writeFile, readFile, unlink, mkdir } from 'fs/promises'
+import { callPythonWorker } from '../../utils/pythonWorker'
 
 export async function POST(request: Request) {
   try {
@@ -12,6 +13,11 @@ export async function POST(request: Request) {
       return NextResponse.json({ error: 'No file provided' }, { status: 400 })
     }
 
+    // Optional export filters
+    const bbox = data.get('bbox') as string | null
+    const stride = data.get('stride') as string | null
+    const skipNodata = data.get('skipNodata') === 'true'
+
     // Create tmp directory if it doesn't exist
     const tmpDir = path.join(process.cwd(), 'tmp')
     await mkdir(tmpDir, { recursive: true })
@@ -25,6 +31,41 @@ export async function POST(request: Request) {
     const buffer = Buffer.from(bytes)
     await writeFile(tempInputPath, buffer)
 
+    const csvResponse = async () => {
+      const csvContent = await readFile(tempOutputPath, 'utf-8')
+      
+      // Cleanup temp files
+      await Promise.all([
+        unlink(tempInputPath).catch(console.error),
+        unlink(tempOutputPath).catch(console.error)
+      ])
+
+      return new NextResponse(csvContent, {
+        headers: {
+          'Content-Type': 'text/csv',
+          'Content-Disposition': `attachment; filename="${file.name.split('.')[0]}.csv"`,
+        },
+      })
+    }
+
+    // Prefer the warm worker; fall back to spawning the script if it is not running
+    const workerResponse = await callPythonWorker('tiff_csv', {
+      input_path: tempInputPath,
+      output_path: tempOutputPath,
+      bbox: bbox || undefined,
+      stride: stride ? parseInt(stride, 10) : 1,
+      skip_nodata: skipNodata
+    })
+    if (workerResponse) {
+      if (workerResponse.status !== 200) {
+        return NextResponse.json(
+          { error: `Conversion failed: ${workerResponse.data.error}` },
+          { status: 500 }
+        )
+      }
+      return csvResponse()
+    }
+
     // Execute Python script with proper path handling
     const scriptPath = path.join(process.cwd(), 'app', 'scripts', 'tiff_csv.py')
     
@@ -32,7 +73,12 @@ export async function POST(request: Request) {
       let pythonOutput = ''
       let pythonError = ''
 
-      const python = spawn('python', [scriptPath, tempInputPath, tempOutputPath])
+      const args = [scriptPath, tempInputPath, tempOutputPath]
+      if (bbox) args.push('--bbox', bbox)
+      if (stride) args.push('--stride', stride)
+      if (skipNodata) args.push('--skip-nodata')
+
+      const python = spawn('python', args)
 
       python.stdout.on('data', (data) => {
         pythonOutput += data.toString()
@@ -55,20 +101,7 @@ export async function POST(request: Request) {
         }
 
         try {
-          const csvContent = await readFile(tempOutputPath, 'utf-8')
-          
-          // Cleanup temp files
-          await Promise.all([
-            unlink(tempInputPath).catch(console.error),
-            unlink(tempOutputPath).catch(console.error)
-          ])
-
-          resolve(new NextResponse(csvContent, {
-            headers: {
-              'Content-Type': 'text/csv',
-              'Content-Disposition': `attachment; filename="${file.name.split('.')[0]}.csv"`,
-            },
-          }))
+          resolve(await csvResponse())
         } catch (error) {
           console.error('Error reading CSV:', error)
           resolve(NextResponse.json(
@@ -2,10 +2,14 @@ import { NextResponse } from 'next/server';
 import { spawn } from 'child_process';
 import path from 'path';
 import fs from 'fs';
+import os from 'os';
+import { randomUUID } from 'crypto';
+import { Readable } from 'stream';
+import { callPythonWorker } from '../../utils/pythonWorker';
 
 export async function POST(req: Request) {
   try {
-    const { bbox } = await req.json();
+    const { bbox, bands, resolution, cog, regions } = await req.json();
 
     // Find the latest downloaded TIFF file in the Downloads directory
     const downloadsDir = path.join(process.env.HOME || process.env.USERPROFILE, 'Downloads');
@@ -22,13 +26,36 @@ export async function POST(req: Request) {
 
     const tifFilePath = path.join(downloadsDir, latestTiffFile);
 
-    // Create a process to run the Python script
-    const pythonProcess = spawn('python', [
-      'download_region.py',
-      '--input', tifFilePath,
-      '--output', 'selected_region.tif',
-      '--bbox', bbox.join(',')
-    ]);
+    if (Array.isArray(regions)) {
+      return downloadRegions(tifFilePath, regions, bands);
+    }
+
+    // One output file per request so concurrent downloads do not overwrite each other
+    const outputPath = path.join(os.tmpdir(), `selected_region_${randomUUID()}.tif`);
+
+    // Prefer the warm worker; fall back to spawning the script if it is not running
+    const workerResponse = await callPythonWorker('download_region', {
+      input_path: tifFilePath,
+      output_path: outputPath,
+      bbox,
+      bands,
+      resolution,
+      cog
+    });
+    if (workerResponse) {
+      if (workerResponse.status !== 200) {
+        console.error('Python worker error:', workerResponse.data.error);
+        return new NextResponse('Failed to process region', { status: 500 });
+      }
+      return regionResponse(outputPath);
+    }
+
+    // Create a process to run the Python script with the same options the worker gets
+    const args = ['download_region.py', '--input', tifFilePath, '--output', outputPath, '--bbox', bbox.join(',')];
+    if (bands) args.push('--bands', bands.join(','));
+    if (resolution) args.push('--resolution', String(resolution));
+    if (cog) args.push('--cog');
+    const pythonProcess = spawn('python', args);
 
     return new Promise((resolve, reject) => {
       pythonProcess.on('close', (code) => {
@@ -38,14 +65,8 @@ export async function POST(req: Request) {
           return;
         }
 
-        // Read the generated file and send it as response
-        const filePath = path.join(process.cwd(), 'selected_region.tif');
-        resolve(new NextResponse(filePath, {
-          headers: {
-            'Content-Type': 'image/tiff',
-            'Content-Disposition': 'attachment; filename=selected_region.tif'
-          }
-        }));
+        // Stream the generated file as the response
+        resolve(regionResponse(outputPath));
       });
 
       pythonProcess.stdout.on('data', (data) => {
@@ -61,3 +82,70 @@ export async function POST(req: Request) {
     return new NextResponse('Internal Server Error', { status: 500 });
   }
 }
+
+// Stream the extracted region and delete it once it has been sent
+function regionResponse(outputPath: string) {
+  const { size } = fs.statSync(outputPath);
+  const stream = fs.createReadStream(outputPath);
+  stream.on('close', () => fs.unlink(outputPath, () => {}));
+  return new NextResponse(Readable.toWeb(stream) as ReadableStream, {
+    headers: {
+      'Content-Type': 'image/tiff',
+      'Content-Length': String(size),
+      'Content-Disposition': 'attachment; filename=selected_region.tif'
+    }
+  });
+}
+
+// Extract many named regions from the source in one pass and return them as a ZIP
+async function downloadRegions(tifFilePath: string, regions: object[], bands?: number[]) {
+  const requestId = randomUUID();
+  const zipPath = path.join(os.tmpdir(), `selected_regions_${requestId}.zip`);
+  const zipResponse = () => {
+    const zipData = fs.readFileSync(zipPath);
+    fs.unlinkSync(zipPath);
+    return new NextResponse(zipData, {
+      headers: {
+        'Content-Type': 'application/zip',
+        'Content-Length': String(zipData.length),
+        'Content-Disposition': 'attachment; filename=selected_regions.zip'
+      }
+    });
+  };
+
+  const workerResponse = await callPythonWorker('download_regions', {
+    input_path: tifFilePath,
+    output_path: zipPath,
+    regions,
+    bands
+  });
+  if (workerResponse) {
+    if (workerResponse.status !== 200) {
+      console.error('Python worker error:', workerResponse.data.error);
+      return new NextResponse('Failed to process regions', { status: 500 });
+    }
+    return zipResponse();
+  }
+
+  const regionsPath = path.join(os.tmpdir(), `regions_${requestId}.json`);
+  fs.writeFileSync(regionsPath, JSON.stringify(regions));
+  const args = ['download_region.py', '--input', tifFilePath, '--output', zipPath, '--regions', regionsPath];
+  if (bands) args.push('--bands', bands.join(','));
+
+  return new Promise<NextResponse>((resolve) => {
+    const pythonProcess = spawn('python', args);
+
+    pythonProcess.stderr.on('data', (data) => {
+      console.error(`Python script error: ${data}`);
+    });
+
+    pythonProcess.on('close', (code) => {
+      fs.unlinkSync(regionsPath);
+      if (code !== 0) {
+        resolve(new NextResponse('Failed to process regions', { status: 500 }));
+        return;
+      }
+      resolve(zipResponse());
+    });
+  });
+}
@@ -2,13 +2,37 @@ import { NextRequest, NextResponse } from 'next/server';
 import { spawn } from 'child_process';
 import path from 'path';
 import fs from 'fs';
+import { Readable } from 'stream';
 import { mkdir } from 'fs/promises';
+import { callPythonWorker } from '../../utils/pythonWorker';
+
+function removeFile(filePath: string) {
+  try {
+    fs.unlinkSync(filePath);
+  } catch (err) {
+    console.error('Error cleaning up temp file:', err);
+  }
+}
+
+// Streams a rendered PNG to the client and deletes it once sent
+function pngResponse(pngPath: string): Response {
+  const size = fs.statSync(pngPath).size;
+  const stream = fs.createReadStream(pngPath);
+  stream.on('close', () => removeFile(pngPath));
+  return new Response(Readable.toWeb(stream) as ReadableStream, {
+    headers: {
+      'Content-Type': 'image/png',
+      'Content-Length': String(size),
+      'Cache-Control': 'no-store'
+    }
+  });
+}
 
 export async function POST(req: NextRequest) {
   try {
     const formData = await req.formData();
     const file = formData.get('file') as File;
-    
+
     // Get all parameters
     const r_min = formData.get('r_min') as string;
     const r_max = formData.get('r_max') as string;
@@ -19,6 +43,8 @@ export async function POST(req: NextRequest) {
     const brightness = formData.get('brightness') as string;
     const contrast = formData.get('contrast') as string;
     const saturation = formData.get('saturation') as string;
+    // The PNG is returned as raw bytes; format=json keeps the old base64 data-URL response
+    const asJson = formData.get('format') === 'json';
 
     if (!file) {
       return NextResponse.json({ error: 'No file provided' }, { status: 400 });
@@ -31,11 +57,37 @@ export async function POST(req: NextRequest) {
     // Create a unique filename
     const timestamp = Date.now();
     const tempFilePath = path.join(tempDir, `${timestamp}_${file.name}`);
+    const pngPath = path.join(tempDir, `${timestamp}_${path.parse(file.name).name}.png`);
+
+    // Stream the upload to the temp file
+    await new Promise<void>((resolve, reject) => {
+      const out = fs.createWriteStream(tempFilePath);
+      Readable.fromWeb(file.stream() as any).pipe(out).on('finish', resolve).on('error', reject);
+    });
+
+    const params = {
+      input_path: tempFilePath,
+      r_min, r_max,
+      g_min, g_max,
+      b_min, b_max,
+      brightness: brightness || '0',
+      contrast: contrast || '0',
+      saturation: saturation || '0'
+    };
 
-    // Convert File to Buffer and write to temp file
-    const arrayBuffer = await file.arrayBuffer();
-    const buffer = Buffer.from(arrayBuffer);
-    fs.writeFileSync(tempFilePath, buffer);
+    // Prefer the warm worker; fall back to spawning the script if it is not running
+    const workerResponse = asJson
+      ? await callPythonWorker('process_rgb', params)
+      : await callPythonWorker('process_rgb_png', { ...params, output_path: pngPath });
+    if (workerResponse) {
+      removeFile(tempFilePath);
+      if (workerResponse.data.error) {
+        return NextResponse.json({
+          error: workerResponse.data.error
+        }, { status: workerResponse.status === 200 ? 400 : workerResponse.status });
+      }
+      return asJson ? NextResponse.json(workerResponse.data) : pngResponse(pngPath);
+    }
 
     return new Promise((resolve) => {
       const pythonProcess = spawn('python', [
@@ -46,7 +98,8 @@ export async function POST(req: NextRequest) {
         b_min, b_max,
         brightness || '0',
         contrast || '0',
-        saturation || '0'
+        saturation || '0',
+        ...(asJson ? [] : ['--output', pngPath])
       ]);
 
       let result = '';
@@ -62,49 +115,43 @@ export async function POST(req: NextRequest) {
 
       pythonProcess.on('close', (code) => {
         // Clean up temp file
+        removeFile(tempFilePath);
+
+        let pythonResponse: any;
         try {
-          fs.unlinkSync(tempFilePath);
+          pythonResponse = JSON.parse(result);
         } catch (err) {
-          console.error('Error cleaning up temp file:', err);
-        }
-
-        if (code !== 0) {
-          resolve(NextResponse.json({ 
-            error: error || 'Python process failed' 
+          resolve(NextResponse.json({
+            error: code !== 0 ? (error || 'Python process failed') : 'Invalid response from Python script'
           }, { status: 500 }));
           return;
         }
 
-        try {
-          const pythonResponse = JSON.parse(result);
-          if (pythonResponse.error) {
-            resolve(NextResponse.json({ 
-              error: pythonResponse.error 
-            }, { status: 400 }));
-            return;
-          }
-          resolve(NextResponse.json(pythonResponse));
-        } catch (err) {
-          resolve(NextResponse.json({ 
-            error: 'Invalid response from Python script' 
+        if (pythonResponse.error) {
+          resolve(NextResponse.json({
+            error: pythonResponse.error
+          }, { status: code !== 0 ? 500 : 400 }));
+          return;
+        }
+        if (code !== 0) {
+          resolve(NextResponse.json({
+            error: error || 'Python process failed'
           }, { status: 500 }));
+          return;
         }
+        resolve(asJson ? NextResponse.json(pythonResponse) : pngResponse(pngPath));
       });
 
       pythonProcess.on('error', (err) => {
-        try {
-          fs.unlinkSync(tempFilePath);
-        } catch (error) {
-          console.error('Error cleaning up temp file:', error);
-        }
-        resolve(NextResponse.json({ 
-          error: err.message 
+        removeFile(tempFilePath);
+        resolve(NextResponse.json({
+          error: err.message
         }, { status: 500 }));
       });
     });
   } catch (error: any) {
-    return NextResponse.json({ 
-      error: error.message || 'Internal server error' 
+    return NextResponse.json({
+      error: error.message || 'Internal server error'
     }, { status: 500 });
   }
 }
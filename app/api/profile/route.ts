@@ -2,6 +2,7 @@ import { NextResponse } from 'next/server'
 import { spawn } from 'child_process'
 import path from 'path'
 import { mkdir, unlink, writeFile } from 'fs/promises'
+import { callPythonWorker } from '../../utils/pythonWorker'
 
 export async function POST(request: Request) {
   let tempFilePath: string | null = null
@@ -10,7 +11,10 @@ export async function POST(request: Request) {
   try {
     const contentType = request.headers.get('content-type')
     if (contentType?.includes('application/json')) {
-      const { start, end, imagePath } = await request.json()
+      const { start, end, imagePath, paths, bands } = await request.json()
+      if (Array.isArray(paths)) {
+        return handleBatchProfileData(paths, bands || [1], imagePath)
+      }
       return handleProfileData(start, end, imagePath)
     }
 
@@ -118,6 +122,21 @@ async function handleProfileData(start: number[], end: number[], imagePath: stri
     )
   }
 
+  // Prefer the warm worker; fall back to spawning the script if it is not running
+  const workerResponse = await callPythonWorker('profile', { image_path: imagePath, start, end })
+  if (workerResponse) {
+    if (workerResponse.status !== 200) {
+      return NextResponse.json(
+        {
+          error: 'Failed to process elevation profile',
+          details: workerResponse.data.error
+        },
+        { status: 500 }
+      )
+    }
+    return NextResponse.json(workerResponse.data)
+  }
+
   const scriptPath = path.join(process.cwd(), 'app', 'scripts', 'pathProfile.py')
 
   return new Promise((resolve) => {
@@ -166,4 +185,66 @@ async function handleProfileData(start: number[], end: number[], imagePath: stri
       }
     })
   })
-}
\ No newline at end of file
+}
+
+// Function to handle batch profile requests: many [lon, lat] polylines and bands in one pass
+async function handleBatchProfileData(paths: number[][][], bands: number[], imagePath: string) {
+  if (!await fileExists(imagePath)) {
+    return NextResponse.json(
+      { error: 'Original TIFF file not found' },
+      { status: 400 }
+    )
+  }
+
+  const workerResponse = await callPythonWorker('profile_batch', { image_path: imagePath, paths, bands })
+  if (workerResponse) {
+    if (workerResponse.status !== 200) {
+      return NextResponse.json(
+        {
+          error: 'Failed to process batch profiles',
+          details: workerResponse.data.error
+        },
+        { status: 500 }
+      )
+    }
+    return NextResponse.json(workerResponse.data)
+  }
+
+  const scriptPath = path.join(process.cwd(), 'app', 'scripts', 'pathProfile.py')
+
+  return new Promise((resolve) => {
+    const pythonProcess = spawn('python', [
+      scriptPath,
+      '--batch',
+      imagePath,
+      JSON.stringify(paths),
+      JSON.stringify(bands)
+    ])
+
+    let dataString = ''
+    let errorString = ''
+
+    pythonProcess.stdout.on('data', (data) => {
+      dataString += data.toString()
+    })
+
+    pythonProcess.stderr.on('data', (data) => {
+      errorString += data.toString()
+    })
+
+    pythonProcess.on('close', (code) => {
+      try {
+        const profileData = JSON.parse(dataString)
+        resolve(NextResponse.json(profileData, { status: code === 0 ? 200 : 500 }))
+      } catch (error) {
+        resolve(NextResponse.json(
+          {
+            error: 'Failed to process batch profiles',
+            details: errorString || dataString
+          },
+          { status: 500 }
+        ))
+      }
+    })
+  })
+}
@@ -1,6 +1,7 @@
 from flask import Flask, request, jsonify, send_file, render_template, after_this_request
 from flask_cors import CORS
 import os
+import sys
 from typing import Optional, Dict
 import rasterio
 from rasterio import CRS
@@ -8,8 +9,21 @@ import numpy as np
 from PIL import Image, ImageEnhance
 import io
 import json
+import logging
 import uuid
 from datetime import datetime
+from contextlib import ExitStack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from content_store import save_upload, ContentCache
+from job_queue import JobQueue, QueueFullError
+from band_registry import get_registry
+from metrics import Metrics, instrument_app
+from upload_lifecycle import UploadLifecycle
+from overviews import needs_overviews, build_overviews, read_decimated
+from raster_io import open_raster, discard, rasterio_pool
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__, 
     static_folder='static',
@@ -21,9 +35,32 @@ UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+JOB_RESULT_FOLDER = os.path.join(UPLOAD_FOLDER, 'jobs')
+os.makedirs(JOB_RESULT_FOLDER, exist_ok=True)
+
+# Uploads and job results expire by last access and a byte quota in the background
+upload_lifecycle = UploadLifecycle(UPLOAD_FOLDER, on_remove=discard).start()
+
+# Heavy raster jobs run in a bounded local process pool
+job_queue = JobQueue()
+
+# Stage timings, cache hits and queue depth served at /metrics
+metrics = Metrics('final_app')
+instrument_app(app, metrics, job_queue)
+
+# Uploads are shared with the band arithmetic app through the band registry
+band_registry = get_registry()
+
 # Store file metadata in memory
 file_metadata: Dict[str, Dict] = {}
 
+# Caches keyed on upload content hash, shared by duplicate uploads
+raster_info_cache = ContentCache(max_items=256)
+band_png_cache = ContentCache(max_items=64)
+metrics.track_cache('raster_info', raster_info_cache)
+metrics.track_cache('band_png', band_png_cache)
+metrics.track_cache('raster_pool', rasterio_pool())
+
 def normalize_band(band_data, color_adjust=1.0):
     """
     Normalize band data with enhanced color intensity
@@ -48,10 +85,27 @@ def is_valid_tiff(filename):
     """Check if the file has a valid TIFF extension"""
     return filename.lower().endswith(('.tif', '.tiff'))
 
+def max_size_param(value):
+    """max_size from a JSON body as an int, or None when it is not given"""
+    if value is None or value == '':
+        return None
+    return int(value)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def schedule_overviews(path, content_hash):
+    """Queue a background overview/retiling job if the raster lacks a usable pyramid"""
+    try:
+        if needs_overviews(path) is not None:
+            job_queue.submit('overviews', build_overviews, {'path': os.path.abspath(path)},
+                             cache_params={'inputs': [content_hash]})
+    except QueueFullError:
+        logger.warning(f"Job queue full; skipping overviews for {path}")
+    except Exception as e:
+        logger.exception(f"Could not schedule overviews for {path}: {e}")
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -66,30 +120,44 @@ def upload_file():
 
     # Generate a unique ID for this file
     file_id = str(uuid.uuid4())
-    safe_filename = f"{file_id}_{file.filename}"
-    filepath = os.path.join(UPLOAD_FOLDER, safe_filename)
-    file.save(filepath)
+
+    # Store the content once under its hash; duplicates only get a new metadata entry
+    with metrics.stage('write'):
+        content_hash, blob_path, duplicate = save_upload(file, UPLOAD_FOLDER)
+    upload_lifecycle.touch(blob_path)
+    safe_filename = os.path.relpath(blob_path, UPLOAD_FOLDER)
 
     try:
-        with rasterio.open(filepath) as src:
-            metadata = {
-                'original_filename': file.filename,
-                'safe_filename': safe_filename,
-                'count': src.count,
-                'width': src.width,
-                'height': src.height,
-                'dtype': str(src.dtypes[0]),
-                'file_id': file_id
-            }
-            file_metadata[file_id] = metadata
-            return jsonify({
-                'message': 'File uploaded successfully',
-                'metadata': metadata,
-                'file_id': file_id
-            })
+        raster_info = raster_info_cache.get(content_hash)
+        if raster_info is None:
+            with metrics.stage('open'), open_raster(blob_path) as src:
+                raster_info = raster_info_cache.put(content_hash, {
+                    'count': src.count,
+                    'width': src.width,
+                    'height': src.height,
+                    'dtype': str(src.dtypes[0])
+                })
+
+        metadata = {
+            'original_filename': file.filename,
+            'safe_filename': safe_filename,
+            **raster_info,
+            'file_id': file_id,
+            'content_hash': content_hash,
+            'duplicate': duplicate
+        }
+        file_metadata[file_id] = metadata
+        band_registry.register(blob_path, name=file.filename)
+        if not duplicate:
+            schedule_overviews(blob_path, content_hash)
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'metadata': metadata,
+            'file_id': file_id
+        })
     except Exception as e:
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if not duplicate and os.path.exists(blob_path):
+            os.remove(blob_path)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/bands/<file_id>/<int:band_number>', methods=['GET'])
@@ -99,114 +167,141 @@ def get_band(file_id, band_number):
     
     metadata = file_metadata[file_id]
     filepath = os.path.join(UPLOAD_FOLDER, metadata['safe_filename'])
+    if not os.path.exists(filepath):
+        # The upload expired or was evicted since it was registered
+        return jsonify({'error': 'File not found'}), 404
+    
+    # Optional ?max_size= limits the longest side and reads from overviews
+    max_size = request.args.get('max_size', type=int)
+    cache_key = (metadata['content_hash'], band_number, max_size)
+    upload_lifecycle.touch(filepath)
     
     try:
-        with rasterio.open(filepath) as src:
-            if band_number < 1 or band_number > src.count:
-                return jsonify({'error': 'Invalid band number'}), 400
-            
-            band_data = src.read(band_number)
-            normalized_band = normalize_band(band_data)
-            
-            img = Image.fromarray(normalized_band)
-            img_io = io.BytesIO()
-            img.save(img_io, 'PNG', quality=95)
-            img_io.seek(0)
+        png_bytes = band_png_cache.get(cache_key)
+        if png_bytes is None:
+            with ExitStack() as stack:
+                with metrics.stage('open'):
+                    src = stack.enter_context(open_raster(filepath))
+                if band_number < 1 or band_number > src.count:
+                    return jsonify({'error': 'Invalid band number'}), 400
+                
+                with metrics.stage('read'):
+                    band_data = read_decimated(src, band_number, max_size)
+                metrics.add_bytes_read(band_data.nbytes)
+                with metrics.stage('normalize'):
+                    normalized_band = normalize_band(band_data)
+                
+                with metrics.stage('encode'):
+                    img = Image.fromarray(normalized_band)
+                    img_io = io.BytesIO()
+                    img.save(img_io, 'PNG', quality=95)
+                png_bytes = band_png_cache.put(cache_key, img_io.getvalue())
             
-            return send_file(img_io, mimetype='image/png')
+        return send_file(io.BytesIO(png_bytes), mimetype='image/png')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/composite/custom', methods=['POST'])
-def create_custom_composite():
-    data = request.get_json()
-    if not data:
-        return jsonify({'error': 'No data provided'}), 400
+def build_custom_composite(red_path, green_path, blue_path, output_path):
+    """Write a three-band GeoTIFF composite from single-band inputs; runs in the request thread or a job worker"""
+    # Read red band and get profile
+    with open_raster(red_path) as src_red:
+        red = src_red.read(1)  # Read original data without normalization
+        profile = src_red.profile.copy()
+        
+        # Store dimensions for validation
+        height, width = red.shape
+        print(f"Reference dimensions: {width}x{height}")
+
+    # Read and validate other bands
+    with open_raster(green_path) as src:
+        green = src.read(1)  # Read original data
+        if green.shape != (height, width):
+            raise ValueError(f'Green band dimensions {green.shape} do not match red band {(height, width)}')
+
+    with open_raster(blue_path) as src:
+        blue = src.read(1)  # Read original data
+        if blue.shape != (height, width):
+            raise ValueError(f'Blue band dimensions {blue.shape} do not match red band {(height, width)}')
+
+    print("All bands read successfully")
+    print(f"Band shapes - Red: {red.shape}, Green: {green.shape}, Blue: {blue.shape}")
+
+    # Update profile for multi-band GeoTIFF with WGS 84
+    profile.update({
+        'count': 3,  # Three bands
+        'driver': 'GTiff',
+        'crs': CRS.from_epsg(4326),  # WGS 84
+        'compress': 'lzw',  # Add compression
+        'tiled': True,  # Enable tiling
+        'interleave': 'band'  # Store bands separately
+    })
+
+    print(f"Writing to file: {output_path}")
+
+    # Write composite with original data
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        # Write each band separately
+        dst.write(red, 1)  # Write red band to band 1
+        dst.write(green, 2)  # Write green band to band 2
+        dst.write(blue, 3)  # Write blue band to band 3
+        
+        # Set band descriptions
+        dst.set_band_description(1, "Red Band")
+        dst.set_band_description(2, "Green Band")
+        dst.set_band_description(3, "Blue Band")
+        
+        # Update metadata
+        tags = {
+            'SOFTWARE': 'Satellite Band Composer',
+            'DATETIME': datetime.now().strftime("%Y:%m:%d %H:%M:%S"),
+            'DOCUMENTNAME': 'RGB Composite'
+        }
+        dst.update_tags(**tags)
+        
+        print("Successfully wrote composite to file")
+
+    return {'path': output_path}
 
+def get_composite_paths(data):
+    """Resolve red/green/blue file IDs from a request body to paths; returns (paths, error_response)"""
     red_file_id = data.get('red_file_id')
     green_file_id = data.get('green_file_id')
     blue_file_id = data.get('blue_file_id')
 
     if not all([red_file_id, green_file_id, blue_file_id]):
-        return jsonify({'error': 'Missing file IDs'}), 400
+        return None, (jsonify({'error': 'Missing file IDs'}), 400)
+
+    paths = []
+    for file_id, band in [(red_file_id, 'red'), (green_file_id, 'green'), (blue_file_id, 'blue')]:
+        if file_id not in file_metadata:
+            return None, (jsonify({'error': f'File ID not found for {band} band: {file_id}'}), 404)
+        filepath = os.path.join(UPLOAD_FOLDER, file_metadata[file_id]['safe_filename'])
+        if not os.path.exists(filepath):
+            return None, (jsonify({'error': f'File not found for {band} band: {filepath}'}), 404)
+        upload_lifecycle.touch(filepath)
+        paths.append(filepath)
+    return paths, None
+
+@app.route('/composite/custom', methods=['POST'])
+def create_custom_composite():
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    paths, error = get_composite_paths(data)
+    if error:
+        return error
 
     # Create temporary file name outside try block
     temp_tiff = os.path.join(UPLOAD_FOLDER, f"composite_{uuid.uuid4()}.tiff")
 
     try:
-        print(f"Creating composite with files: R={red_file_id}, G={green_file_id}, B={blue_file_id}")
-        
-        # Ensure all files exist
-        for file_id, band in [(red_file_id, 'red'), (green_file_id, 'green'), (blue_file_id, 'blue')]:
-            if file_id not in file_metadata:
-                return jsonify({'error': f'File ID not found for {band} band: {file_id}'}), 404
-            filepath = os.path.join(UPLOAD_FOLDER, file_metadata[file_id]['safe_filename'])
-            if not os.path.exists(filepath):
-                return jsonify({'error': f'File not found for {band} band: {filepath}'}), 404
-
-        # Read red band and get profile
-        red_path = os.path.join(UPLOAD_FOLDER, file_metadata[red_file_id]['safe_filename'])
-        with rasterio.open(red_path) as src_red:
-            red = src_red.read(1)  # Read original data without normalization
-            profile = src_red.profile.copy()
-            
-            # Store dimensions for validation
-            height, width = red.shape
-            print(f"Reference dimensions: {width}x{height}")
-
-        # Read and validate other bands
-        green_path = os.path.join(UPLOAD_FOLDER, file_metadata[green_file_id]['safe_filename'])
-        with rasterio.open(green_path) as src:
-            green = src.read(1)  # Read original data
-            if green.shape != (height, width):
-                return jsonify({'error': f'Green band dimensions {green.shape} do not match red band {(height, width)}'}), 400
-
-        blue_path = os.path.join(UPLOAD_FOLDER, file_metadata[blue_file_id]['safe_filename'])
-        with rasterio.open(blue_path) as src:
-            blue = src.read(1)  # Read original data
-            if blue.shape != (height, width):
-                return jsonify({'error': f'Blue band dimensions {blue.shape} do not match red band {(height, width)}'}), 400
-
-        print("All bands read successfully")
-        print(f"Band shapes - Red: {red.shape}, Green: {green.shape}, Blue: {blue.shape}")
-
-        # Stack original bands
-        composite_array = np.stack([red, green, blue])
-        print(f"Composite array shape: {composite_array.shape}")
-
-        # Update profile for multi-band GeoTIFF with WGS 84
-        profile.update({
-            'count': 3,  # Three bands
-            'driver': 'GTiff',
-            'crs': CRS.from_epsg(4326),  # WGS 84
-            'compress': 'lzw',  # Add compression
-            'tiled': True,  # Enable tiling
-            'interleave': 'band'  # Store bands separately
-        })
-
-        print(f"Writing to temporary file: {temp_tiff}")
-
-        # Write composite with original data
-        with rasterio.open(temp_tiff, 'w', **profile) as dst:
-            # Write each band separately
-            dst.write(red, 1)  # Write red band to band 1
-            dst.write(green, 2)  # Write green band to band 2
-            dst.write(blue, 3)  # Write blue band to band 3
-            
-            # Set band descriptions
-            dst.set_band_description(1, "Red Band")
-            dst.set_band_description(2, "Green Band")
-            dst.set_band_description(3, "Blue Band")
-            
-            # Update metadata
-            tags = {
-                'SOFTWARE': 'Satellite Band Composer',
-                'DATETIME': datetime.now().strftime("%Y:%m:%d %H:%M:%S"),
-                'DOCUMENTNAME': 'RGB Composite'
-            }
-            dst.update_tags(**tags)
-            
-            print("Successfully wrote composite to file")
+        print(f"Creating composite with files: R={paths[0]}, G={paths[1]}, B={paths[2]}")
+        try:
+            with metrics.stage('write'):
+                build_custom_composite(*paths, temp_tiff)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # Clean up file after sending
         @after_this_request
@@ -239,6 +334,59 @@ def create_custom_composite():
                 print(f"Error cleaning up temporary file: {cleanup_error}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/composite/custom', methods=['POST'])
+def submit_custom_composite():
+    """Queue a custom composite in the background and return its job ID"""
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    paths, error = get_composite_paths(data)
+    if error:
+        return error
+
+    # Identical inputs (by content, not upload ID) share one job and its result
+    content_hashes = [file_metadata[data[key]]['content_hash']
+                      for key in ('red_file_id', 'green_file_id', 'blue_file_id')]
+    output_path = os.path.abspath(os.path.join(JOB_RESULT_FOLDER, f"composite_{uuid.uuid4()}.tiff"))
+
+    try:
+        job_id = job_queue.submit(
+            'composite_custom',
+            build_custom_composite,
+            {'red_path': paths[0], 'green_path': paths[1], 'blue_path': paths[2], 'output_path': output_path},
+            cache_params={'inputs': content_hashes}
+        )
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+
+    return jsonify({'job_id': job_id, 'status': job_queue.status(job_id)['status']}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    status, result = job_queue.result(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if status == 'failed':
+        return jsonify(job_queue.status(job_id)), 500
+    if status != 'finished':
+        return jsonify({'job_id': job_id, 'status': status}), 202
+
+    upload_lifecycle.touch(result['path'])
+    return send_file(
+        result['path'],
+        mimetype='image/tiff',
+        as_attachment=True,
+        download_name='rgb_composite.tiff'
+    )
+
 @app.route('/composite/preview', methods=['POST'])
 def create_preview():
     data = request.get_json()
@@ -252,16 +400,22 @@ def create_preview():
     if not all([red_file_id, green_file_id, blue_file_id]):
         return jsonify({'error': 'Missing file IDs'}), 400
 
+    # Optional max_size limits the longest side and reads from overviews
+    try:
+        max_size = max_size_param(data.get('max_size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_size must be an integer'}), 400
+
     try:
         # Read and normalize bands for preview
-        with rasterio.open(os.path.join(UPLOAD_FOLDER, file_metadata[red_file_id]['safe_filename'])) as src:
-            red = normalize_band(src.read(1), color_adjust=1.3)
+        with open_raster(os.path.join(UPLOAD_FOLDER, file_metadata[red_file_id]['safe_filename'])) as src:
+            red = normalize_band(read_decimated(src, 1, max_size), color_adjust=1.3)
 
-        with rasterio.open(os.path.join(UPLOAD_FOLDER, file_metadata[green_file_id]['safe_filename'])) as src:
-            green = normalize_band(src.read(1), color_adjust=1.2)
+        with open_raster(os.path.join(UPLOAD_FOLDER, file_metadata[green_file_id]['safe_filename'])) as src:
+            green = normalize_band(read_decimated(src, 1, max_size), color_adjust=1.2)
 
-        with rasterio.open(os.path.join(UPLOAD_FOLDER, file_metadata[blue_file_id]['safe_filename'])) as src:
-            blue = normalize_band(src.read(1), color_adjust=1.4)
+        with open_raster(os.path.join(UPLOAD_FOLDER, file_metadata[blue_file_id]['safe_filename'])) as src:
+            blue = normalize_band(read_decimated(src, 1, max_size), color_adjust=1.4)
 
         # Create RGB composite for preview
         composite = np.dstack((red, green, blue))
@@ -297,25 +451,31 @@ def create_composite(file_id):
     r_band = int(data.get('red', 1))
     g_band = int(data.get('green', 2))
     b_band = int(data.get('blue', 3))
+    try:
+        max_size = max_size_param(data.get('max_size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_size must be an integer'}), 400
     
     metadata = file_metadata[file_id]
     filepath = os.path.join(UPLOAD_FOLDER, metadata['safe_filename'])
+    upload_lifecycle.touch(filepath)
     
     try:
-        with rasterio.open(filepath) as src:
+        with open_raster(filepath) as src:
             if any(band > src.count for band in [r_band, g_band, b_band]):
                 return jsonify({'error': 'Invalid band number'}), 400
 
-            red = normalize_band(src.read(r_band))
-            green = normalize_band(src.read(g_band))
-            blue = normalize_band(src.read(b_band))
-            
-            composite = np.dstack((red, green, blue))
-            img = Image.fromarray(composite)
+            with metrics.stage('read'):
+                bands = [read_decimated(src, band, max_size) for band in (r_band, g_band, b_band)]
+            metrics.add_bytes_read(sum(band.nbytes for band in bands))
+            with metrics.stage('normalize'):
+                composite = np.dstack([normalize_band(band) for band in bands])
             
-            img_io = io.BytesIO()
-            img.save(img_io, 'PNG', quality=95)
-            img_io.seek(0)
+            with metrics.stage('encode'):
+                img = Image.fromarray(composite)
+                img_io = io.BytesIO()
+                img.save(img_io, 'PNG', quality=95)
+                img_io.seek(0)
             
             return send_file(img_io, mimetype='image/png')
     except Exception as e:
@@ -327,4 +487,4 @@ def list_files():
     return jsonify(list(file_metadata.values()))
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    app.run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', port=int(os.environ.get('PORT', 5000)))
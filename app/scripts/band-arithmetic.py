@@ -1,19 +1,34 @@
 from flask import Flask, render_template, request, send_from_directory, send_file, jsonify
 import os
+import io
 import numpy as np
 from werkzeug.utils import secure_filename
 from PIL import Image
 import rasterio
-from rasterio.warp import calculate_default_transform, reproject, Resampling
+from rasterio.warp import Resampling
+from rasterio.vrt import WarpedVRT
 from flask_cors import CORS
 import logging
 import sys
 from datetime import datetime
 import pandas as pd
 from pathlib import Path
-import tempfile
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor
 import shutil
+import threading
 import time
+import uuid
+
+from content_store import save_upload, file_digest
+from job_queue import JobQueue, QueueFullError
+from band_expression import BandExpression, ExpressionError
+from band_registry import get_registry, parse_raster_name
+from rgb_adjust import enhance_rgb
+from metrics import Metrics, instrument_app
+from upload_lifecycle import UploadLifecycle
+from overviews import needs_overviews, build_overviews, read_decimated
+from raster_io import open_raster, discard, rasterio_pool
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -38,6 +53,24 @@ if not os.path.exists(UPLOAD_FOLDER):
     logger.info(f"Created upload folder at {UPLOAD_FOLDER}")
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Longest side of the PNG previews rendered for results
+PREVIEW_MAX_SIZE = int(os.environ.get('BAND_PREVIEW_MAX_SIZE', 2048))
+
+# Uploads and results expire by last access and a byte quota in the background
+upload_lifecycle = UploadLifecycle(UPLOAD_FOLDER, on_remove=discard).start()
+
+# Uploaded bands and results are looked up by exact band name
+band_registry = get_registry()
+band_registry.scan(UPLOAD_FOLDER)
+
+# Heavy raster jobs run in a bounded local process pool
+job_queue = JobQueue()
+
+# Stage timings and queue depth served at /metrics
+metrics = Metrics('band_arithmetic')
+instrument_app(app, metrics, job_queue)
+metrics.track_cache('raster_pool', rasterio_pool())
+
 # Available operators
 OPERATORS = {
     'add': '+',
@@ -47,50 +80,86 @@ OPERATORS = {
     'ndvi': 'ndvi'
 }
 
+def output_dtype(value):
+    """Validate an optional output dtype form value such as 'float32'"""
+    if not value:
+        return None
+    try:
+        return np.dtype(value).name
+    except TypeError:
+        raise ValueError(f"Unsupported dtype: {value}")
+
+def stream_requested():
+    """Whether the client asked for the rendered image bytes instead of a saved file"""
+    return request.form.get('stream', '').lower() in ('1', 'true', 'yes')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'tif', 'tiff'}
 
-def match_resolution(src_path, reference_path, output_path):
-    """Reproject and resample a raster to match the resolution of a reference raster"""
-    with rasterio.open(reference_path) as reference:
-        ref_transform = reference.transform
-        ref_crs = reference.crs
-        ref_width = reference.width
-        ref_height = reference.height
-
-        with rasterio.open(src_path) as src:
-            transform, width, height = calculate_default_transform(
-                src.crs, ref_crs, ref_width, ref_height, *reference.bounds)
-            
-            kwargs = src.meta.copy()
-            kwargs.update({
-                'crs': ref_crs,
-                'transform': ref_transform,
-                'width': ref_width,
-                'height': ref_height
-            })
+def grids_match(src, reference):
+    """Check whether two datasets share CRS, size and geotransform"""
+    return (src.crs == reference.crs and
+            src.width == reference.width and
+            src.height == reference.height and
+            src.transform.almost_equals(reference.transform))
+
+@contextmanager
+def open_matched(src_path, reference_path):
+    """
+    Open a raster on the grid of a reference raster.
+
+    Yields the source dataset itself when the grids already match (the usual
+    case for bands from one INSAT slot); otherwise yields a lazy in-memory
+    warped view that resamples only the windows that are read.
+    """
+    with open_raster(reference_path) as reference, open_raster(src_path) as src:
+        if grids_match(src, reference):
+            yield src
+            return
 
-            with rasterio.open(output_path, 'w', **kwargs) as dst:
-                reproject(
-                    source=rasterio.band(src, 1),
-                    destination=rasterio.band(dst, 1),
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=ref_transform,
-                    dst_crs=ref_crs,
-                    resampling=Resampling.bilinear
-                )
+        logger.debug(f"Resampling {src_path} onto the grid of {reference_path}")
+        with WarpedVRT(src,
+                       crs=reference.crs,
+                       transform=reference.transform,
+                       width=reference.width,
+                       height=reference.height,
+                       resampling=Resampling.bilinear) as vrt:
+            yield vrt
 
 def get_band_name(filename):
     """Extract band name from filename"""
-    # Split by underscore and get the last part before file extension
-    parts = os.path.splitext(filename)[0].split('_')
-    return parts[-1] if parts else filename
+    return parse_raster_name(filename)['band']
+
+def schedule_overviews(path, content_hash):
+    """Queue a background overview/retiling job if the raster lacks a usable pyramid"""
+    try:
+        if needs_overviews(path) is None:
+            return None
+        return job_queue.submit('overviews', build_overviews, {'path': path},
+                                cache_params={'inputs': [content_hash], 'path': path})
+    except QueueFullError:
+        logger.info(f"Job queue full; skipping overviews for {path}")
+    except Exception as e:
+        logger.error(f"Could not schedule overviews for {path}: {str(e)}")
+    return None
+
+def save_band_upload(file, filepath):
+    """Save an upload under filepath, record it in the band registry and queue overviews"""
+    content_hash, _, _ = save_upload(file, app.config['UPLOAD_FOLDER'], alias_path=filepath)
+    upload_lifecycle.touch(filepath)
+    band_registry.register(filepath)
+    schedule_overviews(filepath, content_hash)
 
 def generate_result_filename(operation, band1, band2):
     """Generate a descriptive filename for the result"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return f"result_{band1}{operation}{band2}_{timestamp}.tif"
+    # The suffix keeps concurrent jobs with the same inputs in the same second apart
+    return f"result_{band1}{operation}{band2}_{timestamp}_{uuid.uuid4().hex[:8]}.tif"
+
+def read_preview(path):
+    """First band of a result decimated to PREVIEW_MAX_SIZE, served from overviews when present"""
+    with open_raster(path) as src:
+        return read_decimated(src, 1, PREVIEW_MAX_SIZE)
 
 def normalize_band(band):
     """Normalize band data to 0-255 range"""
@@ -104,63 +173,177 @@ def normalize_band(band):
     normalized = np.clip((band - min_val) / (max_val - min_val) * 255, 0, 255)
     return normalized.astype(np.uint8)
 
-def process_rasters(file1_path, file2_path, operation, band1_name, band2_name):
-    """Process two rasters with resolution matching"""
+def apply_operation(operation, band1, band2):
+    """Apply an arithmetic operator to two arrays"""
+    if operation == 'add':
+        return band1 + band2
+    elif operation == 'subtract':
+        return band1 - band2
+    elif operation == 'multiply':
+        return band1 * band2
+    elif operation == 'divide':
+        # Avoid division by zero
+        band2 = np.where(band2 == 0, 1, band2)
+        return band1.astype(np.float32) / band2
+    elif operation == 'ndvi':
+        # Avoid division by zero
+        band1 = band1.astype(np.float32)
+        denominator = band1 + band2
+        denominator = np.where(denominator == 0, 1, denominator)
+        return (band1 - band2) / denominator
+    raise ValueError(f"Unsupported operation: {operation}")
+
+def run_windowed(input_paths, output_path, compute, dtype, nodata=None, max_workers=None):
+    """
+    Compute a single-band raster from aligned inputs one block window at a time.
+
+    The output is tiled, and its block windows are processed on a thread pool
+    (GDAL releases the GIL during reads). Each thread opens its own handles,
+    matched to the grid of the first input, and every window is written as soon
+    as it is computed, so memory stays bounded by the number of workers.
+
+    compute: called with the masked input arrays for a window; returns the result
+    nodata: output nodata value; the first input's nodata is kept when None
+    """
+    with open_raster(input_paths[0]) as reference:
+        profile = reference.profile.copy()
+    profile.update(driver='GTiff', dtype=dtype, count=1,
+                   tiled=True, blockxsize=256, blockysize=256, BIGTIFF='IF_SAFER')
+    if nodata is not None:
+        profile['nodata'] = nodata
+
+    local = threading.local()
+    stacks = []
+    stacks_lock = threading.Lock()
+    write_lock = threading.Lock()
+
+    def thread_datasets():
+        if not hasattr(local, 'datasets'):
+            stack = ExitStack()
+            with stacks_lock:
+                stacks.append(stack)
+            local.datasets = [stack.enter_context(open_matched(path, input_paths[0]))
+                              for path in input_paths]
+        return local.datasets
+
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        def process_window(window):
+            with metrics.stage('read'):
+                blocks = [ds.read(1, window=window, masked=True) for ds in thread_datasets()]
+            metrics.add_bytes_read(sum(block.data.nbytes for block in blocks))
+            with metrics.stage('compute'):
+                result = np.asarray(compute(blocks)).astype(dtype, copy=False)
+            with metrics.stage('write'), write_lock:
+                dst.write(result, 1, window=window)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+                for _ in pool.map(process_window, [window for _, window in dst.block_windows(1)]):
+                    pass
+        finally:
+            for stack in stacks:
+                stack.close()
+
+    return output_path
+
+def process_rasters(file1_path, file2_path, operation, band1_name, band2_name, dtype=None):
+    """
+    Process two rasters with resolution matching, block by block.
+
+    dtype: output data type; defaults to float32 for divide and ndvi and to the
+    common type of the inputs otherwise.
+    """
     try:
         logger.debug(f"Processing rasters: {file1_path}, {file2_path}, {operation}, {band1_name}, {band2_name}")
-        # Create a temporary directory for intermediate files
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Create temporary file for resampled raster
-            temp_resampled = os.path.join(temp_dir, 'temp_resampled.tif')
-            
-            # Match resolution of second file to first file
-            match_resolution(file2_path, file1_path, temp_resampled)
-            
-            # Read the rasters
-            with rasterio.open(file1_path) as src1, rasterio.open(temp_resampled) as src2:
-                band1 = src1.read(1)
-                band2 = src2.read(1)
-                profile = src1.profile.copy()
-                
-                # Perform the calculation
-                if operation == 'add':
-                    result = band1 + band2
-                elif operation == 'subtract':
-                    result = band1 - band2
-                elif operation == 'multiply':
-                    result = band1 * band2
-                elif operation == 'divide':
-                    # Avoid division by zero
-                    band2 = np.where(band2 == 0, 1, band2)
-                    result = band1 / band2
-                elif operation == 'ndvi':
-                    # Avoid division by zero
-                    denominator = band1 + band2
-                    denominator = np.where(denominator == 0, 1, denominator)
-                    result = (band1 - band2) / denominator
-                
-                # Generate result filename
-                result_filename = generate_result_filename(operation, band1_name, band2_name)
-                output_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
-                
-                # Save the result
-                profile.update(dtype=result.dtype)
-                with rasterio.open(output_path, 'w', **profile) as dst:
-                    dst.write(result, 1)
-                
-                return output_path, result_filename
-                
+        if operation not in OPERATORS:
+            raise ValueError(f"Unsupported operation: {operation}")
+        if dtype is None:
+            if operation in ('divide', 'ndvi'):
+                dtype = 'float32'
+            else:
+                with open_raster(file1_path) as src1, open_raster(file2_path) as src2:
+                    dtype = np.result_type(src1.dtypes[0], src2.dtypes[0]).name
+        dtype = np.dtype(dtype).name
+
+        # Generate result filename
+        result_filename = generate_result_filename(operation, band1_name, band2_name)
+        output_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
+
+        # The second file is read on the grid of the first
+        run_windowed(
+            [file1_path, file2_path], output_path,
+            lambda blocks: apply_operation(operation, np.ma.getdata(blocks[0]), np.ma.getdata(blocks[1])),
+            dtype)
+        band_registry.register(output_path, band=f"{band1_name}{OPERATORS[operation]}{band2_name}",
+                               product='result')
+
+        return output_path, result_filename
+
     except Exception as e:
         logger.error(f"Error processing rasters: {str(e)}", exc_info=True)
         raise
 
+def find_band_file(band):
+    """Find the newest uploaded or converted raster for an exact band name"""
+    path = band_registry.lookup(band)
+    if path:
+        upload_lifecycle.touch(path)
+    return path
+
+def find_band_files(band1, band2):
+    """Find the rasters registered for two band names"""
+    return find_band_file(band1), find_band_file(band2)
+
+def evaluate_expression(expression, band_paths, result_filename=None):
+    """
+    Evaluate a band-math expression over named band files.
+
+    All bands are read on the grid of the first band in the expression and
+    evaluated window by window. Pixels that are nodata in any input, or whose
+    result is not finite, are written as NaN in a float32 GeoTIFF.
+    """
+    expr = BandExpression(expression)
+
+    def compute(blocks):
+        arrays = {name: np.ma.getdata(block) for name, block in zip(expr.names, blocks)}
+        return expr.evaluate(arrays, [np.ma.getmaskarray(block) for block in blocks])
+
+    if result_filename is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        result_filename = f"result_expression_{timestamp}_{uuid.uuid4().hex[:8]}.tif"
+    output_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
+    run_windowed([band_paths[name] for name in expr.names], output_path, compute,
+                 'float32', nodata=np.nan)
+    band_registry.register(output_path, band=expr.source, product='expression')
+
+    result_norm = normalize_band(read_preview(output_path))
+    if result_norm is None:
+        raise ValueError('Expression produced no valid pixels')
+    result_image = os.path.splitext(result_filename)[0] + '.png'
+    Image.fromarray(result_norm).save(os.path.join(app.config['UPLOAD_FOLDER'], result_image))
+    return {'path': output_path, 'result_image': result_image, 'result_tiff': result_filename,
+            'bands': expr.names}
+
+def run_arithmetic(file1_path, file2_path, operation, band1_name, band2_name, dtype=None):
+    """Run band arithmetic and render a preview PNG; used by background jobs"""
+    result_path, result_filename = process_rasters(
+        file1_path, file2_path, operation, band1_name, band2_name, dtype)
+    
+    result_norm = normalize_band(read_preview(result_path))
+    if result_norm is None:
+        raise ValueError('Failed to process the result')
+    
+    result_image = os.path.splitext(result_filename)[0] + '.png'
+    Image.fromarray(result_norm).save(os.path.join(app.config['UPLOAD_FOLDER'], result_image))
+    return {'path': result_path, 'result_image': result_image, 'result_tiff': result_filename}
+
 def process_rgb_image(bands, mode, brightness=0, contrast=0, saturation=0):
     """Process bands into an RGB image with adjustments"""
     if len(bands) != 3:
         raise ValueError("Expected 3 bands for RGB composition")
     
-    # Convert bands to float32 for processing
-    rgb = np.zeros((bands[0].shape[0], bands[0].shape[1], 3), dtype=np.float32)
+    # Stretch each band straight into the 8-bit composite
+    rgb = np.zeros((bands[0].shape[0], bands[0].shape[1], 3), dtype=np.uint8)
     
     # Process each band
     for i in range(3):
@@ -180,34 +363,50 @@ def process_rgb_image(bands, mode, brightness=0, contrast=0, saturation=0):
             band = np.clip(band, p2, p98)
             band = ((band - p2) / (p98 - p2) * 255.0)
         
-        rgb[:,:,i] = band
-
-    # Clip to ensure 0-255 range
-    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
-    
-    # Convert to PIL Image for adjustments
-    img = Image.fromarray(rgb)
+        rgb[:,:,i] = np.clip(band, 0, 255)
     
-    # Apply adjustments
+    # Apply adjustments with the shared LUT kernel (same factors as ImageEnhance)
     if brightness != 0 or contrast != 0 or saturation != 0:
-        from PIL import ImageEnhance
-        
-        if brightness != 0:
-            factor = 1.0 + float(brightness) / 100.0
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(factor)
-        
-        if contrast != 0:
-            factor = 1.0 + float(contrast) / 100.0
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(factor)
-        
-        if saturation != 0:
-            factor = 1.0 + float(saturation) / 100.0
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(factor)
+        rgb = enhance_rgb(rgb,
+                          1.0 + float(brightness) / 100.0,
+                          1.0 + float(contrast) / 100.0,
+                          1.0 + float(saturation) / 100.0)
+    
+    return Image.fromarray(rgb)
+
+def combine_rgb(filepath1, filepath2, mode, r_band=4, g_band=3, b_band=2,
+                brightness=0, contrast=0, saturation=0, result_filename='rgb_combined.png'):
+    """Build an RGB image from bands of two rasters, resampling the second to the first"""
+    # Read bands from both files, matching the second file to the grid of the first
+    with open_raster(filepath1) as src1, open_matched(filepath2, filepath1) as src2:
+        if mode == 'natural':
+            bands = [
+                src1.read(3),  # Red from file1
+                src1.read(2),  # Green from file1
+                src2.read(1)   # Blue from file2
+            ]
+        elif mode == 'false':
+            bands = [
+                src1.read(4),  # NIR from file1
+                src2.read(3),  # Red from file2
+                src2.read(2)   # Green from file2
+            ]
+        else:  # custom
+            bands = [
+                src1.read(r_band),
+                src2.read(g_band),
+                src2.read(b_band)
+            ]
+
+    # Process RGB image
+    rgb_image = process_rgb_image(
+        bands, mode, brightness, contrast, saturation)
+    
+    # Save result
+    result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
+    rgb_image.save(result_path)
     
-    return img
+    return {'path': result_path, 'result_image': result_filename}
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -225,7 +424,7 @@ def index():
                     if file and allowed_file(file.filename):
                         filename = secure_filename(file.filename)
                         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                        file.save(filepath)
+                        save_band_upload(file, filepath)
                         band_name = get_band_name(filename)
                         saved_files.append({
                             'path': filepath,
@@ -243,29 +442,22 @@ def index():
             operation = request.form.get('operation')
             band1 = request.form.get('band1')
             band2 = request.form.get('band2')
+            dtype = request.form.get('dtype')
             
             if not all([operation, band1, band2]):
                 return jsonify({'error': 'Missing required parameters'}), 400
             
             # Find the corresponding files from the upload folder
-            band1_file = None
-            band2_file = None
-            for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-                if band1 in filename:
-                    band1_file = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                if band2 in filename:
-                    band2_file = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            band1_file, band2_file = find_band_files(band1, band2)
             
             if not band1_file or not band2_file:
                 return jsonify({'error': 'Band files not found'}), 404
             
             try:
                 result_path, result_filename = process_rasters(
-                    band1_file, band2_file, operation, band1, band2)
+                    band1_file, band2_file, operation, band1, band2, output_dtype(dtype))
                 
-                with rasterio.open(result_path) as src:
-                    result_band = src.read(1)
-                result_norm = normalize_band(result_band)
+                result_norm = normalize_band(read_preview(result_path))
                 
                 if result_norm is not None:
                     result_image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'result.png')
@@ -316,19 +508,18 @@ def process_files():
         filepath1 = os.path.join(app.config['UPLOAD_FOLDER'], filename1)
         filepath2 = os.path.join(app.config['UPLOAD_FOLDER'], filename2)
         
-        file1.save(filepath1)
-        file2.save(filepath2)
+        save_band_upload(file1, filepath1)
+        save_band_upload(file2, filepath2)
         
         try:   
             result_path, result_filename = process_rasters(
                 filepath1, filepath2, operation, 
                 os.path.splitext(filename1)[0], 
-                os.path.splitext(filename2)[0]
+                os.path.splitext(filename2)[0],
+                output_dtype(request.form.get('dtype'))
             )
             
-            with rasterio.open(result_path) as src:
-                result_band = src.read(1)
-            result_norm = normalize_band(result_band)
+            result_norm = normalize_band(read_preview(result_path))
             
             if result_norm is not None:
                 result_image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'result.png')
@@ -350,10 +541,48 @@ def process_files():
         logger.error(f"Error in process_files route: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/expression', methods=['POST'])
+def expression():
+    """
+    Evaluate a formula over named bands, e.g. (TIR1 - TIR2) / (TIR1 + TIR2).
+
+    Bands are taken from files uploaded with the request (named by band, as in
+    the index route) or looked up among previously uploaded files.
+    """
+    try:
+        try:
+            expr = BandExpression(request.form.get('expression', ''))
+        except ExpressionError as e:
+            return jsonify({'error': str(e)}), 400
+
+        band_paths = {}
+        for file in request.files.getlist('files'):
+            if file and allowed_file(file.filename):
+                filename = secure_filename(file.filename)
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                save_band_upload(file, filepath)
+                band_paths[get_band_name(filename)] = filepath
+
+        for name in expr.names:
+            if name not in band_paths:
+                band_paths[name] = find_band_file(name)
+        missing = [name for name in expr.names if not band_paths[name]]
+        if missing:
+            return jsonify({'error': f"Band files not found: {', '.join(missing)}"}), 404
+
+        result = evaluate_expression(expr.source, band_paths)
+        return jsonify({k: v for k, v in result.items() if k != 'path'})
+    except ExpressionError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error evaluating expression: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     try:
         logger.debug(f"Serving uploaded file: {filename}")
+        upload_lifecycle.touch(os.path.join(app.config['UPLOAD_FOLDER'], filename))
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
     except Exception as e:
         logger.error(f"Error serving uploaded file: {str(e)}", exc_info=True)
@@ -364,6 +593,7 @@ def download_file(filename):
     """Download the processed TIFF file"""
     try:
         logger.debug(f"Downloading file: {filename}")
+        upload_lifecycle.touch(os.path.join(app.config['UPLOAD_FOLDER'], filename))
         return send_file(
             os.path.join(app.config['UPLOAD_FOLDER'], filename),
             as_attachment=True,
@@ -399,7 +629,7 @@ def rgb_display():
         try:
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            save_band_upload(file, filepath)
             logger.info(f"File saved successfully: {filepath}")
         except Exception as e:
             logger.error(f"Error saving file: {str(e)}")
@@ -407,7 +637,9 @@ def rgb_display():
         
         try:
             # Read file metadata
-            with rasterio.open(filepath) as src:
+            with ExitStack() as stack:
+                with metrics.stage('open'):
+                    src = stack.enter_context(open_raster(filepath))
                 num_bands = src.count
                 logger.info(f"File opened successfully. Number of bands: {num_bands}")
                 
@@ -439,18 +671,13 @@ def rgb_display():
                 
                 try:
                     # Read the bands
-                    bands = [
-                        src.read(r_band),
-                        src.read(g_band),
-                        src.read(b_band)
-                    ]
-                    
-                    # Log band statistics
-                    for i, band_data in enumerate(['Red', 'Green', 'Blue']):
-                        band = bands[i]
-                        logger.info(f"{band_data} band stats - "
-                                  f"Min: {np.min(band)}, Max: {np.max(band)}, "
-                                  f"Mean: {np.mean(band)}, Std: {np.std(band)}")
+                    with metrics.stage('read'):
+                        bands = [
+                            src.read(r_band),
+                            src.read(g_band),
+                            src.read(b_band)
+                        ]
+                    metrics.add_bytes_read(sum(band.nbytes for band in bands))
                 except Exception as e:
                     logger.error(f"Error reading bands: {str(e)}")
                     return jsonify({'error': 'Error reading image bands'}), 500
@@ -466,13 +693,25 @@ def rgb_display():
             saturation = int(request.form.get('saturation', 0))
             
             # Process RGB image
-            rgb_image = process_rgb_image(
-                bands, mode, brightness, contrast, saturation)
+            with metrics.stage('normalize'):
+                rgb_image = process_rgb_image(
+                    bands, mode, brightness, contrast, saturation)
+            
+            # Stream the PNG straight to the client when requested
+            if stream_requested():
+                with metrics.stage('encode'):
+                    png_io = io.BytesIO()
+                    rgb_image.save(png_io, 'PNG')
+                    png_io.seek(0)
+                response = send_file(png_io, mimetype='image/png')
+                response.headers['X-Selected-Bands'] = f'{r_band},{g_band},{b_band}'
+                return response
             
             # Save result
             result_filename = f'rgb_result_{int(time.time())}.png'
             result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
-            rgb_image.save(result_path)
+            with metrics.stage('encode'):
+                rgb_image.save(result_path)
             logger.info(f"Result saved successfully: {result_filename}")
             
             return jsonify({
@@ -522,50 +761,128 @@ def rgb_combine():
         filename2 = secure_filename(file2.filename)
         filepath1 = os.path.join(app.config['UPLOAD_FOLDER'], filename1)
         filepath2 = os.path.join(app.config['UPLOAD_FOLDER'], filename2)
-        file1.save(filepath1)
-        file2.save(filepath2)
+        save_band_upload(file1, filepath1)
+        save_band_upload(file2, filepath2)
         
-        # Match resolution of second file to first file
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_resampled = os.path.join(temp_dir, 'resampled.tif')
-            match_resolution(filepath2, filepath1, temp_resampled)
-            
-            # Read bands from both files
-            with rasterio.open(filepath1) as src1, rasterio.open(temp_resampled) as src2:
-                if mode == 'natural':
-                    bands = [
-                        src1.read(3),  # Red from file1
-                        src1.read(2),  # Green from file1
-                        src2.read(1)   # Blue from file2
-                    ]
-                elif mode == 'false':
-                    bands = [
-                        src1.read(4),  # NIR from file1
-                        src2.read(3),  # Red from file2
-                        src2.read(2)   # Green from file2
-                    ]
-                else:  # custom
-                    bands = [
-                        src1.read(r_band),
-                        src2.read(g_band),
-                        src2.read(b_band)
-                    ]
-        
-        # Process RGB image
-        rgb_image = process_rgb_image(
-            bands, mode, brightness, contrast, saturation)
-        
-        # Save result
-        result_filename = 'rgb_combined.png'
-        result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
-        rgb_image.save(result_path)
-        
-        return jsonify({'result_image': result_filename})
+        result = combine_rgb(filepath1, filepath2, mode, r_band, g_band, b_band,
+                             brightness, contrast, saturation)
+        return jsonify({'result_image': result['result_image']})
         
     except Exception as e:
         logger.error(f"Error in rgb_combine: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def submit_job(name, func, params, input_paths):
+    """Queue a job keyed by the content of its inputs and return a 202 response"""
+    cache_params = {k: v for k, v in params.items() if k not in ('file1_path', 'file2_path', 'filepath1', 'filepath2', 'result_filename')}
+    cache_params['inputs'] = [file_digest(path) for path in input_paths]
+    try:
+        job_id = job_queue.submit(name, func, params, cache_params=cache_params)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify({'job_id': job_id, 'status': job_queue.status(job_id)['status']}), 202
+
+@app.route('/jobs/arithmetic', methods=['POST'])
+def submit_arithmetic_job():
+    """Queue band arithmetic on two uploaded files or two previously uploaded bands"""
+    try:
+        operation = request.form.get('operation')
+        if operation not in OPERATORS:
+            return jsonify({'error': 'Invalid or missing operation'}), 400
+
+        if 'file1' in request.files and 'file2' in request.files:
+            file1 = request.files['file1']
+            file2 = request.files['file2']
+            if not allowed_file(file1.filename) or not allowed_file(file2.filename):
+                return jsonify({'error': 'Invalid file format. Only .tif and .tiff files are allowed'}), 400
+            filename1 = secure_filename(file1.filename)
+            filename2 = secure_filename(file2.filename)
+            file1_path = os.path.join(app.config['UPLOAD_FOLDER'], filename1)
+            file2_path = os.path.join(app.config['UPLOAD_FOLDER'], filename2)
+            save_band_upload(file1, file1_path)
+            save_band_upload(file2, file2_path)
+            band1 = os.path.splitext(filename1)[0]
+            band2 = os.path.splitext(filename2)[0]
+        else:
+            band1 = request.form.get('band1')
+            band2 = request.form.get('band2')
+            if not band1 or not band2:
+                return jsonify({'error': 'Missing required parameters'}), 400
+            file1_path, file2_path = find_band_files(band1, band2)
+            if not file1_path or not file2_path:
+                return jsonify({'error': 'Band files not found'}), 404
+
+        params = {
+            'file1_path': file1_path,
+            'file2_path': file2_path,
+            'operation': operation,
+            'band1_name': band1,
+            'band2_name': band2,
+            'dtype': output_dtype(request.form.get('dtype'))
+        }
+        return submit_job('arithmetic', run_arithmetic, params, [file1_path, file2_path])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error submitting arithmetic job: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/rgb_combine', methods=['POST'])
+def submit_rgb_combine_job():
+    """Queue an RGB combination of two uploaded files"""
+    try:
+        if 'file1' not in request.files or 'file2' not in request.files:
+            return jsonify({'error': 'Both files are required'}), 400
+        
+        file1 = request.files['file1']
+        file2 = request.files['file2']
+        if not file1 or not file2 or not allowed_file(file1.filename) or not allowed_file(file2.filename):
+            return jsonify({'error': 'Invalid file format'}), 400
+
+        filepath1 = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file1.filename))
+        filepath2 = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file2.filename))
+        save_band_upload(file1, filepath1)
+        save_band_upload(file2, filepath2)
+
+        params = {
+            'filepath1': filepath1,
+            'filepath2': filepath2,
+            'mode': request.form.get('mode', 'natural'),
+            'r_band': int(request.form.get('r_band', 4)),
+            'g_band': int(request.form.get('g_band', 3)),
+            'b_band': int(request.form.get('b_band', 2)),
+            'brightness': int(request.form.get('brightness', 0)),
+            'contrast': int(request.form.get('contrast', 0)),
+            'saturation': int(request.form.get('saturation', 0)),
+            'result_filename': f'rgb_combined_{uuid.uuid4().hex}.png'
+        }
+        return submit_job('rgb_combine', combine_rgb, params, [filepath1, filepath2])
+    except ValueError:
+        return jsonify({'error': 'Invalid band or adjustment values'}), 400
+    except Exception as e:
+        logger.error(f"Error submitting rgb_combine job: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    status, result = job_queue.result(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if status == 'failed':
+        return jsonify(job_queue.status(job_id)), 500
+    if status != 'finished':
+        return jsonify({'job_id': job_id, 'status': status}), 202
+    # Result files are served through /uploads and /download
+    return jsonify({k: v for k, v in result.items() if k != 'path'})
+
 if __name__ == '__main__':
     logger.info("Starting Flask application...")
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    app.run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', host='127.0.0.1',
+            port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Safe band-math expressions such as "(TIR1 - TIR2) / (TIR1 + TIR2)" or
+"where(WV < 230, 1, 0)".
+
+Expressions are parsed with the ast module and only arithmetic, comparisons,
+boolean logic, numeric constants, band names and a fixed set of functions are
+allowed. Constants are evaluated as floats, powers need a small constant
+exponent and nesting depth is capped, so no expression can run away.
+
+When numexpr is installed (pip install numexpr, see the README) the
+expression is evaluated as one fused vectorized loop without full-size
+temporaries; otherwise NumPy is used, which allocates a full-size array for
+every intermediate result.
+"""
+import ast
+import numpy as np
+
+# numexpr is optional; it evaluates the whole expression in a single pass
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+FUNCTIONS = {
+    'where': np.where,
+    'sqrt': np.sqrt,
+    'log': np.log,
+    'log10': np.log10,
+    'exp': np.exp,
+    'abs': np.abs,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'arctan2': np.arctan2,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+}
+
+# Number of arguments each function takes; the rest take one
+FUNCTION_ARGS = {'where': 3, 'arctan2': 2, 'minimum': 2, 'maximum': 2}
+
+# Functions numexpr does not provide; expressions using them fall back to NumPy
+NUMPY_ONLY_FUNCTIONS = {'minimum', 'maximum'}
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp, ast.Call,
+    ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod,
+    ast.BitAnd, ast.BitOr, ast.Invert, ast.USub, ast.UAdd, ast.Not,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+    ast.And, ast.Or,
+)
+
+MAX_EXPRESSION_LENGTH = 1000
+# Largest allowed |exponent| in a ** b; b must be a numeric constant
+MAX_EXPONENT = 16
+MAX_DEPTH = 50
+
+
+class ExpressionError(ValueError):
+    """Raised for expressions that are invalid or use disallowed syntax"""
+
+
+class _ElementwiseLogic(ast.NodeTransformer):
+    """Rewrite and/or/not and chained comparisons into element-wise &, |, ~"""
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # a < b < c  ->  (a < b) & (b < c)
+        left = node.left
+        result = None
+        for op, right in zip(node.ops, node.comparators):
+            pair = ast.Compare(left=left, ops=[op], comparators=[right])
+            result = pair if result is None else ast.BinOp(left=result, op=ast.BitAnd(), right=pair)
+            left = right
+        return result
+
+
+class _FloatConstants(ast.NodeTransformer):
+    """Turn integer constants into floats so constant subexpressions never use big integers"""
+
+    def visit_Constant(self, node):
+        try:
+            return ast.copy_location(ast.Constant(value=float(node.value)), node)
+        except OverflowError:
+            raise ExpressionError('Numeric constant is too large')
+
+
+def _depth(tree):
+    """Nesting depth of an AST, computed without recursion"""
+    depth = 0
+    stack = [(tree, 1)]
+    while stack:
+        node, level = stack.pop()
+        depth = max(depth, level)
+        stack.extend((child, level + 1) for child in ast.iter_child_nodes(node))
+    return depth
+
+
+def _constant_exponent(node):
+    """The value of a constant exponent such as 2, 0.5 or -1, or None"""
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        node = node.operand
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return sign * node.value
+    return None
+
+
+class BandExpression:
+    """A parsed band-math expression over named bands"""
+
+    def __init__(self, source):
+        if not source or len(source) > MAX_EXPRESSION_LENGTH:
+            raise ExpressionError('Expression is empty or too long')
+        self.source = source
+
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ExpressionError(f'Invalid expression: {e.msg}')
+
+        if _depth(tree) > MAX_DEPTH:
+            raise ExpressionError('Expression is nested too deeply')
+
+        names = []
+        functions = set()
+        called = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ExpressionError(f'Unsupported syntax in expression: {type(node).__name__}')
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                    raise ExpressionError('Only these functions are allowed: ' + ', '.join(sorted(FUNCTIONS)))
+                if node.keywords:
+                    raise ExpressionError('Keyword arguments are not allowed')
+                expected = FUNCTION_ARGS.get(node.func.id, 1)
+                if len(node.args) != expected:
+                    raise ExpressionError(f'{node.func.id}() takes {expected} argument(s)')
+                functions.add(node.func.id)
+                called.add(id(node.func))
+            elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+                exponent = _constant_exponent(node.right)
+                if exponent is None or abs(exponent) > MAX_EXPONENT:
+                    raise ExpressionError(f'Exponents must be numeric constants no larger than {MAX_EXPONENT}')
+            elif isinstance(node, ast.Constant):
+                if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                    raise ExpressionError('Only numeric constants are allowed')
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id in FUNCTIONS:
+                # Function names may only be called, e.g. sqrt + WV is not a valid value
+                if id(node) not in called:
+                    raise ExpressionError(f"Function '{node.id}' must be called")
+            elif isinstance(node, ast.Name):
+                names.append(node)
+
+        if not names:
+            raise ExpressionError('Expression does not reference any bands')
+        # Band names in order of first appearance in the source
+        names.sort(key=lambda node: (node.lineno, node.col_offset))
+        self.names = list(dict.fromkeys(node.id for node in names))
+
+        tree = _FloatConstants().visit(_ElementwiseLogic().visit(tree))
+        tree = ast.fix_missing_locations(tree)
+        self._code = compile(tree, '<band-expression>', 'eval')
+        self._numexpr_source = None
+        if ne is not None and not (functions & NUMPY_ONLY_FUNCTIONS):
+            self._numexpr_source = ast.unparse(tree)
+
+    def evaluate(self, arrays, masks=None, dtype=np.float32, nodata=np.nan):
+        """
+        Evaluate the expression on same-shaped arrays keyed by band name.
+
+        masks: optional boolean arrays that are True where an input is nodata
+        Pixels that are nodata in any input, or whose result is not finite
+        (e.g. division by zero), are set to nodata in the output.
+        """
+        missing = [name for name in self.names if name not in arrays]
+        if missing:
+            raise ExpressionError(f"Missing bands: {', '.join(missing)}")
+
+        inputs = {name: np.asarray(arrays[name]).astype(dtype, copy=False) for name in self.names}
+        shape = inputs[self.names[0]].shape
+
+        try:
+            with np.errstate(all='ignore'):
+                if self._numexpr_source is not None:
+                    result = ne.evaluate(self._numexpr_source, local_dict=inputs)
+                else:
+                    result = eval(self._code, {'__builtins__': {}}, {**FUNCTIONS, **inputs})
+        except (ArithmeticError, TypeError, ValueError) as e:
+            # e.g. a constant subexpression that overflows, or a function given the wrong arguments
+            raise ExpressionError(f'Could not evaluate expression: {e}')
+
+        result = np.broadcast_to(np.asarray(result, dtype=dtype), shape).copy()
+        invalid = ~np.isfinite(result)
+        for mask in masks or []:
+            invalid |= mask
+        result[invalid] = nodata
+        return result
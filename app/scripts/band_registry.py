@@ -0,0 +1,194 @@
+"""
+Indexed registry of uploaded and converted rasters.
+
+Each raster is recorded with its band, product, timestamp, grid and path in a
+small SQLite database, so band lookups are exact, survive restarts and are
+shared by every app and converter. Lookups are served from an in-memory index
+that is reloaded whenever PRAGMA data_version shows another process has
+written to the database.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_FILENAME = '.band_registry.db'
+DEFAULT_REGISTRY_PATH = os.environ.get(
+    'BAND_REGISTRY_DB', os.path.join(SCRIPT_DIR, 'uploads', REGISTRY_FILENAME))
+
+# Converter outputs are named <PRODUCT>_<BAND>_<DATE>.tif, e.g. L1C_TIR1_01JAN2024.tif
+PRODUCT_NAME = re.compile(r'^(L1B|L1C|L2B|L2C)_(.+)_([^_]+)$', re.IGNORECASE)
+
+FIELDS = ('path', 'band', 'product', 'timestamp', 'grid', 'stem', 'registered')
+
+
+def parse_raster_name(filename):
+    """Split a raster filename into band, product and timestamp"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    match = PRODUCT_NAME.match(stem)
+    if match:
+        product, band, timestamp = match.groups()
+        return {'band': band, 'product': product.upper(), 'timestamp': timestamp}
+    # Otherwise the band is the last underscore-separated part of the name
+    return {'band': stem.split('_')[-1], 'product': None, 'timestamp': None}
+
+
+def grid_key(crs, width, height, geotransform):
+    """Identify a pixel grid by CRS, size and GDAL-ordered geotransform"""
+    transform = ','.join(f'{value:.9g}' for value in geotransform)
+    return f'{crs}|{width}x{height}|{transform}'
+
+
+def raster_grid(path):
+    """Read the grid key of a raster, or None if it cannot be opened"""
+    try:
+        from raster_io import open_raster
+        with open_raster(path) as src:
+            return grid_key(src.crs.to_string() if src.crs else None,
+                            src.width, src.height, src.transform.to_gdal())
+    except Exception:
+        return None
+
+
+class BandRegistry:
+    """SQLite-backed band index with an in-memory mirror"""
+
+    def __init__(self, db_path=DEFAULT_REGISTRY_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._data_version = None
+        self._by_band = {}
+        self._by_stem = {}
+        self._by_path = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rasters ('
+                'path TEXT PRIMARY KEY, band TEXT NOT NULL, product TEXT, '
+                'timestamp TEXT, grid TEXT, stem TEXT NOT NULL, registered REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS rasters_band ON rasters (band)')
+            conn.execute('CREATE INDEX IF NOT EXISTS rasters_stem ON rasters (stem)')
+            conn.commit()
+            self._sync()
+
+    def _connection(self):
+        # SQLite connections must not be shared with forked job workers
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._conn
+
+    def _sync(self):
+        """Reload the in-memory index if another connection has committed since the last load"""
+        conn = self._connection()
+        # data_version only changes for commits made through other connections
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return
+        self._by_band = {}
+        self._by_stem = {}
+        self._by_path = {}
+        for row in conn.execute(f"SELECT {', '.join(FIELDS)} FROM rasters"):
+            self._index(dict(zip(FIELDS, row)))
+        self._data_version = version
+
+    def _index(self, record):
+        self._drop(record['path'])
+        self._by_path[record['path']] = record
+        self._by_band.setdefault(record['band'], {})[record['path']] = record
+        self._by_stem.setdefault(record['stem'], {})[record['path']] = record
+
+    def _drop(self, path):
+        record = self._by_path.pop(path, None)
+        if record is not None:
+            self._by_band.get(record['band'], {}).pop(path, None)
+            self._by_stem.get(record['stem'], {}).pop(path, None)
+
+    def register(self, path, band=None, product=None, timestamp=None, grid=None, name=None):
+        """
+        Record a raster, replacing any earlier entry for the same path.
+
+        band, product and timestamp default to values parsed from name (or the
+        path); grid defaults to the raster's own grid.
+        """
+        path = os.path.abspath(path)
+        parsed = parse_raster_name(name or path)
+        record = {
+            'path': path,
+            'band': band or parsed['band'],
+            'product': product or parsed['product'],
+            'timestamp': timestamp or parsed['timestamp'],
+            'grid': grid or raster_grid(path),
+            'stem': os.path.splitext(os.path.basename(name or path))[0],
+            'registered': time.time(),
+        }
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                f"INSERT OR REPLACE INTO rasters ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                [record[field] for field in FIELDS])
+            conn.commit()
+            self._index(record)
+        return record
+
+    def remove(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM rasters WHERE path = ?', (path,))
+            conn.commit()
+            self._drop(path)
+
+    def find(self, band, product=None, grid=None):
+        """Return existing records for a band (or file stem), newest first"""
+        with self._lock:
+            self._sync()
+            records = list(self._by_band.get(band, {}).values()) or list(self._by_stem.get(band, {}).values())
+
+        stale = [record['path'] for record in records if not os.path.exists(record['path'])]
+        for path in stale:
+            self.remove(path)
+
+        records = [record for record in records
+                   if record['path'] not in stale
+                   and (product is None or record['product'] == product)
+                   and (grid is None or record['grid'] == grid)]
+        return sorted(records, key=lambda record: record['registered'], reverse=True)
+
+    def lookup(self, band, product=None, grid=None):
+        """Path of the newest raster for a band, or None"""
+        records = self.find(band, product, grid)
+        return records[0]['path'] if records else None
+
+    def scan(self, folder):
+        """Register rasters in a folder that are not yet in the registry"""
+        with self._lock:
+            self._sync()
+            known = set(self._by_path)
+        for filename in os.listdir(folder):
+            path = os.path.abspath(os.path.join(folder, filename))
+            if filename.startswith('.') or not filename.lower().endswith(('.tif', '.tiff')):
+                continue
+            if path not in known:
+                self.register(path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(db_path=DEFAULT_REGISTRY_PATH):
+    """Shared registry instance for this process"""
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.db_path != db_path:
+            _registry = BandRegistry(db_path)
+        return _registry
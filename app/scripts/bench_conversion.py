@@ -0,0 +1,229 @@
+"""
+Benchmark the H5 to GeoTIFF converters on synthetic INSAT-3DR products.
+
+Each product is generated once with synthetic_h5.py, then every
+(converter, product) case runs in its own interpreter so peak RSS is measured
+per case. Cases record wall time, peak RSS and bytes read (the process's
+read() volume from /proc/self/io) for each stage, the H5 dataset bytes fetched
+by h5_reader, and the total size of the GeoTIFFs written. Results are saved
+as JSON so runs can be compared over time.
+
+Converters: conversion_script (app/scripts/conversion_script.py), convert
+(the Lambda variant, app/scripts/convert.py) and convertyogi
+(scripts/convertyogi.py, L1B only).
+
+Usage: python app/scripts/bench_conversion.py [--products L1B L1C] [--scale 0.25]
+                                               [--converters conversion_script] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
+
+CONVERTERS = ('conversion_script', 'convert', 'convertyogi')
+PRODUCTS = ('L1B', 'L1C', 'L2B', 'L2C')
+# convertyogi handles one L1B channel per run
+YOGI_DATASET = 'IMG_TIR1'
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def io_read_bytes():
+    """Bytes this process has read through read() calls so far (Linux only)"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class StageTimer:
+    """Wall time, peak RSS and bytes read for each stage of a case"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, *args):
+        read_before = io_read_bytes()
+        start = time.perf_counter()
+        result = func(*args)
+        read_after = io_read_bytes()
+        self.stages[name] = {
+            'seconds': time.perf_counter() - start,
+            'peak_rss_mb': peak_rss_mb(),
+            'read_bytes': read_after - read_before if read_before is not None else None,
+        }
+        return result
+
+
+def output_size(output_dir):
+    return sum(
+        os.path.getsize(os.path.join(output_dir, filename))
+        for filename in os.listdir(output_dir)
+        if filename.lower().endswith(('.tif', '.tiff'))
+    )
+
+
+def run_module_converter(module_name, h5_path, output_dir, timer):
+    """Stages of conversion_script.py / convert.py: import, open, convert"""
+    import importlib
+    from h5_reader import H5Reader
+
+    module = timer.run('import', importlib.import_module, module_name)
+    filename = os.path.basename(h5_path)
+    file_parts = filename.split('_')
+    date_str = file_parts[1]
+    product_type = file_parts[3]
+    process = getattr(module, f'process_{product_type.lower()}_data')
+
+    h5_data = timer.run('open', H5Reader, h5_path)
+    try:
+        timer.run('convert', process, h5_data, date_str, output_dir)
+    finally:
+        h5_data.close()
+    return h5_data.bytes_read
+
+
+def run_yogi(h5_path, output_dir, timer):
+    """Stages of convertyogi.B_Level.process_h5_to_geotiff, timed one by one"""
+    import importlib
+
+    module = timer.run('import', importlib.import_module, 'convertyogi')
+    processor = module.B_Level(h5_path)
+    base = os.path.join(output_dir, 'L1B')
+    temp_tiff = f'{base}_{YOGI_DATASET}_geos.tif'
+    wgs84_tiff = f'{base}_{YOGI_DATASET}_wgs84.tif'
+    cog_tiff = f'{base}_{YOGI_DATASET}_wgs84_cog.tif'
+
+    data = timer.run('read', processor.read_h5_data, YOGI_DATASET)
+    filtered = timer.run('filter', processor.filter_cold_space, data)
+    timer.run('geotiff', processor.save_as_geotiff, filtered, temp_tiff)
+    timer.run('reproject', processor.reproject_to_wgs84, temp_tiff, wgs84_tiff)
+    timer.run('cog', processor.create_cog, wgs84_tiff, cog_tiff)
+
+
+def run_case(case):
+    """Child side: run one case and write its result JSON"""
+    sys.path[:0] = [SCRIPT_DIR, os.path.join(ROOT_DIR, 'scripts')]
+    timer = StageTimer()
+    result = {'converter': case['converter'], 'product': case['product']}
+    start = time.perf_counter()
+    try:
+        if case['converter'] == 'convertyogi':
+            run_yogi(case['h5_path'], case['output_dir'], timer)
+        else:
+            result['h5_bytes_read'] = run_module_converter(
+                case['converter'], case['h5_path'], case['output_dir'], timer)
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['stages'] = timer.stages
+    result['output_bytes'] = output_size(case['output_dir'])
+    result['outputs'] = sorted(f for f in os.listdir(case['output_dir']) if f.lower().endswith('.tif'))
+
+    with open(case['result_path'], 'w') as f:
+        json.dump(result, f)
+
+
+def spawn_case(case, work_dir, no_direct_chunks=False):
+    result_path = os.path.join(work_dir, f"{case['converter']}_{case['product']}.json")
+    case = dict(case, result_path=result_path)
+    env = dict(os.environ, BAND_REGISTRY_DB=os.path.join(work_dir, 'band_registry.db'))
+    if no_direct_chunks:
+        env['H5_DIRECT_CHUNKS'] = '0'
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    if not os.path.exists(result_path):
+        return {'converter': case['converter'], 'product': case['product'],
+                'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip()
+                else f'exit code {completed.returncode}'}
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the H5 to GeoTIFF converters')
+    parser.add_argument('--products', nargs='+', default=list(PRODUCTS), choices=PRODUCTS)
+    parser.add_argument('--converters', nargs='+', default=list(CONVERTERS), choices=CONVERTERS)
+    parser.add_argument('--scale', type=float, default=1.0, help='Scale factor for the synthetic grid sizes')
+    parser.add_argument('--chunk-size', type=int, help='Chunk the synthetic datasets (default contiguous)')
+    parser.add_argument('--compression', help='HDF5 filter for the synthetic datasets, e.g. gzip')
+    parser.add_argument('--no-direct-chunks', action='store_true',
+                        help='Read chunked data through the HDF5 pipeline instead of direct chunk reads')
+    parser.add_argument('--work-dir', help='Keep inputs and outputs here instead of a temporary directory')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(json.loads(args.case))
+        return
+
+    from synthetic_h5 import generate
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_conversion_')
+    os.makedirs(work_dir, exist_ok=True)
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'scale': args.scale,
+        'chunk_size': args.chunk_size,
+        'compression': args.compression,
+        'direct_chunks': not args.no_direct_chunks,
+        'inputs': {},
+        'cases': [],
+    }
+    try:
+        for product in args.products:
+            start = time.perf_counter()
+            h5_path = generate(product, os.path.join(work_dir, 'input'), args.scale,
+                               args.chunk_size, args.compression)
+            results['inputs'][product] = {
+                'filename': os.path.basename(h5_path),
+                'bytes': os.path.getsize(h5_path),
+                'generate_seconds': time.perf_counter() - start,
+            }
+
+            for converter in args.converters:
+                if converter == 'convertyogi' and product != 'L1B':
+                    continue
+                output_dir = os.path.join(work_dir, 'output', converter, product)
+                os.makedirs(output_dir, exist_ok=True)
+                case = {'converter': converter, 'product': product,
+                        'h5_path': h5_path, 'output_dir': output_dir}
+                result = spawn_case(case, work_dir, args.no_direct_chunks)
+                results['cases'].append(result)
+                status = result.get('error') or f"{result['seconds']:.2f}s, {result['peak_rss_mb']:.0f} MB peak"
+                print(f"{converter} {product}: {status}", file=sys.stderr)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare the LUT-based RGB adjustment kernel with the previous implementations.
+
+The PIL case is the ImageEnhance chain used by band-arithmetic.py and
+rgb_processor.py; the linear case is the float64/HSV code from process_rgb.py.
+Both run on a synthetic composite (full-disk size by default) or on the first
+three bands of a GeoTIFF, and report timings, speedup and the largest
+per-pixel difference.
+
+Usage: python app/scripts/bench_rgb_adjust.py [--size 2816] [--tiff path.tif] [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from rgb_adjust import enhance_rgb, linear_adjust_rgb
+
+
+def pil_chain(rgb, brightness, contrast, saturation):
+    img = Image.fromarray(rgb)
+    if brightness != 0:
+        img = ImageEnhance.Brightness(img).enhance(1 + brightness / 100)
+    if contrast != 0:
+        img = ImageEnhance.Contrast(img).enhance(1 + contrast / 100)
+    if saturation != 0:
+        img = ImageEnhance.Color(img).enhance(1 + saturation / 100)
+    return np.asarray(img)
+
+
+def hsv_chain(rgb, brightness, contrast, saturation):
+    img = rgb.astype(float)
+    if brightness != 0:
+        img += (brightness / 100.0) * 255
+    if contrast != 0:
+        factor = (259 * (contrast + 255)) / (255 * (259 - contrast))
+        img = factor * (img - 128) + 128
+    if saturation != 0:
+        hsv = Image.fromarray(np.uint8(np.clip(img, 0, 255))).convert('HSV')
+        h, s, v = hsv.split()
+        s = np.clip(np.array(s) * (1 + saturation / 100.0), 0, 255)
+        img = np.array(Image.merge('HSV', (h, Image.fromarray(np.uint8(s)), v)).convert('RGB'))
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def new_enhance(rgb, brightness, contrast, saturation):
+    return enhance_rgb(rgb, 1 + brightness / 100, 1 + contrast / 100, 1 + saturation / 100)
+
+
+def time_call(func, runs, *args):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        samples.append(time.perf_counter() - start)
+    return result, statistics.median(samples) * 1000
+
+
+def compare(old, new, runs, rgb, adjustments):
+    old_result, old_ms = time_call(old, runs, rgb, *adjustments)
+    new_result, new_ms = time_call(new, runs, rgb, *adjustments)
+    diff = np.abs(old_result.astype(np.int16) - new_result.astype(np.int16))
+    return {
+        'old_ms': old_ms,
+        'new_ms': new_ms,
+        'speedup': old_ms / new_ms if new_ms > 0 else float('inf'),
+        'max_diff': int(diff.max()),
+        'mean_diff': float(diff.mean()),
+    }
+
+
+def load_composite(tiff):
+    import rasterio
+    with rasterio.open(tiff) as src:
+        bands = src.read([1, 2, 3]).astype(np.float32)
+    # Percentile stretch each band to 8 bits
+    low, high = np.nanpercentile(bands, (2, 98), axis=(1, 2))
+    scaled = (bands - low[:, None, None]) / np.maximum(high - low, 1e-6)[:, None, None] * 255
+    return np.clip(np.nan_to_num(scaled), 0, 255).astype(np.uint8).transpose(1, 2, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the RGB adjustment kernel')
+    parser.add_argument('--size', type=int, default=2816, help='Side of the synthetic composite in pixels')
+    parser.add_argument('--tiff', help='Use the first three bands of this GeoTIFF instead')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per implementation (median is reported)')
+    parser.add_argument('--brightness', type=float, default=20)
+    parser.add_argument('--contrast', type=float, default=30)
+    parser.add_argument('--saturation', type=float, default=40)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.tiff:
+        rgb = load_composite(args.tiff)
+    else:
+        rng = np.random.default_rng(0)
+        rgb = rng.integers(0, 256, size=(args.size, args.size, 3), dtype=np.uint8)
+
+    adjustments = (args.brightness, args.contrast, args.saturation)
+    results = {
+        'shape': list(rgb.shape),
+        'adjustments': dict(zip(('brightness', 'contrast', 'saturation'), adjustments)),
+        'enhance': compare(pil_chain, new_enhance, args.runs, rgb, adjustments),
+        'linear': compare(hsv_chain, linear_adjust_rgb, args.runs, rgb, adjustments),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
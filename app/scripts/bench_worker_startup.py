@@ -0,0 +1,121 @@
+"""
+Compare per-request process spawning against the warm worker service.
+
+Spawn mode runs a fresh interpreter that imports the raster modules, as the
+Next.js routes did for every request. Worker mode starts worker_service.py once
+and times HTTP round trips to it. With --tiff both modes also run a real profile
+request on that file.
+
+Usage: python app/scripts/bench_worker_startup.py [--runs 10] [--tiff path.tif]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
+
+IMPORT_SNIPPET = (
+    "import sys; sys.path[:0] = [{!r}, {!r}]; "
+    "import process_rgb, pathProfile, tiff_csv, download_region"
+).format(SCRIPT_DIR, ROOT_DIR)
+
+
+def summarize(samples):
+    return {
+        'runs': len(samples),
+        'mean_ms': statistics.mean(samples) * 1000,
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': min(samples) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+
+def time_spawn(runs, tiff=None):
+    samples = []
+    for _ in range(runs):
+        if tiff:
+            cmd = [sys.executable, os.path.join(SCRIPT_DIR, 'pathProfile.py'), tiff, '[1, 1]', '[10, 10]']
+        else:
+            cmd = [sys.executable, '-c', IMPORT_SNIPPET]
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def request_worker(url, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req) as response:
+        return response.read()
+
+
+def wait_for_worker(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            request_worker(f'{base_url}/health')
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    raise RuntimeError(f'Worker at {base_url} did not start within {timeout}s')
+
+
+def time_worker(runs, port, tiff=None):
+    base_url = f'http://127.0.0.1:{port}'
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPT_DIR, 'worker_service.py'), '--port', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_worker(base_url)
+        startup = time.perf_counter() - start
+
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            if tiff:
+                request_worker(f'{base_url}/profile', {'image_path': tiff, 'start': [1, 1], 'end': [10, 10]})
+            else:
+                request_worker(f'{base_url}/health')
+            samples.append(time.perf_counter() - start)
+        result = summarize(samples)
+        result['startup_ms'] = startup * 1000
+        return result
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark spawn-per-request against the warm worker')
+    parser.add_argument('--runs', type=int, default=10, help='Requests per mode')
+    parser.add_argument('--port', type=int, default=5099, help='Port for the temporary worker')
+    parser.add_argument('--tiff', help='Optional GeoTIFF to run a real profile request against')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    tiff = os.path.abspath(args.tiff) if args.tiff else None
+    results = {
+        'task': 'profile' if tiff else 'imports',
+        'spawn': time_spawn(args.runs, tiff),
+        'worker': time_worker(args.runs, args.port, tiff),
+    }
+    results['speedup'] = results['spawn']['mean_ms'] / results['worker']['mean_ms']
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+CHUNK_SIZE = 1024 * 1024
+BLOB_DIRNAME = '.blobs'
+
+# Digests of files already hashed, keyed by inode so hard-linked aliases share entries
+_digest_cache = {}
+
+
+def blob_folder(upload_folder):
+    """Return the content-addressed blob directory inside an upload folder"""
+    folder = os.path.join(upload_folder, BLOB_DIRNAME)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _link_alias(blob_path, alias_path):
+    """Point alias_path at blob_path without copying the data if possible"""
+    if os.path.abspath(blob_path) == os.path.abspath(alias_path):
+        return
+    if os.path.lexists(alias_path):
+        os.remove(alias_path)
+    # An external overview built for the old content would be used for the new one
+    if os.path.lexists(alias_path + '.ovr'):
+        os.remove(alias_path + '.ovr')
+    try:
+        # A hard link is a metadata-only alias of the stored blob
+        os.link(blob_path, alias_path)
+    except OSError:
+        shutil.copyfile(blob_path, alias_path)
+
+
+def save_upload(file, upload_folder, alias_path=None):
+    """
+    Stream an uploaded file to disk while hashing it and store it under its content hash.
+
+    file: werkzeug FileStorage (or any object with a readable .stream / .read)
+    alias_path: optional path that should refer to the stored content afterwards
+
+    Returns (content_hash, blob_path, duplicate) where duplicate is True when the
+    same content was already stored and no new copy was written.
+    """
+    folder = blob_folder(upload_folder)
+    stream = getattr(file, 'stream', file)
+    ext = os.path.splitext(getattr(file, 'filename', '') or '')[1].lower() or '.tif'
+
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        content_hash = digest.hexdigest()
+        blob_path = os.path.join(folder, content_hash + ext)
+        duplicate = os.path.exists(blob_path)
+        if duplicate:
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, blob_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if alias_path:
+        _link_alias(blob_path, alias_path)
+
+    _digest_cache[_stat_key(blob_path)] = content_hash
+    return content_hash, blob_path, duplicate
+
+
+def file_digest(path):
+    """Return the SHA-256 of a file on disk, reusing earlier results when unchanged"""
+    key = _stat_key(path)
+    cached = _digest_cache.get(key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    _digest_cache[key] = digest.hexdigest()
+    return _digest_cache[key]
+
+
+class ContentCache:
+    """Small thread-safe LRU cache for values derived from content hashes"""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def pop(self, key):
+        with self._lock:
+            return self._items.pop(key, None)
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return value
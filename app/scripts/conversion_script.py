@@ -1,9 +1,15 @@
-import h5py
 import numpy as np
 from osgeo import gdal, osr
 import os
 from scipy.interpolate import griddata
 
+from band_registry import get_registry, grid_key
+from h5_reader import H5Reader
+from raster_io import configure_gdal
+
+# Shared GDAL tuning: block cache size and COG writer threads
+configure_gdal()
+
 # Add these at the beginning of your script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_DIR = os.path.join(SCRIPT_DIR, 'input')
@@ -13,6 +19,9 @@ OUTPUT_DIR = os.path.join(SCRIPT_DIR, 'output')
 os.makedirs(INPUT_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Rows copied per write to the tiled output; a multiple of the 256-row tile height
+WRITE_BLOCK_ROWS = 1024
+
 def convert_coordinates(lat, lon, channel_type):
     """Convert scaled integer coordinates to actual lat/lon values"""
     scale = 10000.0 if channel_type == 'VIS' else 100.0
@@ -27,14 +36,31 @@ def convert_coordinates(lat, lon, channel_type):
     
     return lat_scaled, lon_scaled
 
-def create_geotiff(data, band_name, lat, lon, output_path, product_type, nodata_value=0):
-    """Create GeoTIFF with common parameters"""
-    height, width = data.shape
-    x_min, x_max = float(lon.min()), float(lon.max())
-    y_min, y_max = float(lat.min()), float(lat.max())
-    
-    pixel_size_x = (x_max - x_min) / (width - 1)
-    pixel_size_y = (y_max - y_min) / (height - 1)
+def regular_geotransform(h5_data, rows, cols):
+    """
+    GDAL geotransform of a regular L1C/L2C grid from the file's bound attributes.
+
+    The attributes are the centres of the corner pixels, so the origin is moved
+    out by half a pixel to the outer edge.
+    """
+    left_lon = h5_data.attr('left_longitude')
+    right_lon = h5_data.attr('right_longitude')
+    upper_lat = h5_data.attr('upper_latitude')
+    lower_lat = h5_data.attr('lower_latitude')
+
+    pixel_size_x = (right_lon - left_lon) / (cols - 1)
+    pixel_size_y = (upper_lat - lower_lat) / (rows - 1)
+    return (left_lon - pixel_size_x / 2, pixel_size_x, 0,
+            upper_lat + pixel_size_y / 2, 0, -pixel_size_y)
+
+def create_geotiff(h5_data, dataset_name, band_name, geotransform, output_path, product_type, nodata_value=0):
+    """
+    Create GeoTIFF with common parameters.
+
+    The first time step of the H5 image is copied in row blocks, so the full
+    image is never held in memory.
+    """
+    height, width = h5_data.shape(dataset_name)
     
     driver = gdal.GetDriverByName('GTiff')
     ds = driver.Create(
@@ -46,19 +72,26 @@ def create_geotiff(data, band_name, lat, lon, output_path, product_type, nodata_
         options=['COMPRESS=DEFLATE', 'PREDICTOR=2', 'ZLEVEL=9', 'TILED=YES']
     )
     
-    ds.SetGeoTransform((x_min, pixel_size_x, 0, y_max, 0, -pixel_size_y))
+    ds.SetGeoTransform(geotransform)
     srs = osr.SpatialReference()
     srs.ImportFromEPSG(4326)
     ds.SetProjection(srs.ExportToWkt())
     
     band = ds.GetRasterBand(1)
     band.SetNoDataValue(nodata_value)
-    band.WriteArray(data)
+    # Whole rows of 256x256 tiles per write
+    for start in range(0, height, WRITE_BLOCK_ROWS):
+        stop = min(start + WRITE_BLOCK_ROWS, height)
+        band.WriteArray(h5_data.read(dataset_name, start, stop), 0, start)
     band.SetDescription(band_name)
     band.ComputeStatistics(False)
     
     ds = None
 
+    # Make the output available to the apps by exact band name
+    get_registry().register(output_path, band=band_name, product=product_type,
+                            grid=grid_key('EPSG:4326', width, height, geotransform))
+
 def process_l1b_data(h5_data, date_str, output_dir):
     """Process L1B data"""
     for dataset_name in h5_data:
@@ -67,24 +100,22 @@ def process_l1b_data(h5_data, date_str, output_dir):
             
         try:
             # Get data
-            data = h5_data[dataset_name][:]
-            if len(data.shape) > 2:
-                data = data[0]
+            data = h5_data.read(dataset_name)
             if data is None or len(data.shape) != 2:
                 continue
             
             # Get coordinates based on channel type
             if dataset_name.startswith(('IMG_VIS', 'IMG_SWIR')):
-                lat = h5_data['Latitude_VIS'][:]
-                lon = h5_data['Longitude_VIS'][:]
+                lat = h5_data.read('Latitude_VIS')
+                lon = h5_data.read('Longitude_VIS')
                 lat, lon = convert_coordinates(lat, lon, 'VIS')
             elif dataset_name.startswith('IMG_WV'):
-                lat = h5_data['Latitude_WV'][:]
-                lon = h5_data['Longitude_WV'][:]
+                lat = h5_data.read('Latitude_WV')
+                lon = h5_data.read('Longitude_WV')
                 lat, lon = convert_coordinates(lat, lon, 'WV')
             else:
-                lat = h5_data['Latitude'][:]
-                lon = h5_data['Longitude'][:]
+                lat = h5_data.read('Latitude')
+                lon = h5_data.read('Longitude')
                 lat, lon = convert_coordinates(lat, lon, 'IR')
 
             # Ensure data and coordinates are valid
@@ -198,25 +229,17 @@ def process_l1b_data(h5_data, date_str, output_dir):
 
 def process_l1c_data(h5_data, date_str, output_dir):
     """Process L1C data"""
-    # Get boundary coordinates
-    left_lon = float(h5_data.attrs['left_longitude'][()])
-    right_lon = float(h5_data.attrs['right_longitude'][()])
-    upper_lat = float(h5_data.attrs['upper_latitude'][()])
-    lower_lat = float(h5_data.attrs['lower_latitude'][()])
-    
     # Process each band
     for band_name in ['WV', 'TIR1', 'TIR2', 'MIR', 'SWIR', 'VIS']:
         try:
-            data = h5_data[f'IMG_{band_name}'][0,:,:]
-            rows, cols = data.shape
+            dataset_name = f'IMG_{band_name}'
+            rows, cols = h5_data.shape(dataset_name)
             
-            # Create coordinate grids
-            lats = np.linspace(upper_lat, lower_lat, rows)
-            lons = np.linspace(left_lon, right_lon, cols)
-            lon, lat = np.meshgrid(lons, lats)
+            # Regular grid: the geotransform comes straight from the bound attributes
+            geotransform = regular_geotransform(h5_data, rows, cols)
             
             output_file = os.path.join(output_dir, f'L1C_{band_name}_{date_str}.tif')
-            create_geotiff(data, band_name, lat, lon, output_file, 'L1C', nodata_value=-999)
+            create_geotiff(h5_data, dataset_name, band_name, geotransform, output_file, 'L1C', nodata_value=-999)
             
         except Exception as e:
             print(f"Error processing {band_name}: {str(e)}")
@@ -229,13 +252,11 @@ def process_l2b_data(h5_data, date_str, output_dir):
             
         try:
             # Get data
-            data = h5_data[dataset_name][:]
-            if len(data.shape) > 2:
-                data = data[0]
+            data = h5_data.read(dataset_name)
             
             # Get coordinates
-            lat = h5_data['Latitude'][:]
-            lon = h5_data['Longitude'][:]
+            lat = h5_data.read('Latitude')
+            lon = h5_data.read('Longitude')
             lat, lon = convert_coordinates(lat, lon, 'IR')
 
             # Create masks
@@ -331,25 +352,13 @@ def process_l2b_data(h5_data, date_str, output_dir):
 
 def process_l2c_data(h5_data, date_str, output_dir):
     """Process L2C data"""
-    # Get boundary coordinates
-    left_lon = float(h5_data.attrs['left_longitude'][()])
-    right_lon = float(h5_data.attrs['right_longitude'][()])
-    upper_lat = float(h5_data.attrs['upper_latitude'][()])
-    lower_lat = float(h5_data.attrs['lower_latitude'][()])
-    
     for param in ['DHI', 'DNI', 'GHI', 'INS']:
         try:
-            data = h5_data[param][:]
-            if len(data.shape) > 2:
-                data = data[0]
-            
-            rows, cols = data.shape
-            lats = np.linspace(upper_lat, lower_lat, rows)
-            lons = np.linspace(left_lon, right_lon, cols)
-            lon, lat = np.meshgrid(lons, lats)
+            rows, cols = h5_data.shape(param)
+            geotransform = regular_geotransform(h5_data, rows, cols)
             
             output_file = os.path.join(output_dir, f'L2C_{param}_{date_str}.tif')
-            create_geotiff(data, param, lat, lon, output_file, 'L2C')
+            create_geotiff(h5_data, param, param, geotransform, output_file, 'L2C')
             
         except Exception as e:
             print(f"Error processing {param}: {str(e)}")
@@ -386,7 +395,7 @@ def main():
     
     try:
         print(f"\nProcessing {h5_file}...")
-        with h5py.File(h5_path, 'r') as h5_data:
+        with H5Reader(h5_path) as h5_data:
             if product_type.startswith('L1B'):
                 process_l1b_data(h5_data, date_str, OUTPUT_DIR)
             elif product_type.startswith('L1C'):
@@ -0,0 +1,147 @@
+"""
+Chunk-aware HDF5 reads for the INSAT converters.
+
+H5Reader wraps an h5py file. Each dataset is opened with its own chunk cache,
+sized so that a full row of chunks stays cached while row blocks are read
+(h5py's 1 MB default thrashes on large chunked images). Images are read as
+hyperslabs of the requested time step and rows only. Uncompressed chunked
+data can be read with direct chunk reads, which bypass the filter pipeline
+and the cache. bytes_read counts the dataset bytes fetched, for benchmarks.
+"""
+import math
+import os
+
+import h5py
+import numpy as np
+
+# Upper bound for one dataset's chunk cache
+MAX_CACHE_BYTES = int(os.environ.get('H5_CHUNK_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+# h5py's own default, used as the lower bound
+MIN_CACHE_BYTES = 1024 ** 2
+# Direct chunk reads for uncompressed chunked data; set H5_DIRECT_CHUNKS=0 to compare
+DIRECT_CHUNKS = os.environ.get('H5_DIRECT_CHUNKS', '1') != '0'
+
+
+def next_prime(n):
+    """Smallest prime >= n (HDF5 recommends a prime number of hash slots)"""
+    n = max(2, int(n))
+    while any(n % d == 0 for d in range(2, int(math.isqrt(n)) + 1)):
+        n += 1
+    return n
+
+
+def chunk_cache_size(shape, chunks, itemsize, max_bytes=MAX_CACHE_BYTES):
+    """
+    rdcc_nbytes and rdcc_nslots for a chunked dataset.
+
+    The cache holds one full row of chunks across the image width, so reading
+    row blocks touches every chunk once; slots are ~100x the cached chunks.
+    """
+    chunk_bytes = int(np.prod(chunks)) * itemsize
+    chunks_per_row = math.ceil(shape[-1] / chunks[-1])
+    nbytes = min(max(chunk_bytes * chunks_per_row, MIN_CACHE_BYTES), max_bytes)
+    nslots = next_prime(100 * max(1, nbytes // chunk_bytes))
+    return nbytes, nslots
+
+
+class H5Reader:
+    """Read-only INSAT H5 file with hyperslab and direct chunk reads"""
+
+    def __init__(self, path, direct_chunks=DIRECT_CHUNKS, max_cache_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.file = h5py.File(path, 'r')
+        self.attrs = self.file.attrs
+        self.direct_chunks = direct_chunks
+        self.max_cache_bytes = max_cache_bytes
+        self.bytes_read = 0
+        self._datasets = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._datasets = {}
+        self.file.close()
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __contains__(self, name):
+        return name in self.file
+
+    def attr(self, name):
+        """File attribute as a float; INSAT files store these as one-element arrays"""
+        return float(np.ravel(self.attrs[name])[0])
+
+    def dataset(self, name):
+        """The dataset opened with a chunk cache sized to its layout"""
+        if name not in self._datasets:
+            dataset = self.file[name]
+            if dataset.chunks is not None:
+                nbytes, nslots = chunk_cache_size(dataset.shape, dataset.chunks,
+                                                  dataset.dtype.itemsize, self.max_cache_bytes)
+                dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+                dapl.set_chunk_cache(nslots, nbytes, 0.75)
+                dataset = h5py.Dataset(h5py.h5d.open(self.file.id, name.encode(), dapl=dapl))
+            self._datasets[name] = dataset
+        return self._datasets[name]
+
+    def shape(self, name):
+        """(rows, cols) of an image, ignoring the time axis"""
+        return self.dataset(name).shape[-2:]
+
+    def read(self, name, start=None, stop=None, time_index=0):
+        """
+        Rows [start, stop) of one time step of an image (all rows by default).
+
+        2D datasets such as Latitude have no time axis; 1D datasets such as
+        lookup tables are returned whole.
+        """
+        dataset = self.dataset(name)
+        if dataset.ndim < 2:
+            data = dataset[()]
+            self.bytes_read += data.nbytes
+            return data
+
+        rows, cols = dataset.shape[-2:]
+        start = 0 if start is None else start
+        stop = rows if stop is None else min(stop, rows)
+        out = np.empty((stop - start, cols), dtype=dataset.dtype)
+        if self._can_read_direct(dataset):
+            self._read_chunks(dataset, out, start, stop, time_index)
+        else:
+            selection = np.s_[time_index, start:stop, :] if dataset.ndim == 3 else np.s_[start:stop, :]
+            dataset.read_direct(out, source_sel=selection)
+            self.bytes_read += out.nbytes
+        return out
+
+    def _can_read_direct(self, dataset):
+        return (self.direct_chunks and dataset.chunks is not None and dataset.ndim in (2, 3)
+                and dataset.id.get_create_plist().get_nfilters() == 0)
+
+    def _read_chunks(self, dataset, out, start, stop, time_index):
+        """Copy the chunks covering rows [start, stop) straight into out"""
+        chunk_rows, chunk_cols = dataset.chunks[-2:]
+        rows, cols = dataset.shape[-2:]
+        chunk_shape = dataset.chunks
+        first = start - start % chunk_rows
+        for row in range(first, stop, chunk_rows):
+            for col in range(0, cols, chunk_cols):
+                offset = (row, col) if dataset.ndim == 2 else (time_index - time_index % chunk_shape[0], row, col)
+                if dataset.id.get_chunk_info_by_coord(offset).byte_offset is None:
+                    # Unallocated chunk: never written, so it holds the fill value
+                    chunk = np.full(chunk_shape, dataset.fillvalue, dtype=dataset.dtype)
+                else:
+                    _, raw = dataset.id.read_direct_chunk(offset)
+                    chunk = np.frombuffer(raw, dtype=dataset.dtype).reshape(chunk_shape)
+                    self.bytes_read += len(raw)
+                if dataset.ndim == 3:
+                    chunk = chunk[time_index % chunk_shape[0]]
+
+                # Overlap of this chunk with the requested rows and the image edge
+                top, bottom = max(row, start), min(row + chunk_rows, stop)
+                right = min(col + chunk_cols, cols)
+                out[top - start:bottom - start, col:right] = chunk[top - row:bottom - row, :right - col]
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS', max(1, min(4, (os.cpu_count() or 2) - 1))))
+DEFAULT_MAX_PENDING = 32
+# Finished and failed jobs are kept for this many seconds, and at most this many of them
+FINISHED_TTL = int(os.environ.get('JOB_QUEUE_FINISHED_TTL', 3600))
+MAX_FINISHED = int(os.environ.get('JOB_QUEUE_MAX_FINISHED', 256))
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue already holds the maximum number of pending jobs"""
+
+
+def job_key(name, params):
+    """Build a cache key from a job name and its JSON-serialisable input parameters"""
+    payload = json.dumps({'name': name, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class JobQueue:
+    """
+    Local background job queue backed by a bounded process pool.
+
+    Jobs are submitted with the parameters that identify them; a job with the same
+    parameters as a queued, running or finished job reuses that job instead of
+    running again. No external broker is needed.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 finished_ttl=FINISHED_TTL, max_finished=MAX_FINISHED):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.finished_ttl = finished_ttl
+        self.max_finished = max_finished
+        self._executor = None
+        self._jobs = {}
+        self._by_key = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Start the pool lazily so importing the module does not fork workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+
+    def submit(self, name, func, params, cache_params=None):
+        """
+        Queue func(**params) and return the job id.
+
+        cache_params overrides the values used for result caching, e.g. content
+        hashes of the input files instead of their paths.
+        """
+        key = job_key(name, cache_params if cache_params is not None else params)
+        with self._lock:
+            self._evict()
+            existing = self._by_key.get(key)
+            if existing and self._is_reusable(self._jobs[existing]):
+                return existing
+
+            pending = sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise QueueFullError(f'Job queue is full ({pending} pending jobs)')
+
+            job_id = str(uuid.uuid4())
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'name': name,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            self._by_key[key] = job_id
+
+        try:
+            future = self._get_executor().submit(func, **params)
+        except Exception as e:
+            # e.g. a broken or shut down pool: fail the job so the key can be retried
+            with self._lock:
+                job = self._jobs[job_id]
+                job['status'] = 'failed'
+                job['error'] = str(e)
+                job['finished_at'] = time.time()
+                if self._by_key.get(key) == job_id:
+                    del self._by_key[key]
+            raise
+
+        # Register the future before the callback can run and pop it
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _evict(self):
+        """Drop finished and failed jobs past the TTL, then the oldest beyond max_finished"""
+        done = sorted(
+            (job for job in self._jobs.values() if job['status'] in ('finished', 'failed')),
+            key=lambda job: job['finished_at']
+        )
+        cutoff = time.time() - self.finished_ttl
+        expired = [job for job in done if job['finished_at'] < cutoff]
+        remaining = len(done) - len(expired)
+        if remaining > self.max_finished:
+            expired = done[:len(done) - self.max_finished]
+        if not expired:
+            return
+
+        expired_ids = {job['job_id'] for job in expired}
+        for job_id in expired_ids:
+            del self._jobs[job_id]
+        for key in [k for k, job_id in self._by_key.items() if job_id in expired_ids]:
+            del self._by_key[key]
+
+    @staticmethod
+    def _is_reusable(job):
+        if job['status'] == 'failed':
+            return False
+        # Finished jobs whose output file has since been removed must run again
+        result = job['result']
+        if job['status'] == 'finished' and isinstance(result, dict) and result.get('path'):
+            return os.path.exists(result['path'])
+        return True
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['finished_at'] = time.time()
+            try:
+                job['result'] = future.result()
+                job['status'] = 'finished'
+            except Exception as e:
+                logger.error(f"Job {job_id} ({job['name']}) failed: {e}")
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            self._futures.pop(job_id, None)
+
+    def _refresh(self, job):
+        future = self._futures.get(job['job_id'])
+        if job['status'] == 'queued' and future is not None and future.running():
+            job['status'] = 'running'
+
+    def status(self, job_id):
+        """Return a copy of the job record without its result, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._refresh(job)
+            return {k: v for k, v in job.items() if k != 'result'}
+
+    def result(self, job_id):
+        """Return (status, result) for a job, or (None, None) if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None, None
+            self._refresh(job)
+            return job['status'], job['result']
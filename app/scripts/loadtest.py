@@ -0,0 +1,456 @@
+"""
+Load test the Flask services with synthetic rasters.
+
+Starts app/final/app.py, band-arithmetic.py and rgb_processor.py on local
+ports (debug and reloader off), writes synthetic GeoTIFFs, and drives a
+weighted mix of requests at each concurrency level:
+
+    upload       POST /upload                      (final app)
+    band         GET  /bands/<id>/<n>              (final app)
+    composite    POST /composite/<id>              (final app)
+    arithmetic   POST /process, operation=ndvi     (band arithmetic)
+    rgb_display  POST /rgb_display, stream=1       (band arithmetic)
+    rgb_process  POST /rgb_process, stream=1       (rgb processor)
+    rgb_render   POST /rgb_session/<id>/render     (rgb processor)
+
+For every level it reports throughput and p50/p95/p99 latency per endpoint,
+the peak RSS of each service (its process tree, sampled during the run) and
+the services' own /metrics peak RSS. --isolate also runs each endpoint alone
+so memory can be attributed to it. Server settings are passed with --env
+(e.g. JOB_QUEUE_WORKERS=2 RASTER_POOL_SIZE=8) and runs are tagged with
+--label, so configurations can be compared from the JSON output.
+
+app.py keeps its uploads under the work directory; band-arithmetic.py and
+rgb_processor.py use their usual upload folder, where the upload sweeper
+expires the test files.
+
+Usage: python app/scripts/loadtest.py [--concurrency 1 4 16] [--requests 200] [--size 2048]
+                                      [--mix band=4,composite=2] [--env KEY=VALUE ...] [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
+
+SERVICES = {
+    'final_app': os.path.join(ROOT_DIR, 'app', 'final', 'app.py'),
+    'band_arithmetic': os.path.join(SCRIPT_DIR, 'band-arithmetic.py'),
+    'rgb_processor': os.path.join(SCRIPT_DIR, 'rgb_processor.py'),
+}
+DEFAULT_PORTS = {'final_app': 5100, 'band_arithmetic': 5101, 'rgb_processor': 5102}
+
+# Endpoint -> service, and the default request mix weights
+ENDPOINTS = {
+    'upload': 'final_app',
+    'band': 'final_app',
+    'composite': 'final_app',
+    'arithmetic': 'band_arithmetic',
+    'rgb_display': 'band_arithmetic',
+    'rgb_process': 'rgb_processor',
+    'rgb_render': 'rgb_processor',
+}
+DEFAULT_MIX = {'upload': 1, 'band': 4, 'composite': 2, 'arithmetic': 1,
+               'rgb_display': 1, 'rgb_process': 1, 'rgb_render': 3}
+
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+# Synthetic inputs
+
+def synthetic_band(size, seed):
+    """Smooth uint16 field with noise, like a calibrated IR band"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    field = 0.5 + 0.3 * np.sin(x * 9 + seed) * np.cos(y * 7 - seed)
+    field += rng.normal(0, 0.03, size=(size, size))
+    return (np.clip(field, 0, 1) * 60000).astype(np.uint16)
+
+
+def write_raster(path, bands):
+    size = bands[0].shape[0]
+    with rasterio.open(path, 'w', driver='GTiff', width=size, height=size, count=len(bands),
+                       dtype='uint16', crs='EPSG:4326',
+                       transform=from_bounds(44.5, -10.0, 105.5, 45.5, size, size)) as dst:
+        for index, band in enumerate(bands, 1):
+            dst.write(band, index)
+
+
+def write_inputs(folder, size):
+    """Three-band composite and two single bands named like converter outputs"""
+    bands = [synthetic_band(size, seed) for seed in (1, 2, 3)]
+    paths = {
+        'rgb': os.path.join(folder, 'L1C_RGB_01JAN2024.tif'),
+        'band1': os.path.join(folder, 'L1C_TIR1_01JAN2024.tif'),
+        'band2': os.path.join(folder, 'L1C_TIR2_01JAN2024.tif'),
+    }
+    write_raster(paths['rgb'], bands)
+    write_raster(paths['band1'], bands[:1])
+    write_raster(paths['band2'], bands[1:2])
+    return {name: {'filename': os.path.basename(path), 'data': open(path, 'rb').read()}
+            for name, path in paths.items()}
+
+
+# HTTP
+
+def encode_multipart(fields=None, files=None):
+    """multipart/form-data body; files maps field name to (filename, bytes)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in (files or {}).items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: image/tiff\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def http_request(url, method='GET', body=None, content_type=None, timeout=300):
+    """Return (status, response bytes); HTTP errors are returned, not raised"""
+    headers = {'Content-Type': content_type} if content_type else {}
+    req = urllib.request.Request(url, data=body, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def post_json(url, payload):
+    return http_request(url, 'POST', json.dumps(payload).encode(), 'application/json')
+
+
+def post_form(url, fields=None, files=None):
+    body, content_type = encode_multipart(fields, files)
+    return http_request(url, 'POST', body, content_type)
+
+
+# Services
+
+def process_tree_rss(pid):
+    """Current RSS in bytes of a process and its descendants (Linux only)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class Service:
+    """One Flask app running in a subprocess"""
+
+    def __init__(self, name, port, work_dir, env):
+        self.name = name
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.log_path = os.path.join(work_dir, f'{name}.log')
+        self._log = open(self.log_path, 'w')
+        # app.py keeps uploads relative to its working directory
+        cwd = os.path.join(work_dir, name)
+        os.makedirs(cwd, exist_ok=True)
+        self.proc = subprocess.Popen(
+            [sys.executable, SERVICES[name]], cwd=cwd,
+            env=dict(os.environ, PORT=str(port), FLASK_DEBUG='0', **env),
+            stdout=self._log, stderr=subprocess.STDOUT
+        )
+
+    def wait_ready(self, timeout=120):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f'{self.name} exited with code {self.proc.returncode}; see {self.log_path}')
+            try:
+                status, _ = http_request(f'{self.base_url}/metrics', timeout=5)
+                if status == 200:
+                    return
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f'{self.name} did not start within {timeout}s; see {self.log_path}')
+
+    def metrics(self):
+        """Parsed /metrics samples without labels, e.g. {'peak_rss_bytes': ...}"""
+        _, body = http_request(f'{self.base_url}/metrics', timeout=30)
+        samples = {}
+        for line in body.decode().splitlines():
+            match = re.match(r'^[a-z_]+?_(peak_rss_bytes|children_peak_rss_bytes|bytes_read_total) ([0-9.e+]+)$', line)
+            if match:
+                samples[match.group(1)] = float(match.group(2))
+        return samples
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+
+
+class RssSampler:
+    """Background sampler of each service's peak process-tree RSS"""
+
+    def __init__(self, services):
+        self.services = services
+        self.peaks = {name: 0 for name in services}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            for name, service in self.services.items():
+                self.peaks[name] = max(self.peaks[name], process_tree_rss(service.proc.pid))
+            self._stop.wait(RSS_SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# Requests
+
+class LoadTest:
+    def __init__(self, services, inputs):
+        self.services = services
+        self.inputs = inputs
+        self.file_id = None
+        self.session_id = None
+
+    def url(self, endpoint, path):
+        return self.services[ENDPOINTS[endpoint]].base_url + path
+
+    def file(self, name):
+        return self.inputs[name]['filename'], self.inputs[name]['data']
+
+    def setup(self):
+        """Upload the composite once for the band, composite and render endpoints"""
+        status, body = post_form(self.url('upload', '/upload'), files={'file': self.file('rgb')})
+        if status != 200:
+            raise RuntimeError(f'Setup upload failed ({status}): {body[:200]!r}')
+        self.file_id = json.loads(body)['file_id']
+
+        status, body = post_form(self.url('rgb_render', '/rgb_session'), files={'file': self.file('rgb')})
+        if status != 200:
+            raise RuntimeError(f'Setup render session failed ({status}): {body[:200]!r}')
+        self.session_id = json.loads(body)['session_id']
+
+    def call(self, endpoint):
+        if endpoint == 'upload':
+            return post_form(self.url(endpoint, '/upload'), files={'file': self.file('rgb')})
+        if endpoint == 'band':
+            band = random.randint(1, 3)
+            return http_request(self.url(endpoint, f'/bands/{self.file_id}/{band}'))
+        if endpoint == 'composite':
+            return post_json(self.url(endpoint, f'/composite/{self.file_id}'),
+                             {'red': 1, 'green': 2, 'blue': 3})
+        if endpoint == 'arithmetic':
+            return post_form(self.url(endpoint, '/process'), {'operation': 'ndvi'},
+                             {'file1': self.file('band1'), 'file2': self.file('band2')})
+        if endpoint == 'rgb_display':
+            return post_form(self.url(endpoint, '/rgb_display'),
+                             {'mode': 'natural', 'brightness': 10, 'contrast': 10, 'stream': 1},
+                             {'file': self.file('rgb')})
+        if endpoint == 'rgb_process':
+            fields = {f'{channel}_{bound}': value for channel in 'rgb'
+                      for bound, value in (('min', 5000), ('max', 55000))}
+            fields.update(brightness=10, contrast=10, saturation=10, stream=1)
+            return post_form(self.url(endpoint, '/rgb_process'), fields, {'file': self.file('rgb')})
+        if endpoint == 'rgb_render':
+            payload = {f'{channel}_{bound}': value for channel in 'rgb'
+                       for bound, value in (('min', 5000), ('max', random.randint(40000, 60000)))}
+            payload.update(brightness=random.randint(-20, 20), contrast=10, saturation=10)
+            return post_json(self.url(endpoint, f'/rgb_session/{self.session_id}/render'), payload)
+        raise ValueError(f'Unknown endpoint: {endpoint}')
+
+    def timed_call(self, endpoint):
+        start = time.perf_counter()
+        try:
+            status, body = self.call(endpoint)
+            error = None if status < 400 else body[:200].decode(errors='replace')
+        except Exception as e:
+            status, body, error = None, b'', str(e)
+        return {'endpoint': endpoint, 'seconds': time.perf_counter() - start,
+                'status': status, 'bytes': len(body), 'error': error}
+
+    def run(self, mix, concurrency, requests):
+        """Run a weighted mix; returns per-endpoint and overall results"""
+        names = list(mix)
+        endpoints = random.choices(names, weights=[mix[name] for name in names], k=requests)
+        before = {name: service.metrics() for name, service in self.services.items()}
+
+        with RssSampler(self.services) as sampler:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                samples = list(executor.map(self.timed_call, endpoints))
+            elapsed = time.perf_counter() - start
+
+        after = {name: service.metrics() for name, service in self.services.items()}
+        return {
+            'concurrency': concurrency,
+            'requests': requests,
+            'seconds': elapsed,
+            'throughput_rps': requests / elapsed if elapsed > 0 else None,
+            'endpoints': {name: summarize([s for s in samples if s['endpoint'] == name], elapsed)
+                          for name in names},
+            'services': {
+                name: {
+                    'peak_rss_bytes': sampler.peaks[name],
+                    'metrics_peak_rss_bytes': after[name].get('peak_rss_bytes'),
+                    'metrics_children_peak_rss_bytes': after[name].get('children_peak_rss_bytes'),
+                    'bytes_read': after[name].get('bytes_read_total', 0) - before[name].get('bytes_read_total', 0),
+                }
+                for name in self.services
+            },
+        }
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(sample['seconds'] * 1000 for sample in samples)
+    errors = [sample for sample in samples if sample['error']]
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        'first_error': errors[0]['error'] if errors else None,
+        'throughput_rps': len(samples) / elapsed if elapsed > 0 else None,
+        'mean_ms': statistics.mean(latencies) if latencies else None,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else None,
+        'response_bytes': sum(sample['bytes'] for sample in samples),
+    }
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'Unknown endpoint {name!r}; choose from {", ".join(ENDPOINTS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def print_report(run, scenario):
+    print(f"\n{scenario} @ concurrency {run['concurrency']}: "
+          f"{run['throughput_rps']:.1f} req/s over {run['seconds']:.1f}s", file=sys.stderr)
+    print(f"  {'endpoint':<12} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>7}",
+          file=sys.stderr)
+    for name, stats in run['endpoints'].items():
+        if not stats['requests']:
+            continue
+        print(f"  {name:<12} {stats['requests']:>5} {stats['errors']:>4} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['throughput_rps']:>7.1f}", file=sys.stderr)
+    for name, stats in run['services'].items():
+        print(f"  {name:<16} peak RSS {stats['peak_rss_bytes'] / 1024 ** 2:.0f} MB", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Flask raster services')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per concurrency level')
+    parser.add_argument('--size', type=int, default=2048, help='Side of the synthetic rasters in pixels')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Endpoint weights, e.g. band=4,composite=2,rgb_render=3')
+    parser.add_argument('--isolate', action='store_true', help='Also run each endpoint of the mix on its own')
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='Environment for the services, e.g. JOB_QUEUE_WORKERS=2')
+    parser.add_argument('--label', help='Name for this configuration in the results')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help='Keep inputs, uploads and service logs here')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    env = dict(item.split('=', 1) for item in args.env)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='loadtest_')
+    os.makedirs(work_dir, exist_ok=True)
+    # Keep the test's uploads out of the shared band registry
+    env.setdefault('BAND_REGISTRY_DB', os.path.join(work_dir, 'band_registry.db'))
+
+    services = {}
+    try:
+        inputs = write_inputs(work_dir, args.size)
+        for name in SERVICES:
+            services[name] = Service(name, DEFAULT_PORTS[name], work_dir, env)
+        for service in services.values():
+            service.wait_ready()
+
+        test = LoadTest(services, inputs)
+        test.setup()
+
+        scenarios = {'mix': args.mix}
+        if args.isolate:
+            scenarios.update({name: {name: 1} for name in args.mix})
+
+        results = {
+            'label': args.label,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'size': args.size,
+            'env': env,
+            'mix': args.mix,
+            'runs': [],
+        }
+        for concurrency in args.concurrency:
+            for scenario, mix in scenarios.items():
+                run = test.run(mix, concurrency, args.requests)
+                run['scenario'] = scenario
+                results['runs'].append(run)
+                print_report(run, scenario)
+    finally:
+        for service in services.values():
+            service.stop()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
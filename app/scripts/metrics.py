@@ -0,0 +1,134 @@
+"""
+In-process metrics for the Flask services, exposed in Prometheus text format.
+
+Stage timers (open, read, normalize, encode, write, ...), counters such as
+bytes read, and gauges such as queue depth and cache hits are collected per
+process and served from /metrics by instrument_app().
+"""
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+    """Peak resident set size; ru_maxrss is KiB on Linux and bytes on macOS"""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+class Metrics:
+    """Thread-safe stage timings, counters and gauges for one service"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work as one observation of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_bytes_read(self, nbytes):
+        self.inc('bytes_read_total', int(nbytes))
+
+    def gauge(self, name, func, help_text=''):
+        """Register a callable sampled whenever metrics are rendered"""
+        with self._lock:
+            self._gauges[name] = (func, help_text)
+
+    def track_cache(self, name, cache):
+        """Expose hit/miss counts of a ContentCache"""
+        self.gauge(f'cache_hits_{name}', lambda: cache.hits, f'Hits of the {name} cache')
+        self.gauge(f'cache_misses_{name}', lambda: cache.misses, f'Misses of the {name} cache')
+
+    def render(self):
+        """Prometheus text exposition of everything collected so far"""
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            stages = {name: list(stats) for name, stats in self._stages.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines.append(f'# HELP {ns}_stage_seconds Time spent per processing stage')
+        lines.append(f'# TYPE {ns}_stage_seconds summary')
+        for name, (count, total, _) in sorted(stages.items()):
+            lines.append(f'{ns}_stage_seconds_count{{stage="{name}"}} {count}')
+            lines.append(f'{ns}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'# TYPE {ns}_stage_seconds_max gauge')
+        for name, (_, _, longest) in sorted(stages.items()):
+            lines.append(f'{ns}_stage_seconds_max{{stage="{name}"}} {longest:.6f}')
+
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f'# TYPE {ns}_{name} counter')
+                typed.add(name)
+            lines.append(f'{ns}_{name}{_labels(dict(labels))} {value}')
+
+        for name, (func, help_text) in sorted(gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            if help_text:
+                lines.append(f'# HELP {ns}_{name} {help_text}')
+            lines.append(f'# TYPE {ns}_{name} gauge')
+            lines.append(f'{ns}_{name} {value}')
+
+        lines.append(f'# TYPE {ns}_peak_rss_bytes gauge')
+        lines.append(f'{ns}_peak_rss_bytes {peak_rss_bytes()}')
+        lines.append(f'# TYPE {ns}_children_peak_rss_bytes gauge')
+        lines.append(f'{ns}_children_peak_rss_bytes {peak_rss_bytes(resource.RUSAGE_CHILDREN)}')
+        return '\n'.join(lines) + '\n'
+
+
+def instrument_app(app, metrics, job_queue=None):
+    """Time every request, count responses and add a /metrics route to a Flask app"""
+    from flask import Response, request
+
+    @app.before_request
+    def _start_timer():
+        request.environ['metrics.start'] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = request.environ.get('metrics.start')
+        if start is not None and request.endpoint != 'metrics':
+            metrics.observe(f'request:{request.endpoint}', time.perf_counter() - start)
+            metrics.inc('requests_total', endpoint=request.endpoint, status=response.status_code)
+        return response
+
+    if job_queue is not None:
+        metrics.gauge('queue_depth', job_queue.pending_count, 'Queued and running jobs')
+
+    app.add_url_rule('/metrics', 'metrics', lambda: Response(metrics.render(), mimetype=CONTENT_TYPE))
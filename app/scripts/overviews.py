@@ -0,0 +1,93 @@
+"""
+Overview pyramids for uploaded rasters.
+
+Uploads such as download_region.py outputs are often TIFFs without overviews,
+so every preview decodes the full raster. needs_overviews() is a header-only
+check run at upload time; build_overviews() runs as a background job and adds
+an external .ovr pyramid next to the path it was given. The raster itself is
+never rewritten: uploads are content-addressed blobs and hard-linked aliases,
+whose bytes must keep matching their hash. The .ovr is swapped in atomically,
+and GDAL uses the new levels for decimated reads right away.
+"""
+import os
+
+import rasterio
+from rasterio.enums import Resampling
+
+from raster_io import open_raster
+
+# The smallest overview level should be at most this many pixels on its longest side
+MIN_OVERVIEW_SIZE = 512
+
+
+def overview_factors(width, height, min_size=MIN_OVERVIEW_SIZE):
+    """Power-of-two decimation factors down to min_size on the longest side"""
+    factors = []
+    factor = 2
+    while max(width, height) / (factor / 2) > min_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def needs_overviews(path, min_size=MIN_OVERVIEW_SIZE):
+    """
+    Return what a raster is missing, or None if it is fine as is.
+
+    {'factors': [...]}: the overview levels to build. Internal overviews and
+    an existing .ovr both count.
+    """
+    with open_raster(path) as src:
+        if max(src.width, src.height) <= min_size:
+            return None
+        factors = overview_factors(src.width, src.height, min_size)
+        existing = src.overviews(1)
+        if existing and max(existing) >= factors[-1]:
+            return None
+        return {'factors': factors}
+
+
+def build_overviews(path, resampling='average'):
+    """Write an external .ovr pyramid for a raster; runs as a background job"""
+    plan = needs_overviews(path)
+    if plan is None:
+        return {'path': path, 'built': False}
+
+    # The .ovr is built through a temporary hard link to the same inode, so it
+    # describes exactly the content path had when the job started and readers
+    # never see a partial file. The raster bytes are left untouched.
+    inode = os.stat(path).st_ino
+    build_path = path + '.ovr-build.tif'
+    try:
+        if os.path.exists(build_path):
+            os.remove(build_path)
+        os.link(path, build_path)
+        with rasterio.Env(COMPRESS_OVERVIEW='DEFLATE', INTERLEAVE_OVERVIEW='PIXEL'):
+            with rasterio.open(build_path) as src:
+                src.build_overviews(plan['factors'], Resampling[resampling])
+        # An alias re-pointed at other content meanwhile must not get this pyramid
+        if os.stat(path).st_ino != inode:
+            return {'path': path, 'built': False}
+        os.replace(build_path + '.ovr', path + '.ovr')
+    finally:
+        for temp_path in (build_path, build_path + '.ovr'):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return {'path': path, 'built': True, 'factors': plan['factors']}
+
+
+def read_decimated(src, indexes, max_size=None, resampling=Resampling.average):
+    """
+    Read bands with the longest side limited to max_size pixels.
+
+    GDAL serves decimated reads from the closest overview level, so this is
+    cheap once overviews exist. max_size=None reads at full resolution.
+    """
+    if not max_size or max(src.width, src.height) <= max_size:
+        return src.read(indexes)
+    scale = max_size / max(src.width, src.height)
+    height = max(1, int(round(src.height * scale)))
+    width = max(1, int(round(src.width * scale)))
+    if isinstance(indexes, int):
+        return src.read(indexes, out_shape=(height, width), resampling=resampling)
+    return src.read(indexes, out_shape=(len(indexes), height, width), resampling=resampling)
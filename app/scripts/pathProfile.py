@@ -1,4 +1,6 @@
 import rasterio
+from rasterio.windows import Window
+from rasterio.warp import transform as transform_coords
 import numpy as np
 from scipy.ndimage import map_coordinates
 import sys
@@ -6,46 +8,245 @@ import json
 import os
 from PIL import Image
 
+from raster_io import open_raster
+
+def read_first_band(file_path):
+    """Read the full first band, replacing NaN values with the band minimum"""
+    with open_raster(file_path) as src:
+        data = src.read(1)  # Read the first band
+        
+        if data is None or data.size == 0:
+            raise Exception("No data found in TIFF file")
+
+        # Handle NaN values
+        data = np.nan_to_num(data, nan=np.nanmin(data[~np.isnan(data)]))
+        return data
+
+def save_visualization(data, output_path):
+    """Normalize band data to 0-255 and save it as a PNG"""
+    # Normalize data for visualization
+    data_min = np.min(data)
+    data_max = np.max(data)
+    
+    if data_max == data_min:
+        normalized_data = np.zeros_like(data)
+    else:
+        normalized_data = ((data - data_min) / (data_max - data_min) * 255)
+    
+    # Convert to uint8 for image
+    img_data = normalized_data.astype(np.uint8)
+    
+    # Create PIL Image and save visualization
+    img = Image.fromarray(img_data)
+    img.save(output_path, 'PNG')
+    return output_path
+
+def visualization_path(file_path):
+    return file_path.replace('.tif', '_visual.png').replace('.tiff', '_visual.png')
+
+def render_visualization(file_path, output_path=None):
+    """Write the _visual.png preview of a TIFF; optional and independent of profile extraction"""
+    try:
+        if not os.path.exists(file_path):
+            raise Exception(f"Input file not found: {file_path}")
+
+        data = read_first_band(file_path)
+        return save_visualization(data, output_path or visualization_path(file_path))
+
+    except rasterio.errors.RasterioIOError as e:
+        raise Exception(f"Error opening TIFF file: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Error rendering visualization: {str(e)}")
+
 def process_tiff(file_path):
     """Process TIFF file and return the data"""
     try:
         if not os.path.exists(file_path):
             raise Exception(f"Input file not found: {file_path}")
 
-        with rasterio.open(file_path) as src:
-            data = src.read(1)  # Read the first band
-            
-            if data is None or data.size == 0:
-                raise Exception("No data found in TIFF file")
+        data = read_first_band(file_path)
+        save_visualization(data, visualization_path(file_path))
+        return data
 
-            # Handle NaN values
-            data = np.nan_to_num(data, nan=np.nanmin(data[~np.isnan(data)]))
-            
-            # Normalize data for visualization
-            data_min = np.min(data)
-            data_max = np.max(data)
-            
-            if data_max == data_min:
-                normalized_data = np.zeros_like(data)
-            else:
-                normalized_data = ((data - data_min) / (data_max - data_min) * 255)
-            
-            # Convert to uint8 for image
-            img_data = normalized_data.astype(np.uint8)
-            
-            # Create PIL Image
-            img = Image.fromarray(img_data)
+    except rasterio.errors.RasterioIOError as e:
+        raise Exception(f"Error opening TIFF file: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Error processing TIFF file: {str(e)}")
+
+def band_nanmin(src, band):
+    """Minimum of a band ignoring NaN, computed block by block (NaN if every pixel is NaN)"""
+    minimum = np.nan
+    for _, window in src.block_windows(band):
+        data = src.read(band, window=window)
+        valid = data[~np.isnan(data)]
+        if valid.size:
+            minimum = valid.min() if np.isnan(minimum) else min(minimum, valid.min())
+    return minimum
+
+def sample_windowed(src, band, rows, cols, masked=False):
+    """
+    Bilinearly sample a band at fractional pixel positions, reading only the
+    blocks that contain sample points (plus a one-pixel halo for interpolation)
+
+    Blocks are read in the band's native dtype. With masked=True the samples
+    are float64 and any sample that touches nodata or NaN is NaN; otherwise NaN
+    pixels are replaced with the band minimum, as read_first_band does.
+    """
+    block_height, block_width = src.block_shapes[band - 1]
+    values = np.empty(len(rows), dtype=np.float64 if masked else src.dtypes[band - 1])
+    nan_fill = None
+
+    block_rows = np.floor(rows).astype(int) // block_height
+    block_cols = np.floor(cols).astype(int) // block_width
+    for block_row, block_col in set(zip(block_rows.tolist(), block_cols.tolist())):
+        in_block = (block_rows == block_row) & (block_cols == block_col)
+
+        row_start = max(0, block_row * block_height - 1)
+        row_stop = min(src.height, (block_row + 1) * block_height + 1)
+        col_start = max(0, block_col * block_width - 1)
+        col_stop = min(src.width, (block_col + 1) * block_width + 1)
+        window = Window.from_slices((row_start, row_stop), (col_start, col_stop))
+        coordinates = np.vstack((rows[in_block] - row_start, cols[in_block] - col_start))
+
+        if masked:
+            data = src.read(band, window=window, masked=True)
+            mask = np.ma.getmaskarray(data)
+            data = data.data
+            sampled = map_coordinates(data, coordinates, output=np.float64, order=1, mode='nearest')
+            # A sample is nodata if any pixel it interpolates from is masked
+            if mask.any():
+                touched = map_coordinates(mask.astype(np.float32), coordinates, order=1, mode='nearest')
+                sampled[touched > 0] = np.nan
+            values[in_block] = sampled
+            continue
+
+        data = src.read(band, window=window)
+
+        # Handle NaN values using the band minimum, so results do not depend on block layout
+        if np.issubdtype(data.dtype, np.floating) and np.isnan(data).any():
+            if nan_fill is None:
+                nan_fill = band_nanmin(src, band)
+            if not np.isnan(nan_fill):
+                data = np.nan_to_num(data, nan=nan_fill)
+
+        values[in_block] = map_coordinates(data, coordinates, order=1, mode='nearest')
+
+    return values
+
+def sample_profile(file_path, start_point, end_point, num_points=100, band=1):
+    """Calculate an elevation profile between two pixel positions using windowed reads"""
+    try:
+        if not all(isinstance(p, (list, tuple)) and len(p) == 2 for p in [start_point, end_point]):
+            raise Exception("Invalid start or end point format")
+
+        with open_raster(file_path) as src:
+            # Create coordinates for the path
+            x = np.linspace(start_point[0], end_point[0], num_points)
+            y = np.linspace(start_point[1], end_point[1], num_points)
             
-            # Save visualization
-            output_path = file_path.replace('.tif', '_visual.png').replace('.tiff', '_visual.png')
-            img.save(output_path, 'PNG')
+            # Ensure coordinates are within bounds
+            if (np.any(x < 0) or np.any(x >= src.width) or 
+                np.any(y < 0) or np.any(y >= src.height)):
+                raise Exception("Path coordinates out of bounds")
             
-            return data
+            # Extract elevation values along the path
+            elevations = sample_windowed(src, band, y, x)
+        
+        # Calculate distances along the path
+        distances = np.sqrt((x - start_point[0])**2 + (y - start_point[1])**2)
+        
+        return {
+            'distances': distances.tolist(),
+            'elevations': elevations.tolist()
+        }
+    except rasterio.errors.RasterioIOError as e:
+        raise Exception(f"Error opening TIFF file: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Error calculating elevation profile: {str(e)}")
+
+EARTH_RADIUS_KM = 6371.0
 
+def haversine_km(lon1, lat1, lon2, lat2):
+    """Great-circle distance in km between arrays of lon/lat points"""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def densify_polyline(polyline, num_points):
+    """Place num_points evenly by distance along a [[lon, lat], ...] polyline"""
+    vertices = np.asarray(polyline, dtype=float)
+    if vertices.ndim != 2 or vertices.shape[0] < 2 or vertices.shape[1] != 2:
+        raise Exception("Each path needs at least two [lon, lat] points")
+
+    segment_km = haversine_km(vertices[:-1, 0], vertices[:-1, 1], vertices[1:, 0], vertices[1:, 1])
+    vertex_km = np.concatenate(([0.0], np.cumsum(segment_km)))
+    targets = np.linspace(0.0, vertex_km[-1], num_points)
+    lon = np.interp(targets, vertex_km, vertices[:, 0])
+    lat = np.interp(targets, vertex_km, vertices[:, 1])
+
+    # Geodesic distance along the sampled points
+    steps = haversine_km(lon[:-1], lat[:-1], lon[1:], lat[1:])
+    distances = np.concatenate(([0.0], np.cumsum(steps)))
+    return lon, lat, distances
+
+def get_batch_profiles(file_path, paths, bands=(1,), num_points=100):
+    """
+    Sample many lon/lat polylines over one or more bands, reading only the blocks they cross.
+
+    paths: list of polylines, each a list of [lon, lat] vertices
+    Returns geodesic distances in km and per-band values for every path.
+    Samples outside the raster or on nodata are returned as None.
+    """
+    try:
+        if not paths:
+            raise Exception("No paths provided")
+        bands = [int(b) for b in bands]
+
+        densified = [densify_polyline(path, num_points) for path in paths]
+        lon = np.concatenate([d[0] for d in densified])
+        lat = np.concatenate([d[1] for d in densified])
+
+        with open_raster(file_path) as src:
+            if any(b < 1 or b > src.count for b in bands):
+                raise Exception(f"Invalid band number, file has {src.count} bands")
+
+            xs, ys = lon, lat
+            if src.crs and not src.crs.is_geographic:
+                xs, ys = transform_coords('EPSG:4326', src.crs, lon, lat)
+                xs, ys = np.asarray(xs), np.asarray(ys)
+
+            # Fractional pixel positions relative to pixel centers
+            cols, rows = ~src.transform * (xs, ys)
+            cols = np.asarray(cols) - 0.5
+            rows = np.asarray(rows) - 0.5
+            inside = (cols >= -0.5) & (cols <= src.width - 0.5) & (rows >= -0.5) & (rows <= src.height - 0.5)
+
+            values = np.full((len(bands), len(rows)), np.nan)
+            if inside.any():
+                # Only the blocks the paths cross are read, in each band's native dtype
+                for i, band in enumerate(bands):
+                    values[i, inside] = sample_windowed(src, band, rows[inside], cols[inside], masked=True)
+
+        results = []
+        offset = 0
+        for path_lon, path_lat, distances in densified:
+            count = len(distances)
+            path_values = values[:, offset:offset + count]
+            results.append({
+                'coordinates': np.column_stack((path_lon, path_lat)).tolist(),
+                'distances_km': distances.tolist(),
+                'values': {
+                    str(band): [None if np.isnan(v) else float(v) for v in path_values[i]]
+                    for i, band in enumerate(bands)
+                }
+            })
+            offset += count
+
+        return {'bands': bands, 'profiles': results}
     except rasterio.errors.RasterioIOError as e:
         raise Exception(f"Error opening TIFF file: {str(e)}")
     except Exception as e:
-        raise Exception(f"Error processing TIFF file: {str(e)}")
+        raise Exception(f"Error calculating batch profiles: {str(e)}")
 
 def get_elevation_profile(data, start_point, end_point, num_points=100):
     """Calculate elevation profile between two points"""
@@ -81,24 +282,40 @@ def get_elevation_profile(data, start_point, end_point, num_points=100):
 
 if __name__ == '__main__':
     try:
-        if len(sys.argv) != 4:
-            raise Exception('Invalid arguments. Expected: image_path, start_point, end_point')
+        if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+            # Batch mode: image_path, paths as JSON [[[lon, lat], ...], ...], optional bands as JSON
+            if len(sys.argv) not in (4, 5):
+                raise Exception('Invalid arguments. Expected: --batch image_path paths [bands]')
+            try:
+                paths = json.loads(sys.argv[3])
+                bands = json.loads(sys.argv[4]) if len(sys.argv) == 5 else [1]
+            except json.JSONDecodeError:
+                raise Exception("Invalid paths or bands format")
+            result = get_batch_profiles(sys.argv[2], paths, bands)
+            result['status'] = 'success'
+            print(json.dumps(result))
+            sys.exit(0)
+
+        args = [arg for arg in sys.argv[1:] if arg != '--visual']
+        if len(args) != 3:
+            raise Exception('Invalid arguments. Expected: image_path, start_point, end_point [--visual]')
 
-        image_path = sys.argv[1]
+        image_path = args[0]
         try:
-            start_point = json.loads(sys.argv[2])
-            end_point = json.loads(sys.argv[3])
+            start_point = json.loads(args[1])
+            end_point = json.loads(args[2])
         except json.JSONDecodeError:
             raise Exception("Invalid point format")
 
         if not os.path.exists(image_path):
             raise Exception(f"File not found: {image_path}")
 
-        # Process the TIFF file
-        data = process_tiff(image_path)
-        
-        # Calculate elevation profile
-        result = get_elevation_profile(data, start_point, end_point)
+        # Calculate elevation profile from the blocks the path crosses
+        result = sample_profile(image_path, start_point, end_point)
+
+        # The full-image preview is only written on request
+        if '--visual' in sys.argv[1:]:
+            result['visual_path'] = render_visualization(image_path)
         
         # Add success status to result
         result['status'] = 'success'
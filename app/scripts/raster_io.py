@@ -0,0 +1,209 @@
+"""
+Shared raster I/O for the Flask apps, worker, converters and CLI scripts.
+
+Importing this module applies centrally tuned GDAL settings (block cache size,
+decoder threads, no directory listing on open). open_raster() and open_gdal()
+check out dataset handles from thread-safe, size-bounded pools so repeated
+requests for the same file reuse an open handle instead of reopening it.
+A checked-out handle is used by one caller at a time.
+
+Pools are keyed on path, inode, size and mtime (and those of an external .ovr),
+so a file that is replaced or gains overviews is reopened rather than served
+stale.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Defaults only; values already set in the environment win
+GDAL_SETTINGS = {
+    # Block cache in MB, shared by all datasets in the process
+    'GDAL_CACHEMAX': '512',
+    # Multi-threaded decompression of GTiff blocks and overview building
+    'GDAL_NUM_THREADS': 'ALL_CPUS',
+    # Do not list the directory on open; sidecars such as .ovr are still probed directly
+    'GDAL_DISABLE_READDIR_ON_OPEN': 'TRUE',
+    'VSI_CACHE': 'TRUE',
+}
+
+DEFAULT_POOL_SIZE = int(os.environ.get('RASTER_POOL_SIZE', 32))
+
+
+def configure_gdal():
+    """Apply GDAL_SETTINGS through the environment, which both rasterio and osgeo read"""
+    for key, value in GDAL_SETTINGS.items():
+        os.environ.setdefault(key, value)
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return
+    for key in GDAL_SETTINGS:
+        gdal.SetConfigOption(key, os.environ[key])
+
+
+configure_gdal()
+
+
+def _dataset_key(path):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    # An external .ovr added later must reopen the dataset so its levels are used
+    try:
+        overviews = os.stat(path + '.ovr').st_mtime_ns
+    except OSError:
+        overviews = None
+    return (path, stat.st_ino, stat.st_size, stat.st_mtime_ns, overviews)
+
+
+class DatasetPool:
+    """Bounded LRU pool of idle dataset handles with exclusive checkout"""
+
+    def __init__(self, opener, closer, max_size=DEFAULT_POOL_SIZE):
+        self._opener = opener
+        self._closer = closer
+        self.max_size = max_size
+        self._idle = OrderedDict()
+        self._idle_count = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_fork(self):
+        # Handles inherited by a forked job worker belong to the parent
+        if self._pid != os.getpid():
+            self._idle = OrderedDict()
+            self._idle_count = 0
+            self._pid = os.getpid()
+
+    def _take(self, key):
+        with self._lock:
+            self._check_fork()
+            handles = self._idle.get(key)
+            if handles:
+                self.hits += 1
+                self._idle_count -= 1
+                handle = handles.pop()
+                if not handles:
+                    del self._idle[key]
+                return handle, []
+            self.misses += 1
+            # Drop handles of earlier versions of the same file
+            stale = [k for k in self._idle if k[0] == key[0]]
+            closing = []
+            for k in stale:
+                closing.extend(self._idle.pop(k))
+            self._idle_count -= len(closing)
+            return None, closing
+
+    def _return(self, key, handle):
+        closing = []
+        with self._lock:
+            self._check_fork()
+            self._idle.setdefault(key, []).append(handle)
+            self._idle.move_to_end(key)
+            self._idle_count += 1
+            while self._idle_count > self.max_size:
+                oldest, handles = next(iter(self._idle.items()))
+                closing.append(handles.pop(0))
+                self._idle_count -= 1
+                if not handles:
+                    del self._idle[oldest]
+        return closing
+
+    def _close_all(self, handles):
+        for handle in handles:
+            try:
+                self._closer(handle)
+            except Exception:
+                pass
+
+    @contextmanager
+    def open(self, path):
+        """Check out a read-only handle for path; it returns to the pool afterwards"""
+        key = _dataset_key(path)
+        handle, closing = self._take(key)
+        self._close_all(closing)
+        if handle is None:
+            handle = self._opener(key[0])
+
+        try:
+            yield handle
+        except BaseException:
+            # Do not pool a handle that may be in an odd state
+            self._close_all([handle])
+            raise
+        self._close_all(self._return(key, handle))
+
+    def discard(self, path):
+        """Close idle handles for a path, e.g. before deleting the file"""
+        path = os.path.abspath(path)
+        with self._lock:
+            closing = []
+            for key in [k for k in self._idle if k[0] == path]:
+                closing.extend(self._idle.pop(key))
+            self._idle_count -= len(closing)
+        self._close_all(closing)
+
+    def clear(self):
+        with self._lock:
+            closing = [handle for handles in self._idle.values() for handle in handles]
+            self._idle = OrderedDict()
+            self._idle_count = 0
+        self._close_all(closing)
+
+
+def _open_rasterio(path):
+    import rasterio
+    return rasterio.open(path)
+
+
+def _open_gdal(path):
+    from osgeo import gdal
+    dataset = gdal.Open(path, gdal.GA_ReadOnly)
+    if dataset is None:
+        raise IOError(f"Failed to open {path}")
+    return dataset
+
+
+def _close_gdal(dataset):
+    # GDAL datasets close when the last reference goes away
+    dataset.FlushCache()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(name, opener, closer):
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = DatasetPool(opener, closer)
+        return _pools[name]
+
+
+def rasterio_pool():
+    return _pool('rasterio', _open_rasterio, lambda dataset: dataset.close())
+
+
+def gdal_pool():
+    return _pool('gdal', _open_gdal, _close_gdal)
+
+
+def open_raster(path):
+    """Pooled read-only rasterio dataset: `with open_raster(path) as src:`"""
+    return rasterio_pool().open(path)
+
+
+def open_gdal(path):
+    """Pooled read-only osgeo.gdal dataset: `with open_gdal(path) as dataset:`"""
+    return gdal_pool().open(path)
+
+
+def discard(path):
+    """Close pooled handles of a file in every pool (call before removing it)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.discard(path)
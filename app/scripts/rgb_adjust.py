@@ -0,0 +1,103 @@
+"""
+Shared brightness/contrast/saturation kernel for 8-bit RGB composites.
+
+Brightness and contrast are folded into one 256-entry lookup table that is
+applied in a single pass; saturation is a vectorized step on the uint8 result.
+Two flavours are provided:
+
+enhance_rgb  matches PIL ImageEnhance (Brightness, Contrast, Color) factors
+linear_adjust_rgb  matches the additive brightness, 259-based contrast and
+                   HSV saturation scaling used by process_rgb.py
+"""
+import numpy as np
+
+IDENTITY = np.arange(256, dtype=np.float64)
+
+
+def _to_lut(values):
+    """Clip and truncate float LUT values to uint8, as PIL and NumPy casts do"""
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def _luma(rgb):
+    """ITU-R 601 luma with PIL's fixed-point rounding ("L" conversion)"""
+    r = rgb[..., 0].astype(np.uint32)
+    g = rgb[..., 1].astype(np.uint32)
+    b = rgb[..., 2].astype(np.uint32)
+    return ((r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16).astype(np.float32)
+
+
+def _mean_luma(rgb, lut):
+    """Mean luma of lut[rgb], computed from per-channel histograms"""
+    pixels = rgb.shape[0] * rgb.shape[1]
+    if pixels == 0:
+        return 0
+    means = [np.dot(np.bincount(rgb[..., i].ravel(), minlength=256), lut) / pixels for i in range(3)]
+    return int((means[0] * 19595 + means[1] * 38470 + means[2] * 7471) / 65536 + 0.5)
+
+
+def apply_lut(rgb, lut):
+    """Map every channel of a uint8 image through a 256-entry table"""
+    return np.take(lut, rgb)
+
+
+def enhance_rgb(rgb, brightness_factor=1.0, contrast_factor=1.0, saturation_factor=1.0):
+    """
+    Equivalent of chaining ImageEnhance.Brightness, Contrast and Color.
+
+    rgb: HxWx3 uint8 array. The contrast midpoint is the mean luma of the
+    brightness-adjusted image, taken from histograms instead of a full pass.
+    Returns a new HxWx3 uint8 array.
+    """
+    rgb = np.asarray(rgb, dtype=np.uint8)
+
+    lut = IDENTITY.astype(np.uint8)
+    if brightness_factor != 1.0:
+        lut = _to_lut(IDENTITY * brightness_factor)
+    if contrast_factor != 1.0:
+        mean = _mean_luma(rgb, lut)
+        lut = _to_lut(mean + contrast_factor * (lut.astype(np.float64) - mean))
+
+    out = apply_lut(rgb, lut) if (brightness_factor != 1.0 or contrast_factor != 1.0) else rgb.copy()
+
+    if saturation_factor != 1.0:
+        luma = _luma(out)
+        for i in range(3):
+            channel = out[..., i].astype(np.float32)
+            out[..., i] = np.clip(luma + saturation_factor * (channel - luma), 0, 255)
+    return out
+
+
+def linear_lut(brightness=0, contrast=0):
+    """Lookup table for additive brightness and 259-based contrast (percent/level units)"""
+    values = IDENTITY.copy()
+    if brightness != 0:
+        values += (brightness / 100.0) * 255
+    if contrast != 0:
+        factor = (259 * (contrast + 255)) / (255 * (259 - contrast))
+        values = factor * (values - 128) + 128
+    return _to_lut(values)
+
+
+def linear_adjust_rgb(rgb, brightness=0, contrast=0, saturation=0):
+    """
+    Equivalent of process_rgb's brightness, contrast and HSV saturation steps.
+
+    Saturation is scaled in place of an HSV round trip: hue and value are kept
+    and each channel moves away from the pixel maximum, capped at full
+    saturation. Returns a new HxWx3 uint8 array.
+    """
+    rgb = np.asarray(rgb, dtype=np.uint8)
+    out = apply_lut(rgb, linear_lut(brightness, contrast)) if (brightness or contrast) else rgb.copy()
+
+    if saturation != 0:
+        scale = max(0.0, 1 + saturation / 100.0)
+        value = out.max(axis=2).astype(np.float32)
+        spread = value - out.min(axis=2)
+        # HSV saturation is clipped at 255, i.e. the minimum channel stops at zero
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(spread > 0, np.minimum(scale, value / spread), 0).astype(np.float32)
+        for i in range(3):
+            channel = out[..., i].astype(np.float32)
+            out[..., i] = np.clip(np.rint(value - (value - channel) * scale), 0, 255)
+    return out
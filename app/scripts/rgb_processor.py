@@ -1,13 +1,23 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
 import rasterio
+from rasterio.enums import Resampling
 import numpy as np
-from PIL import Image, ImageEnhance
+from PIL import Image
 import os
+import io
+import json
 import logging
 import uuid
+from contextlib import ExitStack
 import shutil
 
+from content_store import save_upload, ContentCache
+from rgb_adjust import enhance_rgb
+from metrics import Metrics, instrument_app
+from upload_lifecycle import UploadLifecycle
+from raster_io import open_raster, discard, rasterio_pool
+
 app = Flask(__name__)
 CORS(app)
 
@@ -20,18 +30,26 @@ UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-def clean_uploads():
-    """Clean old files from uploads directory"""
-    try:
-        for filename in os.listdir(UPLOAD_FOLDER):
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                logger.error(f"Error deleting {file_path}: {e}")
-    except Exception as e:
-        logger.error(f"Error cleaning uploads directory: {e}")
+# Uploads and results expire by last access and a byte quota in the background
+upload_lifecycle = UploadLifecycle(UPLOAD_FOLDER, on_remove=discard).start()
+
+# Band statistics keyed on upload content hash, shared by duplicate uploads
+band_statistics_cache = ContentCache(max_items=256)
+
+# Render sessions: preview-resolution float32 bands keyed on content hash
+PREVIEW_MAX_SIZE = int(os.environ.get('RGB_PREVIEW_MAX_SIZE', 1024))
+render_sessions = ContentCache(max_items=16)
+
+# Stage timings and cache hits served at /metrics
+metrics = Metrics('rgb_processor')
+instrument_app(app, metrics)
+metrics.track_cache('band_statistics', band_statistics_cache)
+metrics.track_cache('render_sessions', render_sessions)
+metrics.track_cache('raster_pool', rasterio_pool())
+
+def stream_requested():
+    """Whether the client asked for the rendered image bytes instead of a saved file"""
+    return request.form.get('stream', '').lower() in ('1', 'true', 'yes')
 
 def normalize_band(band, min_val, max_val):
     """Normalize band data to 0-255 range using provided thresholds"""
@@ -68,39 +86,40 @@ def get_band_statistics(band):
         logger.error(f"Error in get_band_statistics: {e}")
         return {"min": 0, "max": 0, "mean": 0}
 
-def apply_image_adjustments(img, brightness, contrast, saturation):
-    """Apply image enhancement adjustments"""
+def apply_image_adjustments(rgb, brightness, contrast, saturation):
+    """Apply image enhancement adjustments to an 8-bit RGB array"""
     try:
         # Convert percentage adjustments to enhancement factors
-        brightness_factor = max(0.1, 1 + (brightness / 100))
-        contrast_factor = max(0.1, 1 + (contrast / 100))
-        saturation_factor = max(0.1, 1 + (saturation / 100))
-        
-        # Apply enhancements
-        if brightness != 0:
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(brightness_factor)
-        
-        if contrast != 0:
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(contrast_factor)
-        
-        if saturation != 0:
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(saturation_factor)
+        brightness_factor = max(0.1, 1 + (brightness / 100)) if brightness != 0 else 1.0
+        contrast_factor = max(0.1, 1 + (contrast / 100)) if contrast != 0 else 1.0
+        saturation_factor = max(0.1, 1 + (saturation / 100)) if saturation != 0 else 1.0
         
-        return img
+        # Brightness and contrast share one lookup table pass
+        return enhance_rgb(rgb, brightness_factor, contrast_factor, saturation_factor)
     except Exception as e:
         logger.error(f"Error in apply_image_adjustments: {e}")
         raise
 
+def get_thresholds(values):
+    """Per-channel min/max thresholds from form or JSON values"""
+    return {
+        channel: {
+            'min': float(values.get(f'{channel}_min', 0)),
+            'max': float(values.get(f'{channel}_max', 255))
+        }
+        for channel in ('r', 'g', 'b')
+    }
+
+def get_adjustments(values):
+    """Brightness, contrast and saturation from form or JSON values"""
+    return (float(values.get('brightness', 0)),
+            float(values.get('contrast', 0)),
+            float(values.get('saturation', 0)))
+
 @app.route('/rgb_process', methods=['POST'])
 def process_rgb():
     temp_path = None
     try:
-        # Clean old files
-        clean_uploads()
-        
         # Get file and parameters
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
@@ -111,67 +130,69 @@ def process_rgb():
             
         # Get threshold parameters with better error handling
         try:
-            thresholds = {
-                'r': {
-                    'min': float(request.form.get('r_min', 0)),
-                    'max': float(request.form.get('r_max', 255))
-                },
-                'g': {
-                    'min': float(request.form.get('g_min', 0)),
-                    'max': float(request.form.get('g_max', 255))
-                },
-                'b': {
-                    'min': float(request.form.get('b_min', 0)),
-                    'max': float(request.form.get('b_max', 255))
-                }
-            }
+            thresholds = get_thresholds(request.form)
         except ValueError as e:
             return jsonify({"error": "Invalid threshold values"}), 400
         
         # Get image adjustment parameters
         try:
-            brightness = float(request.form.get('brightness', 0))
-            contrast = float(request.form.get('contrast', 0))
-            saturation = float(request.form.get('saturation', 0))
+            brightness, contrast, saturation = get_adjustments(request.form)
         except ValueError as e:
             return jsonify({"error": "Invalid adjustment values"}), 400
         
         # Save uploaded file
         temp_path = os.path.join(UPLOAD_FOLDER, str(uuid.uuid4()) + '.tif')
-        file.save(temp_path)
+        with metrics.stage('write'):
+            content_hash, _, _ = save_upload(file, UPLOAD_FOLDER, alias_path=temp_path)
         
         # Open and process image
-        with rasterio.open(temp_path) as src:
+        with ExitStack() as stack:
+            with metrics.stage('open'):
+                src = stack.enter_context(open_raster(temp_path))
             # Verify number of bands
             if src.count < 3:
                 return jsonify({"error": f"Image has only {src.count} bands. At least 3 bands are required."}), 400
             
             # Read first three bands
-            r, g, b = [src.read(i) for i in range(1, 4)]
+            with metrics.stage('read'):
+                r, g, b = [src.read(i) for i in range(1, 4)]
+            metrics.add_bytes_read(r.nbytes + g.nbytes + b.nbytes)
             
             # Get band statistics
-            band_statistics = {
-                'red': get_band_statistics(r),
-                'green': get_band_statistics(g),
-                'blue': get_band_statistics(b)
-            }
+            band_statistics = band_statistics_cache.get(content_hash)
+            if band_statistics is None:
+                band_statistics = band_statistics_cache.put(content_hash, {
+                    'red': get_band_statistics(r),
+                    'green': get_band_statistics(g),
+                    'blue': get_band_statistics(b)
+                })
             
             # Normalize bands
-            r_norm = normalize_band(r, thresholds['r']['min'], thresholds['r']['max'])
-            g_norm = normalize_band(g, thresholds['g']['min'], thresholds['g']['max'])
-            b_norm = normalize_band(b, thresholds['b']['min'], thresholds['b']['max'])
+            with metrics.stage('normalize'):
+                r_norm = normalize_band(r, thresholds['r']['min'], thresholds['r']['max'])
+                g_norm = normalize_band(g, thresholds['g']['min'], thresholds['g']['max'])
+                b_norm = normalize_band(b, thresholds['b']['min'], thresholds['b']['max'])
             
-            # Stack bands and create PIL Image
-            rgb = np.dstack((r_norm, g_norm, b_norm))
-            img = Image.fromarray(rgb)
+            # Stack bands and apply image adjustments
+            with metrics.stage('adjust'):
+                rgb = np.dstack((r_norm, g_norm, b_norm))
+                img = Image.fromarray(apply_image_adjustments(rgb, brightness, contrast, saturation))
             
-            # Apply image adjustments
-            img = apply_image_adjustments(img, brightness, contrast, saturation)
+            # Stream the PNG straight to the client when requested
+            if stream_requested():
+                with metrics.stage('encode'):
+                    png_io = io.BytesIO()
+                    img.save(png_io, 'PNG')
+                    png_io.seek(0)
+                response = send_file(png_io, mimetype='image/png')
+                response.headers['X-Band-Statistics'] = json.dumps(band_statistics)
+                return response
             
             # Save result
             result_filename = str(uuid.uuid4()) + '.png'
             result_path = os.path.join(UPLOAD_FOLDER, result_filename)
-            img.save(result_path)
+            with metrics.stage('encode'):
+                img.save(result_path)
             
             return jsonify({
                 "result_image": result_filename,
@@ -190,15 +211,125 @@ def process_rgb():
         # Clean up temporary file
         if temp_path and os.path.exists(temp_path):
             try:
+                discard(temp_path)
+                os.remove(temp_path)
+            except Exception as e:
+                logger.error(f"Error removing temporary file: {e}")
+
+@app.route('/rgb_session', methods=['POST'])
+def create_render_session():
+    """
+    Upload a TIFF once and keep its first three bands at preview resolution.
+
+    Returns a session id (the content hash) for /rgb_session/<id>/render, which
+    re-applies thresholds and adjustments without re-reading the file.
+    """
+    temp_path = None
+    try:
+        if 'file' not in request.files or not request.files['file'].filename:
+            return jsonify({"error": "No file provided"}), 400
+        
+        temp_path = os.path.join(UPLOAD_FOLDER, str(uuid.uuid4()) + '.tif')
+        with metrics.stage('write'):
+            content_hash, _, _ = save_upload(request.files['file'], UPLOAD_FOLDER, alias_path=temp_path)
+        
+        session = render_sessions.get(content_hash)
+        if session is None:
+            with ExitStack() as stack:
+                with metrics.stage('open'):
+                    src = stack.enter_context(open_raster(temp_path))
+                if src.count < 3:
+                    return jsonify({"error": f"Image has only {src.count} bands. At least 3 bands are required."}), 400
+                
+                # Decimated read; GDAL serves it from overviews when present
+                scale = min(1.0, PREVIEW_MAX_SIZE / max(src.width, src.height))
+                height = max(1, int(round(src.height * scale)))
+                width = max(1, int(round(src.width * scale)))
+                with metrics.stage('read'):
+                    bands = src.read([1, 2, 3], out_shape=(3, height, width),
+                                     resampling=Resampling.average).astype(np.float32)
+                metrics.add_bytes_read(bands.nbytes)
+                
+                # Statistics of the preview arrays, cached apart from full-resolution ones
+                band_statistics = band_statistics_cache.get((content_hash, 'preview'))
+                if band_statistics is None:
+                    band_statistics = band_statistics_cache.put((content_hash, 'preview'), {
+                        name: get_band_statistics(band)
+                        for name, band in zip(('red', 'green', 'blue'), bands)
+                    })
+                
+                session = render_sessions.put(content_hash, {
+                    'bands': bands,
+                    'band_statistics': band_statistics,
+                    'source_size': [src.width, src.height]
+                })
+        
+        return jsonify({
+            "session_id": content_hash,
+            "preview_size": [int(session['bands'].shape[2]), int(session['bands'].shape[1])],
+            "source_size": session['source_size'],
+            "bands_info": {
+                "band_statistics": session['band_statistics']
+            }
+        })
+    
+    except rasterio.errors.RasterioIOError as e:
+        logger.error(f"Error reading TIFF file: {e}")
+        return jsonify({"error": "Invalid or corrupted TIFF file"}), 400
+    except Exception as e:
+        logger.error(f"Error creating render session: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        # The session keeps the decoded bands, not the file
+        if temp_path and os.path.exists(temp_path):
+            try:
+                discard(temp_path)
                 os.remove(temp_path)
             except Exception as e:
                 logger.error(f"Error removing temporary file: {e}")
 
+@app.route('/rgb_session/<session_id>/render', methods=['POST'])
+def render_session(session_id):
+    """Re-render a session's preview with new thresholds and adjustments, streamed as PNG"""
+    session = render_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Render session not found or expired"}), 404
+    
+    values = request.get_json(silent=True) or request.form
+    try:
+        thresholds = get_thresholds(values)
+        brightness, contrast, saturation = get_adjustments(values)
+    except ValueError:
+        return jsonify({"error": "Invalid threshold or adjustment values"}), 400
+    
+    try:
+        with metrics.stage('normalize'):
+            rgb = np.dstack([
+                normalize_band(band, thresholds[channel]['min'], thresholds[channel]['max'])
+                for channel, band in zip(('r', 'g', 'b'), session['bands'])
+            ])
+        with metrics.stage('adjust'):
+            rgb = apply_image_adjustments(rgb, brightness, contrast, saturation)
+        with metrics.stage('encode'):
+            png_io = io.BytesIO()
+            # Fast zlib level keeps encoding well inside the interactive budget
+            Image.fromarray(rgb).save(png_io, 'PNG', compress_level=1)
+            png_io.seek(0)
+        return send_file(png_io, mimetype='image/png')
+    except Exception as e:
+        logger.error(f"Error rendering session {session_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/rgb_session/<session_id>', methods=['DELETE'])
+def delete_render_session(session_id):
+    if not render_sessions.pop(session_id):
+        return jsonify({"error": "Render session not found"}), 404
+    return jsonify({"deleted": session_id})
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
+    upload_lifecycle.touch(os.path.join(UPLOAD_FOLDER, filename))
     return send_from_directory(UPLOAD_FOLDER, filename)
 
 if __name__ == '__main__':
-    # Clean uploads directory on startup
-    clean_uploads()
-    app.run(port=5001, debug=True)
+    app.run(port=int(os.environ.get('PORT', 5001)), debug=os.environ.get('FLASK_DEBUG', '1') == '1')
@@ -2,6 +2,8 @@ import argparse
 import sys
 from osgeo import gdal
 
+from raster_io import open_gdal
+
 def main():
     parser = argparse.ArgumentParser(description='Selectively download region from file')
     parser.add_argument('--north', type=float, required=True, help='North latitude')
@@ -14,12 +16,9 @@ def main():
 
     try:
         # Use GDAL to process the file
-        dataset = gdal.Open(args.file)
-        if not dataset:
-            raise Exception('Failed to open file with GDAL')
-
-        # Implement your selective download logic here
-        print(f"Processing file: {args.file} with bounds: {args.north}, {args.south}, {args.east}, {args.west}")
+        with open_gdal(args.file) as dataset:
+            # Implement your selective download logic here
+            print(f"Processing file: {args.file} with bounds: {args.north}, {args.south}, {args.east}, {args.west}")
 
     except Exception as e:
         print(f"Error during processing: {e}", file=sys.stderr)
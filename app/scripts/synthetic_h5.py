@@ -0,0 +1,282 @@
+"""
+Synthetic INSAT-3DR imager (3RIMG) H5 files for benchmarking the converters.
+
+The files mirror what convert.py, conversion_script.py and convertyogi.py read:
+- L1B: full-disk IMG_* counts with Latitude/Longitude grids per resolution
+  (IR 4 km, VIS/SWIR 1 km, WV 8 km) stored as scaled integers, off-disk
+  pixels set to the fill value, plus the 1-D calibration lookup tables.
+- L1C: IMG_* counts on a regular lat/lon sector described by the
+  left/right_longitude and upper/lower_latitude attributes.
+- L2B: HEM rainfall on the IR full-disk grid with Latitude/Longitude.
+- L2C: DHI/DNI/GHI/INS on a regular sector.
+
+Datasets are written in row blocks, so full-size files can be generated with
+little memory. Filenames follow 3RIMG_<DATE>_<TIME>_<PRODUCT>_<CODE>_V01R00.h5,
+which the converters split on '_' for the date and product.
+
+Usage: python app/scripts/synthetic_h5.py L1C [--output-dir dir] [--scale 0.25]
+"""
+import argparse
+import os
+
+import h5py
+import numpy as np
+
+PRODUCTS = ('L1B', 'L1C', 'L2B', 'L2C')
+PRODUCT_CODES = {'L1B': 'STD', 'L1C': 'SGP', 'L2B': 'HEM', 'L2C': 'INS'}
+
+# INSAT-3DR imager geometry
+SUB_SATELLITE_LON = 74.0
+SATELLITE_DISTANCE_KM = 42164.0
+EQUATORIAL_RADIUS_KM = 6378.137
+POLAR_RADIUS_KM = 6356.7523
+# Scan angle covering the full disk plus a margin of space
+FULL_DISK_SCAN_DEG = 8.8
+
+# Full-disk grids (rows, cols) per channel resolution
+FULL_DISK_SHAPES = {'IR': (2816, 2805), 'VIS': (11264, 11220), 'WV': (1408, 1402)}
+L1B_CHANNELS = {
+    'IMG_VIS': 'VIS', 'IMG_SWIR': 'VIS',
+    'IMG_MIR': 'IR', 'IMG_TIR1': 'IR', 'IMG_TIR2': 'IR',
+    'IMG_WV': 'WV',
+}
+# Suffix of the lat/lon datasets and the integer scale of their values
+COORDINATE_GRIDS = {'IR': ('', np.int16, 100), 'VIS': ('_VIS', np.int32, 10000), 'WV': ('_WV', np.int16, 100)}
+
+# L1C/L2C sector bounds and grid
+SECTOR = {'left_longitude': 44.5, 'right_longitude': 105.5,
+          'upper_latitude': 45.5, 'lower_latitude': -10.0}
+SECTOR_SHAPE = (1616, 1737)
+L1C_CHANNELS = ('IMG_WV', 'IMG_TIR1', 'IMG_TIR2', 'IMG_MIR', 'IMG_SWIR', 'IMG_VIS')
+L2C_PARAMETERS = ('DHI', 'DNI', 'GHI', 'INS')
+
+COUNT_FILL = 1023  # 10-bit detector counts
+FLOAT_FILL = -999.0
+ROW_BLOCK = 256
+
+
+def product_filename(product, date='01JAN2024', time='0015'):
+    """3RIMG filename for a product, e.g. 3RIMG_01JAN2024_0015_L1C_SGP_V01R00.h5"""
+    return f'3RIMG_{date}_{time}_{product}_{PRODUCT_CODES[product]}_V01R00.h5'
+
+
+def scaled_shape(shape, scale):
+    return tuple(max(16, int(round(side * scale))) for side in shape)
+
+
+def geos_to_latlon(rows, cols, row_start, row_stop):
+    """
+    Latitude and longitude in degrees for full-disk rows [row_start, row_stop).
+
+    Uses the CGMS geostationary inverse projection; pixels that miss the Earth
+    are NaN.
+    """
+    scan = np.radians(FULL_DISK_SCAN_DEG)
+    x = np.linspace(-scan, scan, cols)[None, :]
+    y = np.linspace(scan, -scan, rows)[row_start:row_stop, None]
+    ratio = (EQUATORIAL_RADIUS_KM / POLAR_RADIUS_KM) ** 2
+
+    cos_x, cos_y, sin_y = np.cos(x), np.cos(y), np.sin(y)
+    denominator = cos_y ** 2 + ratio * sin_y ** 2
+    along = SATELLITE_DISTANCE_KM * cos_x * cos_y
+    with np.errstate(invalid='ignore'):
+        discriminant = along ** 2 - denominator * (SATELLITE_DISTANCE_KM ** 2 - EQUATORIAL_RADIUS_KM ** 2)
+        distance = (along - np.sqrt(discriminant)) / denominator
+        s1 = SATELLITE_DISTANCE_KM - distance * cos_x * cos_y
+        s2 = distance * np.sin(x) * cos_y
+        s3 = -distance * sin_y
+        lat = np.degrees(np.arctan(ratio * s3 / np.hypot(s1, s2)))
+        lon = np.degrees(np.arctan(s2 / s1)) + SUB_SATELLITE_LON
+    off_disk = ~(discriminant >= 0)
+    lat[off_disk] = np.nan
+    lon[off_disk] = np.nan
+    return lat, lon
+
+
+def sector_latlon(rows, cols, row_start, row_stop):
+    """Regular sector grid rows; points beyond the Earth's limb are NaN"""
+    lats = np.linspace(SECTOR['upper_latitude'], SECTOR['lower_latitude'], rows)[row_start:row_stop]
+    lons = np.linspace(SECTOR['left_longitude'], SECTOR['right_longitude'], cols)
+    lon, lat = np.meshgrid(lons, lats)
+    # Central angle from the sub-satellite point; the limb is at ~81.3 degrees
+    cos_angle = np.cos(np.radians(lat)) * np.cos(np.radians(lon - SUB_SATELLITE_LON))
+    limb = EQUATORIAL_RADIUS_KM / SATELLITE_DISTANCE_KM
+    visible = cos_angle > limb
+    lat = np.where(visible, lat, np.nan)
+    lon = np.where(visible, lon, np.nan)
+    return lat, lon
+
+
+def scene(lat, lon, seed):
+    """Smooth 0..1 field with cloud-like structure and noise; NaN off-disk"""
+    rng = np.random.default_rng(seed)
+    base = 0.55 + 0.35 * np.cos(np.radians(lat)) ** 2
+    clouds = 0.25 * np.sin(np.radians(lon) * 7 + seed) * np.cos(np.radians(lat) * 5 - seed)
+    noise = rng.normal(0, 0.02, size=lat.shape)
+    return np.clip(base - np.maximum(clouds, 0) + noise, 0, 1)
+
+
+def counts(field):
+    values = np.where(np.isnan(field), COUNT_FILL, np.clip(field * 1000, 0, COUNT_FILL - 1))
+    return values.astype(np.uint16)
+
+
+def physical(field, low, high):
+    return np.where(np.isnan(field), FLOAT_FILL, low + field * (high - low)).astype(np.float32)
+
+
+def scaled_coordinate(values, dtype, scale):
+    fill = np.iinfo(dtype).max
+    return np.where(np.isnan(values), fill, np.round(values * scale)).astype(dtype)
+
+
+def create_dataset(h5, name, shape, dtype, fill, chunk_size=None, compression=None, **attrs):
+    """Create an image dataset; chunk_size=None stores it contiguous like the source files"""
+    options = {}
+    if chunk_size or compression:
+        side = chunk_size or 256
+        options['chunks'] = tuple(min(side, n) if i >= len(shape) - 2 else 1 for i, n in enumerate(shape))
+    if compression:
+        options['compression'] = compression
+    dataset = h5.create_dataset(name, shape=shape, dtype=dtype, fillvalue=fill, **options)
+    dataset.attrs['_FillValue'] = np.array([fill], dtype=dtype)
+    for key, value in attrs.items():
+        dataset.attrs[key] = value
+    return dataset
+
+
+def write_rows(datasets, rows, cols, latlon, fill_block):
+    """Fill datasets block by block; fill_block(lat, lon) returns {name: array} for the rows"""
+    for start in range(0, rows, ROW_BLOCK):
+        stop = min(start + ROW_BLOCK, rows)
+        lat, lon = latlon(rows, cols, start, stop)
+        for name, block in fill_block(lat, lon).items():
+            if datasets[name].ndim == 3:
+                datasets[name][0, start:stop, :] = block
+            else:
+                datasets[name][start:stop, :] = block
+
+
+def write_sector_attrs(h5):
+    # Stored as one-element arrays, as in the distributed files
+    for key, value in SECTOR.items():
+        h5.attrs[key] = np.array([value], dtype=np.float32)
+
+
+def write_l1b(h5, scale, options):
+    groups = {}
+    for name, resolution in L1B_CHANNELS.items():
+        groups.setdefault(resolution, []).append(name)
+
+    for resolution, channels in groups.items():
+        rows, cols = scaled_shape(FULL_DISK_SHAPES[resolution], scale)
+        suffix, coord_dtype, coord_scale = COORDINATE_GRIDS[resolution]
+        fill = np.iinfo(coord_dtype).max
+        datasets = {
+            name: create_dataset(h5, name, (1, rows, cols), np.uint16, COUNT_FILL, **options)
+            for name in channels
+        }
+        for coordinate in ('Latitude', 'Longitude'):
+            datasets[coordinate + suffix] = create_dataset(
+                h5, coordinate + suffix, (rows, cols), coord_dtype, fill,
+                scale_factor=np.float32(1.0 / coord_scale), **options)
+
+        def fill_block(lat, lon, channels=channels, suffix=suffix,
+                       coord_dtype=coord_dtype, coord_scale=coord_scale):
+            blocks = {name: counts(scene(lat, lon, seed)) for seed, name in enumerate(channels, 1)}
+            blocks['Latitude' + suffix] = scaled_coordinate(lat, coord_dtype, coord_scale)
+            blocks['Longitude' + suffix] = scaled_coordinate(lon, coord_dtype, coord_scale)
+            return blocks
+
+        write_rows(datasets, rows, cols, geos_to_latlon, fill_block)
+
+    # Count-to-physical lookup tables; 1-D, so the converters skip them
+    lut = np.arange(COUNT_FILL + 1, dtype=np.float32)
+    for name in L1B_CHANNELS:
+        if name in ('IMG_VIS', 'IMG_SWIR'):
+            h5.create_dataset(f'{name}_RADIANCE', data=lut * 0.01)
+            h5.create_dataset(f'{name}_ALBEDO', data=lut / COUNT_FILL * 100)
+        else:
+            h5.create_dataset(f'{name}_RADIANCE', data=lut * 0.001)
+            h5.create_dataset(f'{name}_TEMP', data=180 + lut * 0.13)
+
+
+def write_l1c(h5, scale, options):
+    rows, cols = scaled_shape(SECTOR_SHAPE, scale)
+    write_sector_attrs(h5)
+    datasets = {
+        name: create_dataset(h5, name, (1, rows, cols), np.uint16, COUNT_FILL, **options)
+        for name in L1C_CHANNELS
+    }
+    write_rows(datasets, rows, cols, sector_latlon,
+               lambda lat, lon: {name: counts(scene(lat, lon, seed))
+                                 for seed, name in enumerate(L1C_CHANNELS, 1)})
+
+
+def write_l2b(h5, scale, options):
+    rows, cols = scaled_shape(FULL_DISK_SHAPES['IR'], scale)
+    suffix, coord_dtype, coord_scale = COORDINATE_GRIDS['IR']
+    fill = np.iinfo(coord_dtype).max
+    datasets = {
+        'HEM': create_dataset(h5, 'HEM', (1, rows, cols), np.float32, FLOAT_FILL, units='mm/hr', **options),
+        'Latitude': create_dataset(h5, 'Latitude', (rows, cols), coord_dtype, fill,
+                                   scale_factor=np.float32(1.0 / coord_scale), **options),
+        'Longitude': create_dataset(h5, 'Longitude', (rows, cols), coord_dtype, fill,
+                                    scale_factor=np.float32(1.0 / coord_scale), **options),
+    }
+    write_rows(datasets, rows, cols, geos_to_latlon, lambda lat, lon: {
+        'HEM': physical(np.maximum(scene(lat, lon, 7) - 0.6, 0), 0, 60),
+        'Latitude': scaled_coordinate(lat, coord_dtype, coord_scale),
+        'Longitude': scaled_coordinate(lon, coord_dtype, coord_scale),
+    })
+
+
+def write_l2c(h5, scale, options):
+    rows, cols = scaled_shape(SECTOR_SHAPE, scale)
+    write_sector_attrs(h5)
+    datasets = {
+        name: create_dataset(h5, name, (1, rows, cols), np.float32, FLOAT_FILL, units='W/m2', **options)
+        for name in L2C_PARAMETERS
+    }
+    write_rows(datasets, rows, cols, sector_latlon,
+               lambda lat, lon: {name: physical(scene(lat, lon, seed), 0, 1100)
+                                 for seed, name in enumerate(L2C_PARAMETERS, 1)})
+
+
+WRITERS = {'L1B': write_l1b, 'L1C': write_l1c, 'L2B': write_l2b, 'L2C': write_l2c}
+
+
+def generate(product, output_dir, scale=1.0, chunk_size=None, compression=None,
+             date='01JAN2024', time='0015'):
+    """Write one synthetic product file and return its path"""
+    product = product.upper()
+    if product not in WRITERS:
+        raise ValueError(f"Unsupported product type: {product}")
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, product_filename(product, date, time))
+    options = {'chunk_size': chunk_size, 'compression': compression}
+    with h5py.File(path, 'w') as h5:
+        h5.attrs['Satellite_Name'] = 'INSAT-3DR'
+        h5.attrs['Sensor_Name'] = 'IMAGER'
+        h5.attrs['Processing_Level'] = product
+        h5.attrs['Nominal_Central_Point_Coordinates(degrees)_Latitude_Longitude'] = \
+            np.array([0.0, SUB_SATELLITE_LON], dtype=np.float32)
+        WRITERS[product](h5, scale, options)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic INSAT-3DR H5 products')
+    parser.add_argument('products', nargs='*', default=list(PRODUCTS), help='L1B, L1C, L2B and/or L2C')
+    parser.add_argument('--output-dir', default='.', help='Directory for the generated files')
+    parser.add_argument('--scale', type=float, default=1.0, help='Scale factor for grid sizes')
+    parser.add_argument('--chunk-size', type=int, help='Chunk rows and columns (default contiguous)')
+    parser.add_argument('--compression', help='HDF5 filter, e.g. gzip')
+    args = parser.parse_args()
+
+    for product in args.products:
+        print(generate(product, args.output_dir, args.scale, args.chunk_size, args.compression))
+
+
+if __name__ == '__main__':
+    main()
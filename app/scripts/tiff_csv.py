@@ -1,43 +1,170 @@
 import rasterio
+from rasterio.windows import Window, WindowError, from_bounds
+from rasterio.warp import transform_bounds
 import numpy as np
 import pandas as pd
+import argparse
 import sys
 import os
+import time
 
+from raster_io import open_raster
 
-def load_geotiff(file_path):
+# Parquet output is optional and only needs pyarrow when requested
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DEFAULT_BLOCK_ROWS = 512
+OUTPUT_FORMATS = ('csv', 'parquet')
+
+
+def block_row_count(dataset, block_rows=DEFAULT_BLOCK_ROWS):
+    """Round the requested rows per block to a whole number of internal raster blocks"""
+    internal_rows = dataset.block_shapes[0][0]
+    return max(internal_rows, (block_rows // internal_rows) * internal_rows)
+
+
+def bbox_window(dataset, bbox):
+    """Pixel window covering a (min_lon, min_lat, max_lon, max_lat) box, clipped to the raster"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if dataset.crs and not dataset.crs.is_geographic:
+        min_lon, min_lat, max_lon, max_lat = transform_bounds('EPSG:4326', dataset.crs, *bbox)
+
+    window = from_bounds(min_lon, min_lat, max_lon, max_lat, dataset.transform)
+    # Floor the start and ceil the end; rounding offset and length separately can drop the last pixel
+    col_start, row_start = int(np.floor(window.col_off)), int(np.floor(window.row_off))
+    col_stop = int(np.ceil(window.col_off + window.width))
+    row_stop = int(np.ceil(window.row_off + window.height))
+    window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
     try:
-        with rasterio.open(file_path) as dataset:
-            data = dataset.read(1)
-            transform = dataset.transform
-            width = dataset.width
-            height = dataset.height
-
-        rows, cols = np.indices((height, width))
-        lon, lat = rasterio.transform.xy(transform, rows, cols)
-        lat = np.array(lat).flatten()
-        lon = np.array(lon).flatten()
-        data = data.flatten()
-
-        return lat, lon, data
-    except Exception as e:
-        print(f"Error loading TIFF: {str(e)}", file=sys.stderr)
-        raise
+        return window.intersection(Window(0, 0, dataset.width, dataset.height))
+    except WindowError:
+        raise ValueError("Bounding box does not overlap the raster")
+
+
+def iter_geotiff_blocks(dataset, block_rows=DEFAULT_BLOCK_ROWS, band=1,
+                        bbox=None, stride=1, skip_nodata=False):
+    """
+    Yield (lat, lon, values) arrays for consecutive row blocks of a band.
+
+    Pixel-center coordinates come from the affine transform directly, so no
+    full-size index grids or per-pixel Python lists are built.
+
+    bbox: only read pixels inside this lat/lon box
+    stride: keep every stride-th row and column
+    skip_nodata: drop nodata, masked and NaN pixels
+    """
+    transform = dataset.transform
+    block_rows = block_row_count(dataset, block_rows)
+    stride = max(1, int(stride))
+
+    if bbox is not None:
+        area = bbox_window(dataset, bbox)
+    else:
+        area = Window(0, 0, dataset.width, dataset.height)
+    row_off, col_off = int(area.row_off), int(area.col_off)
+    row_end, col_end = row_off + int(area.height), col_off + int(area.width)
+
+    col_index = np.arange(col_off, col_end, stride)
+    cols = col_index.astype(np.float64) + 0.5
+
+    # Walk the raster's own row blocks so each read lines up with internal tiles
+    first_block = (row_off // block_rows) * block_rows
+    for block_start in range(first_block, row_end, block_rows):
+        block_stop = min(block_start + block_rows, row_end)
+        start = max(block_start, row_off)
 
+        # First row in this block that falls on the stride grid
+        first_row = start + (-(start - row_off)) % stride
+        if first_row >= block_stop:
+            continue
+        row_index = np.arange(first_row, block_stop, stride)
 
-def tiff_to_csv(file_path, output_csv):
+        window = Window(col_off, first_row, col_end - col_off, row_index[-1] + 1 - first_row)
+        data = dataset.read(band, window=window, masked=skip_nodata)
+        data = data[::stride, ::stride]
+
+        rows = (row_index.astype(np.float64) + 0.5)[:, np.newaxis]
+        lon = transform.c + cols * transform.a + rows * transform.b
+        lat = transform.f + cols * transform.d + rows * transform.e
+
+        if skip_nodata:
+            valid = ~np.ma.getmaskarray(data)
+            values = data.data
+            if np.issubdtype(values.dtype, np.floating):
+                valid &= ~np.isnan(values)
+            yield lat[valid], lon[valid], values[valid]
+        else:
+            yield lat.ravel(), lon.ravel(), data.ravel()
+
+
+def export_geotiff(file_path, output_path, output_format=None, block_rows=DEFAULT_BLOCK_ROWS,
+                   bbox=None, stride=1, skip_nodata=False):
+    """
+    Stream a GeoTIFF band to CSV or Parquet in constant memory.
+
+    Each row block is written as soon as it is read: appended to the CSV, or
+    written as one Parquet row group. bbox, stride and skip_nodata limit which
+    pixels are read and written. Returns row count and throughput.
+    """
+    if output_format is None:
+        output_format = 'parquet' if output_path.lower().endswith(('.parquet', '.pq')) else 'csv'
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    if output_format == 'parquet' and pq is None:
+        raise ImportError("Parquet output requires pyarrow")
+
+    start = time.perf_counter()
+    total_rows = 0
+    with open_raster(file_path) as dataset:
+        blocks = iter_geotiff_blocks(dataset, block_rows, bbox=bbox, stride=stride, skip_nodata=skip_nodata)
+        if output_format == 'csv':
+            with open(output_path, 'w', newline='') as out:
+                header = True
+                for lat, lon, data in blocks:
+                    df = pd.DataFrame({'Latitude': lat, 'Longitude': lon, 'Value': data})
+                    df.to_csv(out, index=False, header=header)
+                    header = False
+                    total_rows += len(df)
+        else:
+            writer = None
+            try:
+                for lat, lon, data in blocks:
+                    table = pa.table({'Latitude': lat, 'Longitude': lon, 'Value': data})
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema)
+                    writer.write_table(table)
+                    total_rows += table.num_rows
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        'rows': total_rows,
+        'seconds': seconds,
+        'rows_per_second': total_rows / seconds if seconds > 0 else float('inf')
+    }
+
+
+def tiff_to_csv(file_path, output_csv, output_format=None, bbox=None, stride=1, skip_nodata=False):
     try:
         # Ensure input file exists
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Input file not found: {file_path}")
 
         # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+        os.makedirs(os.path.dirname(output_csv) or '.', exist_ok=True)
 
-        # Convert TIFF to CSV
-        lat, lon, data = load_geotiff(file_path)
-        df = pd.DataFrame({'Latitude': lat, 'Longitude': lon, 'Value': data})
-        df.to_csv(output_csv, index=False)
+        # Convert TIFF to CSV (or Parquet) block by block
+        stats = export_geotiff(file_path, output_csv, output_format,
+                               bbox=bbox, stride=stride, skip_nodata=skip_nodata)
+        print(f"Exported {stats['rows']} rows in {stats['seconds']:.2f}s "
+              f"({stats['rows_per_second']:,.0f} rows/s)")
 
         # Verify output file was created
         if not os.path.exists(output_csv):
@@ -49,17 +176,28 @@ def tiff_to_csv(file_path, output_csv):
         raise
 
 
+def parse_bbox(bbox_str):
+    # Parse bbox string (format: minLng,minLat,maxLng,maxLat)
+    bbox = [float(x) for x in bbox_str.split(',')]
+    if len(bbox) != 4:
+        raise ValueError("Bounding box must be minLng,minLat,maxLng,maxLat")
+    return tuple(bbox)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python tiff_csv.py input.tiff output.csv", file=sys.stderr)
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-    
+    parser = argparse.ArgumentParser(description='Export a GeoTIFF band to CSV or Parquet')
+    parser.add_argument('input', help='Input TIFF file path')
+    parser.add_argument('output', help='Output CSV or Parquet file path')
+    parser.add_argument('format', nargs='?', choices=OUTPUT_FORMATS, help='Output format (default: from extension)')
+    parser.add_argument('--bbox', help='Only export pixels inside minLng,minLat,maxLng,maxLat')
+    parser.add_argument('--stride', type=int, default=1, help='Keep every Nth row and column')
+    parser.add_argument('--skip-nodata', action='store_true', help='Drop nodata, masked and NaN pixels')
+    args = parser.parse_args()
+
     try:
-        tiff_to_csv(input_file, output_file)
-        print(f"Successfully converted {input_file} to {output_file}")
+        bbox = parse_bbox(args.bbox) if args.bbox else None
+        tiff_to_csv(args.input, args.output, args.format, bbox, args.stride, args.skip_nodata)
+        print(f"Successfully converted {args.input} to {args.output}")
     except Exception as e:
         print(f"Conversion failed: {str(e)}", file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,127 @@
+"""
+Upload and result retention for the Flask services.
+
+Files under an upload folder expire a fixed time after their last access, and
+when the folder grows past a byte quota the least recently used files are
+evicted first. A background sweeper does the work, so request latency no
+longer depends on how many files the folder holds. Last access is stored as
+the file's atime, so every process serving the folder sees it. Hard-linked
+aliases of a stored blob count once and expire together.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL_SECONDS', 6 * 3600))
+DEFAULT_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 10 * 1024 ** 3))
+DEFAULT_SWEEP_INTERVAL = int(os.environ.get('UPLOAD_SWEEP_INTERVAL', 60))
+
+# Files used this recently are never evicted, so in-flight results survive
+GRACE_SECONDS = 60
+
+# Hidden directories whose files are managed (content-addressed blobs)
+MANAGED_HIDDEN_DIRS = {'.blobs'}
+
+
+class UploadLifecycle:
+    """TTL and quota based eviction for one upload folder"""
+
+    def __init__(self, folder, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES,
+                 interval=DEFAULT_SWEEP_INTERVAL, on_remove=None):
+        self.folder = os.path.abspath(folder)
+        # Called with each path before it is deleted, e.g. to close pooled handles
+        self.on_remove = on_remove
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self, path):
+        """Record that a file was used now by setting its atime (aliases share the inode)"""
+        try:
+            stat = os.stat(path)
+            # Keep mtime: it identifies the file's content to the raster handle pool
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            return
+
+    def _scan(self):
+        """Group files by inode: {inode: {'paths', 'size', 'last_access'}}"""
+        files = {}
+        for root, dirs, filenames in os.walk(self.folder):
+            # Skip hidden state such as the band registry database
+            dirs[:] = [d for d in dirs if not d.startswith('.') or d in MANAGED_HIDDEN_DIRS]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = (stat.st_dev, stat.st_ino)
+                entry = files.setdefault(key, {'paths': [], 'size': stat.st_size,
+                                               'last_access': max(stat.st_atime, stat.st_mtime)})
+                entry['paths'].append(path)
+        return files
+
+    def _evict(self, entry):
+        for path in entry['paths']:
+            try:
+                if self.on_remove is not None:
+                    self.on_remove(path)
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Error deleting {path}: {e}")
+
+    def sweep(self):
+        """Delete expired files, then evict least recently used ones over the quota"""
+        now = time.time()
+        files = self._scan()
+        removed = 0
+        freed = 0
+
+        for key, entry in list(files.items()):
+            if now - entry['last_access'] > max(self.ttl_seconds, GRACE_SECONDS):
+                self._evict(entry)
+                removed += len(entry['paths'])
+                freed += entry['size']
+                del files[key]
+
+        total = sum(entry['size'] for entry in files.values())
+        if self.max_bytes and total > self.max_bytes:
+            for key, entry in sorted(files.items(), key=lambda item: item[1]['last_access']):
+                if total <= self.max_bytes:
+                    break
+                if now - entry['last_access'] < GRACE_SECONDS:
+                    break
+                self._evict(entry)
+                removed += len(entry['paths'])
+                freed += entry['size']
+                total -= entry['size']
+
+        if removed:
+            logger.info(f"Removed {removed} files ({freed} bytes) from {self.folder}; {total} bytes in use")
+        return {'removed': removed, 'freed_bytes': freed, 'used_bytes': total}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Upload sweep failed: {e}")
+
+    def start(self):
+        """Start the background sweeper thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='upload-sweeper', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
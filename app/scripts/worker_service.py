@@ -0,0 +1,206 @@
+"""
+Long-lived Python worker for the Next.js API routes.
+
+Imports NumPy, GDAL, rasterio, SciPy, Pillow and pandas once at startup and serves
+the raster helpers over loopback HTTP, so requests no longer pay interpreter
+startup and import time. Routes fall back to spawning the scripts when the worker
+is not running.
+
+Usage: python app/scripts/worker_service.py [--host 127.0.0.1] [--port 5055]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
+sys.path.insert(0, SCRIPT_DIR)
+sys.path.insert(1, ROOT_DIR)
+
+import process_rgb
+import pathProfile
+import tiff_csv
+import download_region
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = int(os.environ.get('PYTHON_WORKER_PORT', 5055))
+
+
+def handle_process_rgb(payload):
+    result = process_rgb.process_image(
+        payload['input_path'],
+        payload['r_min'], payload['r_max'],
+        payload['g_min'], payload['g_max'],
+        payload['b_min'], payload['b_max'],
+        payload.get('brightness', 0),
+        payload.get('contrast', 0),
+        payload.get('saturation', 0)
+    )
+    return json.loads(result)
+
+
+def handle_process_rgb_png(payload):
+    size = process_rgb.write_png(
+        payload['output_path'],
+        payload['input_path'],
+        payload['r_min'], payload['r_max'],
+        payload['g_min'], payload['g_max'],
+        payload['b_min'], payload['b_max'],
+        payload.get('brightness', 0),
+        payload.get('contrast', 0),
+        payload.get('saturation', 0)
+    )
+    return {'output_path': payload['output_path'], 'content_length': size}
+
+
+def handle_profile(payload):
+    result = pathProfile.sample_profile(payload['image_path'], payload['start'], payload['end'])
+    if payload.get('visual'):
+        result['visual_path'] = pathProfile.render_visualization(payload['image_path'])
+    result['status'] = 'success'
+    return result
+
+
+def handle_profile_batch(payload):
+    result = pathProfile.get_batch_profiles(
+        payload['image_path'],
+        payload['paths'],
+        payload.get('bands', [1]),
+        payload.get('num_points', 100)
+    )
+    result['status'] = 'success'
+    return result
+
+
+def handle_tiff_csv(payload):
+    bbox = payload.get('bbox')
+    if isinstance(bbox, str):
+        bbox = tiff_csv.parse_bbox(bbox)
+    stats = tiff_csv.export_geotiff(
+        payload['input_path'],
+        payload['output_path'],
+        payload.get('format'),
+        bbox=bbox,
+        stride=int(payload.get('stride', 1)),
+        skip_nodata=bool(payload.get('skip_nodata', False))
+    )
+    return {'output_path': payload['output_path'], **stats}
+
+
+def temp_output(suffix):
+    """A fresh output file for one request; requests run on concurrent threads"""
+    fd, path = tempfile.mkstemp(prefix='worker_', suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def handle_download_region(payload):
+    bbox = payload['bbox']
+    if isinstance(bbox, str):
+        bbox = download_region.get_bounding_box_from_args(bbox)
+    output_path = payload.get('output_path') or temp_output('.tif')
+    download_region.download_region(
+        payload['input_path'],
+        output_path,
+        bbox,
+        bands=payload.get('bands'),
+        target_resolution=payload.get('resolution'),
+        cog=bool(payload.get('cog', False))
+    )
+    return {'output_path': output_path}
+
+
+def handle_download_regions(payload):
+    output_path = payload.get('output_path') or temp_output('.zip')
+    summary = download_region.download_regions(
+        payload['input_path'],
+        payload['regions'],
+        output_path,
+        bands=payload.get('bands'),
+        max_workers=int(payload.get('workers', 4))
+    )
+    return {'output_path': output_path, **summary}
+
+
+TASKS = {
+    'process_rgb': handle_process_rgb,
+    'process_rgb_png': handle_process_rgb_png,
+    'profile': handle_profile,
+    'profile_batch': handle_profile_batch,
+    'tiff_csv': handle_tiff_csv,
+    'download_region': handle_download_region,
+    'download_regions': handle_download_regions,
+}
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'tasks': sorted(TASKS)})
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        task = TASKS.get(self.path.strip('/'))
+        if task is None:
+            self._send_json(404, {'error': f'Unknown task: {self.path}'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {'error': 'Invalid JSON payload'})
+            return
+
+        start = time.perf_counter()
+        try:
+            result = task(payload)
+        except KeyError as e:
+            self._send_json(400, {'error': f'Missing parameter: {e}'})
+            return
+        except Exception as e:
+            logger.error(f"Task {self.path} failed: {e}")
+            self._send_json(500, {'error': str(e)})
+            return
+
+        logger.info(f"{self.path} finished in {(time.perf_counter() - start) * 1000:.1f} ms")
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm Python worker for raster tasks')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (loopback only by default)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), WorkerHandler)
+    logger.info(f"Python worker listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
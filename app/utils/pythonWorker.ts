@@ -0,0 +1,30 @@
+// Same PYTHON_WORKER_PORT that worker_service.py listens on; PYTHON_WORKER_URL overrides the whole URL
+const WORKER_PORT = process.env.PYTHON_WORKER_PORT || '5055';
+const WORKER_URL = process.env.PYTHON_WORKER_URL || `http://127.0.0.1:${WORKER_PORT}`;
+
+export interface WorkerResponse {
+  status: number;
+  data: any;
+}
+
+// Calls a task on the warm Python worker (app/scripts/worker_service.py).
+// Returns null when the worker is not reachable so callers can fall back to spawning the script.
+export async function callPythonWorker(task: string, payload: object): Promise<WorkerResponse | null> {
+  let response: Response;
+  try {
+    response = await fetch(`${WORKER_URL}/${task}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(payload),
+      cache: 'no-store'
+    });
+  } catch {
+    return null;
+  }
+
+  try {
+    return { status: response.status, data: await response.json() };
+  } catch {
+    return { status: 500, data: { error: 'Invalid response from Python worker' } };
+  }
+}
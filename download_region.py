@@ -1,14 +1,87 @@
+import os
+import sys
+import json
+import threading
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import rasterio
+import rasterio.shutil
+from rasterio.io import MemoryFile
 from rasterio.windows import Window
 import numpy as np
 import argparse
 
+# Shared raster I/O (pooled handles, tuned GDAL settings) lives in app/scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'scripts'))
+from raster_io import open_raster
+
 def get_bounding_box_from_args(bbox_str):
     # Parse bbox string (format: minLng,minLat,maxLng,maxLat)
     bbox = [float(x) for x in bbox_str.split(',')]
     return bbox[0], bbox[1], bbox[2], bbox[3]
 
-def download_region(tif_file_path, output_file_path, bbox=None):
+def region_window(src, bbox):
+    """Pixel window for a (minLng, minLat, maxLng, maxLat) box, or None if it is empty"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+
+    # Calculate the window to read
+    transform = src.transform
+    col_start, row_start = ~transform * (min_lng, max_lat)
+    col_stop, row_stop = ~transform * (max_lng, min_lat)
+
+    # Ensure indices are within bounds
+    col_start, col_stop = max(0, int(col_start)), min(src.width, int(col_stop))
+    row_start, row_stop = max(0, int(row_start)), min(src.height, int(row_stop))
+
+    if col_stop <= col_start or row_stop <= row_start:
+        return None
+    return Window.from_slices((row_start, row_stop), (col_start, col_stop))
+
+def check_bands(src, bands):
+    bands = list(bands) if bands else list(range(1, src.count + 1))
+    if any(b < 1 or b > src.count for b in bands):
+        raise ValueError(f"Invalid band selection {bands}: file has {src.count} bands")
+    return bands
+
+def region_meta(src, window, bands, block_size=512):
+    """Metadata for a tiled, compressed output covering window"""
+    out_meta = src.meta.copy()
+    out_meta.update({
+        "driver": "GTiff",
+        "count": len(bands),
+        "height": window.height,
+        "width": window.width,
+        "transform": rasterio.windows.transform(window, src.transform),
+        "tiled": True,
+        # Tile sizes must be multiples of 16; keep them no larger than the region
+        "blockxsize": min(block_size, -(-window.width // 16) * 16),
+        "blockysize": min(block_size, -(-window.height // 16) * 16),
+        "compress": "deflate",
+        "BIGTIFF": "IF_SAFER"
+    })
+    return out_meta
+
+def choose_overview_level(src, target_resolution):
+    """Pick the coarsest overview that is still at least as fine as target_resolution (None = full resolution)"""
+    if not target_resolution:
+        return None
+    level = None
+    for index, factor in enumerate(src.overviews(1)):
+        if src.res[0] * factor <= target_resolution:
+            level = index
+    return level
+
+def download_region(tif_file_path, output_file_path, bbox=None, bands=None,
+                    target_resolution=None, cog=False, block_size=512):
+    """
+    Cut a lat/lon bounding box out of a raster.
+
+    bands: list of 1-based band numbers to keep (default: all)
+    target_resolution: desired pixel size in CRS units; reads from the coarsest
+        overview that is still at least this fine
+    cog: write a Cloud Optimized GeoTIFF instead of a tiled GeoTIFF
+    """
     # Get bounding box from arguments or user input
     if bbox:
         min_lng, min_lat, max_lng, max_lat = bbox
@@ -18,52 +91,216 @@ def download_region(tif_file_path, output_file_path, bbox=None):
         max_lng = float(input("Enter maximum longitude: "))
         max_lat = float(input("Enter maximum latitude: "))
     
-    # Open the TIFF file
-    with rasterio.open(tif_file_path) as src:
-        # Calculate the window to read
-        transform = src.transform
-        col_start, row_start = ~transform * (min_lng, max_lat)
-        col_stop, row_stop = ~transform * (max_lng, min_lat)
+    # Pick an overview level for the requested resolution
+    open_kwargs = {}
+    if target_resolution:
+        with open_raster(tif_file_path) as base:
+            level = choose_overview_level(base, target_resolution)
+        if level is not None:
+            open_kwargs['overview_level'] = level
 
-        # Ensure indices are within bounds
-        col_start, col_stop = max(0, int(col_start)), min(src.width, int(col_stop))
-        row_start, row_stop = max(0, int(row_start)), min(src.height, int(row_stop))
+    # Open the TIFF file
+    # Overview-level opens bypass the pool, which only holds full-resolution handles
+    source = rasterio.open(tif_file_path, **open_kwargs) if open_kwargs else open_raster(tif_file_path)
+    with source as src:
+        window = region_window(src, (min_lng, min_lat, max_lng, max_lat))
 
         # Check if the window size is valid
-        if col_stop <= col_start or row_stop <= row_start:
+        if window is None:
             print("Invalid bounding box: resulting window size is zero.")
             return
 
-        # Read the data within the window
-        window = Window.from_slices((row_start, row_stop), (col_start, col_stop))
-        data = src.read(window=window)
-
-        # Update metadata for the new file
-        out_meta = src.meta.copy()
-        out_meta.update({
-            "driver": "GTiff",
-            "height": window.height,
-            "width": window.width,
-            "transform": rasterio.windows.transform(window, src.transform)
-        })
-
-        # Write the data to a new TIFF file
-        with rasterio.open(output_file_path, "w", **out_meta) as dest:
-            dest.write(data)
+        bands = check_bands(src, bands)
+        out_meta = region_meta(src, window, bands, block_size)
+
+        # COG output is written to a tiled intermediate and then translated with overviews
+        target_path = output_file_path + '.tmp.tif' if cog else output_file_path
+
+        # Copy block by block so memory stays bounded by one output tile
+        with rasterio.open(target_path, "w", **out_meta) as dest:
+            for _, dst_window in dest.block_windows(1):
+                src_window = Window(
+                    window.col_off + dst_window.col_off,
+                    window.row_off + dst_window.row_off,
+                    dst_window.width,
+                    dst_window.height
+                )
+                dest.write(src.read(bands, window=src_window), window=dst_window)
+
+            for index, band in enumerate(bands, start=1):
+                description = src.descriptions[band - 1]
+                if description:
+                    dest.set_band_description(index, description)
+
+    if cog:
+        try:
+            rasterio.shutil.copy(
+                target_path,
+                output_file_path,
+                driver="COG",
+                compress="DEFLATE",
+                blocksize=block_size,
+                overviews="AUTO",
+                BIGTIFF="IF_SAFER"
+            )
+        finally:
+            if os.path.exists(target_path):
+                os.remove(target_path)
 
     print(f"Region downloaded and saved to {output_file_path}")
 
+class BlockCache:
+    """
+    Thread-safe LRU cache of source blocks for one open dataset.
+
+    Overlapping region windows are assembled from cached blocks, so each
+    source block is read at most once while it stays in the cache.
+    """
+
+    def __init__(self, src, bands, max_bytes=256 * 1024 * 1024):
+        self.src = src
+        self.bands = bands
+        self.block_height, self.block_width = src.block_shapes[0]
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(src.dtypes[bands[0] - 1])
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Dataset handles are not safe for concurrent reads
+        self._io_lock = threading.Lock()
+
+    def _block(self, block_row, block_col):
+        key = (block_row, block_col)
+        with self._lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return self._blocks[key]
+
+        with self._io_lock:
+            with self._lock:
+                if key in self._blocks:
+                    self.hits += 1
+                    return self._blocks[key]
+            window = Window(
+                block_col * self.block_width,
+                block_row * self.block_height,
+                min(self.block_width, self.src.width - block_col * self.block_width),
+                min(self.block_height, self.src.height - block_row * self.block_height)
+            )
+            data = self.src.read(self.bands, window=window)
+
+        with self._lock:
+            self.misses += 1
+            self._blocks[key] = data
+            self._bytes += data.nbytes
+            while self._bytes > self.max_bytes and len(self._blocks) > 1:
+                _, evicted = self._blocks.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return data
+
+    def read(self, window):
+        """Assemble a (bands, rows, cols) array for window from cached blocks"""
+        row_start, col_start = int(window.row_off), int(window.col_off)
+        row_stop, col_stop = row_start + int(window.height), col_start + int(window.width)
+        out = np.empty((len(self.bands), row_stop - row_start, col_stop - col_start), dtype=self.dtype)
+
+        for block_row in range(row_start // self.block_height, (row_stop - 1) // self.block_height + 1):
+            for block_col in range(col_start // self.block_width, (col_stop - 1) // self.block_width + 1):
+                block = self._block(block_row, block_col)
+                top = block_row * self.block_height
+                left = block_col * self.block_width
+                r0, r1 = max(row_start, top), min(row_stop, top + block.shape[1])
+                c0, c1 = max(col_start, left), min(col_stop, left + block.shape[2])
+                out[:, r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = \
+                    block[:, r0 - top:r1 - top, c0 - left:c1 - left]
+        return out
+
+def extract_region_bytes(src, cache, window, bands, block_size=512):
+    """Encode one region as an in-memory tiled GeoTIFF"""
+    out_meta = region_meta(src, window, bands, block_size)
+    data = cache.read(window)
+    with MemoryFile() as memfile:
+        with memfile.open(**out_meta) as dest:
+            dest.write(data)
+        return memfile.read()
+
+def download_regions(tif_file_path, regions, output, bands=None, max_workers=4, block_size=512):
+    """
+    Extract many named regions from one raster into a ZIP of GeoTIFFs.
+
+    regions: list of {"name": ..., "bbox": [minLng, minLat, maxLng, maxLat]}
+    output: path or writable binary stream (e.g. sys.stdout.buffer); the ZIP
+        is written entry by entry as regions finish
+    The source is opened once and blocks shared by overlapping regions are read once.
+    """
+    summary = {'written': [], 'skipped': []}
+    used_names = set()
+
+    with open_raster(tif_file_path) as src:
+        bands = check_bands(src, bands)
+        cache = BlockCache(src, bands)
+
+        jobs = []
+        for index, region in enumerate(regions):
+            name = os.path.basename(str(region.get('name') or f'region_{index + 1}'))
+            while name in used_names:
+                name = f'{name}_{index + 1}'
+            used_names.add(name)
+
+            window = region_window(src, region['bbox'])
+            if window is None:
+                summary['skipped'].append(name)
+                continue
+            jobs.append((name, window))
+
+        # Regions are encoded in parallel; at most 2 * max_workers results are held at once
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive, \
+                ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = deque()
+            for name, window in jobs:
+                pending.append((name, pool.submit(extract_region_bytes, src, cache, window, bands, block_size)))
+                if len(pending) >= 2 * max_workers:
+                    done_name, future = pending.popleft()
+                    archive.writestr(f'{done_name}.tif', future.result())
+                    summary['written'].append(done_name)
+            while pending:
+                done_name, future = pending.popleft()
+                archive.writestr(f'{done_name}.tif', future.result())
+                summary['written'].append(done_name)
+
+    summary['block_reads'] = cache.misses
+    summary['block_cache_hits'] = cache.hits
+    print(f"Wrote {len(summary['written'])} regions "
+          f"({cache.misses} block reads, {cache.hits} cache hits), skipped {len(summary['skipped'])}",
+          file=sys.stderr)
+    return summary
+
 def main():
     parser = argparse.ArgumentParser(description='Download a region from a TIFF file')
     parser.add_argument('--input', type=str, help='Input TIFF file path')
     parser.add_argument('--output', type=str, help='Output TIFF file path')
     parser.add_argument('--bbox', type=str, help='Bounding box (minLng,minLat,maxLng,maxLat)')
+    parser.add_argument('--bands', type=str, help='Comma-separated band numbers to keep (default: all)')
+    parser.add_argument('--resolution', type=float, help='Target pixel size; reads from a matching overview level')
+    parser.add_argument('--cog', action='store_true', help='Write a Cloud Optimized GeoTIFF')
+    parser.add_argument('--regions', type=str, help='JSON file with [{"name": ..., "bbox": [minLng, minLat, maxLng, maxLat]}]; writes a ZIP to --output ("-" for stdout)')
+    parser.add_argument('--workers', type=int, default=4, help='Parallel region encoders for --regions')
     
     args = parser.parse_args()
     
-    if args.input and args.output:
+    if args.input and args.output and args.regions:
+        with open(args.regions) as f:
+            regions = json.load(f)
+        bands = [int(b) for b in args.bands.split(',')] if args.bands else None
+        output = sys.stdout.buffer if args.output == '-' else args.output
+        download_regions(args.input, regions, output, bands, args.workers)
+    elif args.input and args.output:
         bbox = get_bounding_box_from_args(args.bbox) if args.bbox else None
-        download_region(args.input, args.output, bbox)
+        bands = [int(b) for b in args.bands.split(',')] if args.bands else None
+        download_region(args.input, args.output, bbox, bands, args.resolution, args.cog)
     else:
         # Default behavior when run directly
         tif_file_path = r"C:\Users\cmrnn\Downloads\COG_L1B_MIR_04SEP2024_1315.tif"
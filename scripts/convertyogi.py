@@ -1,12 +1,20 @@
-import h5py
 import numpy as np
 from osgeo import gdal, osr
 import cartopy.crs as ccrs
 import os
+import sys
 from scipy import ndimage
 
+# Chunk-aware H5 reads shared with the other converters live in app/scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app', 'scripts'))
+from h5_reader import H5Reader
+from raster_io import configure_gdal
+
+# Same GDAL settings as the apps; mainly speeds up the Warp and COG steps
+configure_gdal()
+
 class B_Level:
-    def _init_(self, h5_file_path):
+    def __init__(self, h5_file_path):
         """
         Initialize with the path to the H5 file
         Parameters specific to INSAT-3DR geostationary satellite
@@ -33,25 +41,28 @@ class B_Level:
         Read data from H5 file and ensure it's 2D
         """
         try:
-            with h5py.File(self.h5_file_path, 'r') as h5_file:
+            with H5Reader(self.h5_file_path) as h5_file:
                 # First, let's print available datasets to help debug
                 print("Available datasets:")
-                h5_file.visit(lambda x: print(x))
+                h5_file.file.visit(lambda x: print(x))
                 
                 if dataset_path not in h5_file:
                     print(f"Dataset path '{dataset_path}' not found in H5 file")
                     return None
                     
-                data = h5_file[dataset_path][...]
+                shape = h5_file.dataset(dataset_path).shape
                 
                 # Print data shape for debugging
-                print(f"Original data shape: {data.shape}")
+                print(f"Original data shape: {shape}")
                 
                 # Ensure data is 2D
-                if len(data.shape) > 2:
-                    # If 3D, take the first band/channel
-                    data = data[0, :, :] if data.shape[0] == 1 else data[:, :, 0]
-                elif len(data.shape) == 1:
+                if len(shape) > 2 and shape[0] != 1:
+                    # Bands last: take the first band/channel
+                    data = h5_file.dataset(dataset_path)[:, :, 0]
+                else:
+                    # Read only the first time step
+                    data = h5_file.read(dataset_path)
+                if len(data.shape) == 1:
                     print(f"Error: Data is 1-dimensional with shape {data.shape}")
                     return None
                     
@@ -290,7 +301,7 @@ class B_Level:
         return success
 
 # Example usage:
-if _name_ == "_main_":
+if __name__ == "__main__":
     # Update with your actual file path
     h5_file = "3RIMG_04SEP2024_1015_L1B_STD_V01R00.h5"
     
@@ -1,5 +1,20 @@
-from osgeo import gdal
+from osgeo import gdal, osr
+import math
 import os
+import sys
+
+# Shared raster I/O (pooled handles, tuned GDAL settings) lives in app/scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app', 'scripts'))
+from raster_io import open_gdal
+
+# Creation options for GDAL's COG driver (tiled, overviews built automatically)
+COG_OPTIONS = [
+    'COMPRESS=DEFLATE',
+    'PREDICTOR=YES',
+    'LEVEL=9',
+    'BLOCKSIZE=512',
+    'BIGTIFF=YES'
+]
 
 def create_cog(input_tiff, output_cog):
     """Convert regular GeoTIFF to Cloud Optimized GeoTIFF"""
@@ -57,6 +72,67 @@ def crop_tiff(input_tiff, output_tiff, min_lon, max_lon, min_lat, max_lat):
                 pass
         raise Exception(f"Error during cropping: {str(e)}")
 
+def is_wgs84(dataset):
+    """Check whether a GDAL dataset is already in EPSG:4326"""
+    srs = dataset.GetSpatialRef()
+    if srs is None:
+        return False
+    wgs84 = osr.SpatialReference()
+    wgs84.ImportFromEPSG(4326)
+    return bool(srs.IsSame(wgs84, ['IGNORE_DATA_AXIS_TO_SRS_AXIS_MAPPING=YES']))
+
+def crop_window(dataset, min_lon, max_lon, min_lat, max_lat):
+    """Pixel window [xoff, yoff, xsize, ysize] covering the bounds, or None for rotated grids"""
+    gt = dataset.GetGeoTransform()
+    if gt[2] != 0 or gt[4] != 0:
+        return None
+
+    x_start = max(0, math.floor((min_lon - gt[0]) / gt[1]))
+    x_stop = min(dataset.RasterXSize, math.ceil((max_lon - gt[0]) / gt[1]))
+    y_start = max(0, math.floor((max_lat - gt[3]) / gt[5]))
+    y_stop = min(dataset.RasterYSize, math.ceil((min_lat - gt[3]) / gt[5]))
+
+    if x_stop <= x_start or y_stop <= y_start:
+        raise Exception("Crop bounds do not overlap the raster")
+    return [x_start, y_start, x_stop - x_start, y_stop - y_start]
+
+def crop_to_cog(input_tiff, output_cog, min_lon, max_lon, min_lat, max_lat):
+    """
+    Crop a GeoTIFF straight to a COG.
+
+    When the source is already EPSG:4326 the pixels are copied through a
+    window (srcWin) with no resampling and no intermediate file; the window
+    snaps outward to whole pixels. Otherwise the source is warped and then
+    converted. Returns 'window' or 'warp' to show which path was taken.
+    """
+    try:
+        with open_gdal(input_tiff) as dataset:
+            src_win = crop_window(dataset, min_lon, max_lon, min_lat, max_lat) if is_wgs84(dataset) else None
+    except IOError:
+        raise Exception(f"Failed to open {input_tiff}")
+
+    if src_win is not None:
+        try:
+            gdal.Translate(output_cog, input_tiff, srcWin=src_win, format='COG', creationOptions=COG_OPTIONS)
+        except Exception as e:
+            if os.path.exists(output_cog):
+                try:
+                    os.remove(output_cog)
+                except:
+                    pass
+            raise Exception(f"Error during cropping: {str(e)}")
+        return 'window'
+
+    # Projection differs: warp to EPSG:4326 first
+    cropped_tiff = os.path.splitext(output_cog)[0] + "_warped.tif"
+    try:
+        crop_tiff(input_tiff, cropped_tiff, min_lon, max_lon, min_lat, max_lat)
+        create_cog(cropped_tiff, output_cog)
+    finally:
+        if os.path.exists(cropped_tiff):
+            os.remove(cropped_tiff)
+    return 'warp'
+
 def main():
     """Main function to process GeoTIFF files"""
     # Get input path (can be directory or file)
@@ -119,17 +195,11 @@ def main():
             
             try:
                 if crop:
-                    # Create cropped version
-                    cropped_tiff = os.path.join(input_dir, f"{base_name}_cropped.tif")
-                    print(f"\nCropping {file}...")
-                    crop_tiff(input_tiff, cropped_tiff, min_lon, max_lon, min_lat, max_lat)
-                    
-                    # Convert to COG
+                    # Crop straight to COG, warping only if the projection differs
                     cog_output = os.path.join(input_dir, f"{base_name}_cropped_cog.tif")
-                    create_cog(cropped_tiff, cog_output)
-                    
-                    # Clean up intermediate file
-                    os.remove(cropped_tiff)
+                    print(f"\nCropping {file}...")
+                    mode = crop_to_cog(input_tiff, cog_output, min_lon, max_lon, min_lat, max_lat)
+                    print(f"Cropped using {mode}")
                 else:
                     # Just convert to COG without cropping
                     cog_output = os.path.join(input_dir, f"{base_name}_cog.tif")
@@ -140,7 +210,7 @@ def main():
             except Exception as e:
                 print(f"Error processing {file}: {str(e)}")
 
-if __name__ == "_main_":
+if __name__ == "__main__":
     # Enable GDAL exceptions
     gdal.UseExceptions()
     try:
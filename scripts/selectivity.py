@@ -2,60 +2,7 @@ from osgeo import gdal
 import os
 import argparse
 
-def create_cog(input_tiff, output_cog):
-    """Convert regular GeoTIFF to Cloud Optimized GeoTIFF"""
-    try:
-        print(f"Converting {os.path.basename(input_tiff)} to COG...")
-        
-        translate_options = gdal.TranslateOptions(
-            format="GTiff",
-            creationOptions=[
-                'COMPRESS=DEFLATE',
-                'PREDICTOR=2',
-                'ZLEVEL=9',
-                'TILED=YES',
-                'BLOCKXSIZE=512',
-                'BLOCKYSIZE=512',
-                'BIGTIFF=YES'
-            ]
-        )
-        
-        gdal.Translate(output_cog, input_tiff, options=translate_options)
-        print("COG creation completed successfully")
-        
-    except Exception as e:
-        if os.path.exists(output_cog):
-            try:
-                os.remove(output_cog)
-            except:
-                pass
-        raise Exception(f"Error creating COG: {str(e)}")
-
-def crop_tiff(input_tiff, output_tiff, min_lon, max_lon, min_lat, max_lat):
-    """Crop GeoTIFF based on lat/lon bounds"""
-    try:
-        gdal.Warp(
-            output_tiff,
-            input_tiff,
-            outputBounds=[min_lon, min_lat, max_lon, max_lat],
-            dstSRS='EPSG:4326',
-            format='GTiff',
-            creationOptions=[
-                'COMPRESS=DEFLATE',
-                'PREDICTOR=2',
-                'ZLEVEL=9',
-                'TILED=YES',
-                'BIGTIFF=YES'
-            ]
-        )
-        
-    except Exception as e:
-        if os.path.exists(output_tiff):
-            try:
-                os.remove(output_tiff)
-            except:
-                pass
-        raise Exception(f"Error during cropping: {str(e)}")
+from rightnow import crop_to_cog
 
 def main():
     parser = argparse.ArgumentParser(description='Process and crop GeoTIFF files')
@@ -86,18 +33,11 @@ def main():
         file = os.path.basename(input_path)
         base_name = os.path.splitext(file)[0]
         
-        # Create cropped version
-        cropped_tiff = os.path.join(input_dir, f"{base_name}_cropped.tif")
-        print(f"\nCropping {file}...")
-        crop_tiff(input_path, cropped_tiff, args.west, args.east, args.south, args.north)
-        
-        # Convert to COG
+        # Crop straight to COG, warping only if the projection differs
         cog_output = os.path.join(input_dir, f"{base_name}_cropped_cog.tif")
-        create_cog(cropped_tiff, cog_output)
-        
-        # Clean up intermediate file
-        os.remove(cropped_tiff)
-        print(f"Successfully processed {file}")
+        print(f"\nCropping {file}...")
+        mode = crop_to_cog(input_path, cog_output, args.west, args.east, args.south, args.north)
+        print(f"Successfully processed {file} ({mode})")
         
     except Exception as e:
         print(f"Error processing {file}: {str(e)}")